@@ -0,0 +1,218 @@
+'''
+cache of bpy install prefixes, shared through a directory
+
+an archive is addressed by the hash of what produced it:
+tag commit, configure flags, python abi and platform.
+
+    ROOT/
+        objects/ab/abcdef....tar.gz
+        objects/ab/abcdef....json
+        tmp/
+
+    python artifact_cache.py /shared/bpy-cache list
+    python artifact_cache.py /shared/bpy-cache gc --size 20G
+'''
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import sysconfig
+import tarfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_SIZE = '50G'
+
+
+def parse_size(src: str) -> int:
+    '''
+    50G => 53687091200
+    '''
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    src = src.strip().upper()
+    if src and src[-1] in units:
+        return int(float(src[:-1]) * units[src[-1]])
+    return int(src)
+
+
+def tag_commit(repository: pathlib.Path, tag: str) -> str:
+    return subprocess.run(['git', 'rev-parse', f'{tag}^{{commit}}'],
+                          cwd=repository,
+                          check=True,
+                          stdout=subprocess.PIPE).stdout.decode().strip()
+
+
+def python_abi() -> str:
+    '''
+    cpython-39-x86_64-linux-gnu, cp39-win_amd64
+    '''
+    return sysconfig.get_config_var('SOABI') or sysconfig.get_config_var(
+        'EXT_SUFFIX') or sys.implementation.cache_tag
+
+
+def cache_key(commit: str, flags: str) -> Tuple[str, Dict[str, str]]:
+    '''
+    flags: the configure flags that change the binary. not paths
+    '''
+    inputs = {
+        'commit': commit,
+        'flags': ' '.join(flags.split()),
+        'python': python_abi(),
+        'platform': sysconfig.get_platform(),
+    }
+    digest = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest(), inputs
+
+
+class ArtifactCache:
+    '''
+    files are written to tmp and renamed into objects.
+    readers never see a partial archive, writers of the same key race harmlessly
+    '''
+    def __init__(self, root: pathlib.Path, max_size: int = parse_size(DEFAULT_SIZE)):
+        self.root = root
+        self.objects = root / 'objects'
+        self.tmp = root / 'tmp'
+        self.max_size = max_size
+
+    def archive(self, key: str) -> pathlib.Path:
+        return self.objects / key[:2] / f'{key}.tar.gz'
+
+    def has(self, key: str) -> bool:
+        return self.archive(key).exists()
+
+    def _temp(self, name: str) -> pathlib.Path:
+        self.tmp.mkdir(parents=True, exist_ok=True)
+        return self.tmp / f'{name}.{os.getpid()}.{time.time_ns()}'
+
+    def get(self, key: str, dst: pathlib.Path) -> bool:
+        '''
+        replace dst with the archive of key
+        '''
+        archive = self.archive(key)
+        try:
+            f = archive.open('rb')
+        except FileNotFoundError:
+            return False
+        start = time.perf_counter()
+        extract = dst.with_name(f'.{dst.name}.{os.getpid()}.tmp')
+        shutil.rmtree(extract, ignore_errors=True)
+        with f, tarfile.open(fileobj=f, mode='r:gz') as tar:
+            if hasattr(tarfile, 'tar_filter'):
+                tar.extractall(extract, filter='tar')
+            else:
+                tar.extractall(extract)
+        shutil.rmtree(dst, ignore_errors=True)
+        os.replace(extract, dst)
+        # mtime is the lru clock, atime is often disabled on shared mounts
+        try:
+            os.utime(archive)
+        except OSError:
+            pass
+        print(
+            f'artifact hit {key[:12]}: {dst} in {time.perf_counter() - start:.1f}s'
+        )
+        return True
+
+    def put(self, key: str, src: pathlib.Path, inputs: Dict[str, Any]) -> pathlib.Path:
+        archive = self.archive(key)
+        archive.parent.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        tmp = self._temp(key)
+        try:
+            with tarfile.open(tmp, 'w:gz', compresslevel=6) as tar:
+                for child in sorted(src.iterdir()):
+                    tar.add(child, arcname=child.name)
+            meta = dict(inputs, key=key, size=tmp.stat().st_size, time=time.time())
+            meta_tmp = self._temp(f'{key}.json')
+            meta_tmp.write_text(json.dumps(meta, indent=2))
+            os.replace(meta_tmp, archive.with_name(f'{key}.json'))
+            os.replace(tmp, archive)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        print(
+            f'artifact put {key[:12]}: {meta["size"] >> 20}MB in {time.perf_counter() - start:.1f}s'
+        )
+        self.gc()
+        return archive
+
+    def entries(self) -> List[Tuple[float, int, pathlib.Path]]:
+        '''
+        (mtime, size, archive), oldest first
+        '''
+        entries = []
+        for archive in self.objects.glob('*/*.tar.gz'):
+            try:
+                st = archive.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, archive))
+        entries.sort()
+        return entries
+
+    def gc(self, max_size: Optional[int] = None) -> int:
+        '''
+        remove the least recently used archives over max_size
+        '''
+        if max_size is None:
+            max_size = self.max_size
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, archive in entries:
+            if total <= max_size:
+                break
+            for path in (archive, archive.with_name(archive.name[:-len('.tar.gz')] + '.json')):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    # another machine evicted it
+                    pass
+            total -= size
+            removed += 1
+        # leftovers of killed writers
+        if self.tmp.exists():
+            for tmp in self.tmp.iterdir():
+                try:
+                    if time.time() - tmp.stat().st_mtime > 24 * 3600:
+                        tmp.unlink()
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser('bpy artifact cache')
+    parser.add_argument('root')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list')
+    gc = sub.add_parser('gc')
+    gc.add_argument('--size', default=DEFAULT_SIZE)
+    parsed = parser.parse_args()
+
+    cache = ArtifactCache(pathlib.Path(parsed.root))
+    if parsed.command == 'list':
+        total = 0
+        for mtime, size, archive in cache.entries():
+            total += size
+            meta_path = archive.with_name(archive.name[:-len('.tar.gz')] + '.json')
+            try:
+                meta = json.loads(meta_path.read_text())
+            except (OSError, ValueError):
+                meta = {}
+            used = time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime))
+            print(
+                f'{archive.name[:12]} {size >> 20:>6}MB {used} {meta.get("commit", "")[:10]} {meta.get("python", "")} {meta.get("platform", "")}'
+            )
+        print(f'{total >> 20}MB')
+    elif parsed.command == 'gc':
+        print(f'removed {cache.gc(parse_size(parsed.size))}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+'''
+index of the datablocks in .blend files without bpy
+
+the file is memory mapped. block headers are walked without reading the data,
+the SDNA is parsed once per distinct DNA1 block and only for the fields used:
+ID.name, ID.lib and the filepath of libraries, images and other external files.
+results are cached in sqlite by path, mtime and size.
+
+    python blend_index.py scan index.db assets/ --jobs 8
+    python blend_index.py show index.db assets/scene.blend
+    python blend_index.py missing index.db
+    python blend_index.py sql index.db "SELECT type, count(*) FROM ids GROUP BY type"
+'''
+import argparse
+import concurrent.futures
+import gzip
+import mmap
+import os
+import pathlib
+import sqlite3
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+# structs with a path to a file outside the .blend
+EXTERNAL = {
+    'Library', 'Image', 'bSound', 'VFont', 'MovieClip', 'CacheFile', 'Volume'
+}
+PATH_FIELDS = ('filepath', 'name')
+# ID.name starts with the id code. linked datablocks are ID_LINK_PLACEHOLDER
+# blocks of struct ID, the code is what tells their type
+ID_CODES = {
+    'SC': 'Scene', 'LI': 'Library', 'OB': 'Object', 'ME': 'Mesh', 'CU': 'Curve',
+    'MB': 'MetaBall', 'MA': 'Material', 'TE': 'Tex', 'IM': 'Image', 'LT': 'Lattice',
+    'LA': 'Light', 'CA': 'Camera', 'IP': 'Ipo', 'KE': 'Key', 'WO': 'World',
+    'SN': 'bScreen', 'VF': 'VFont', 'TX': 'Text', 'SK': 'Speaker', 'SO': 'bSound',
+    'GR': 'Collection', 'AR': 'bArmature', 'AC': 'bAction', 'NT': 'bNodeTree',
+    'BR': 'Brush', 'PA': 'ParticleSettings', 'GD': 'bGPdata', 'WM': 'wmWindowManager',
+    'MC': 'MovieClip', 'MS': 'Mask', 'LS': 'FreestyleLineStyle', 'PL': 'Palette',
+    'PC': 'PaintCurve', 'CF': 'CacheFile', 'WS': 'WorkSpace', 'LP': 'LightProbe',
+    'CV': 'Curves', 'PT': 'PointCloud', 'VO': 'Volume', 'GP': 'GreasePencil',
+    'AN': 'Animation'
+}
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files(path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, version TEXT, error TEXT);
+CREATE TABLE IF NOT EXISTS ids(path TEXT, type TEXT, name TEXT, library TEXT, filepath TEXT);
+CREATE INDEX IF NOT EXISTS ids_path ON ids(path);
+CREATE INDEX IF NOT EXISTS ids_type ON ids(type);
+CREATE INDEX IF NOT EXISTS ids_filepath ON ids(filepath);
+'''
+
+
+class Header(NamedTuple):
+    pointer_size: int
+    endian: str
+    version: str
+    # offset of the first block header
+    size: int
+    # file format 1 (blender 5.0) has 64 bit lengths in the block headers
+    large: bool
+
+
+class BHead(NamedTuple):
+    code: bytes
+    length: int
+    old: int
+    sdna: int
+    count: int
+    # offset of the data
+    offset: int
+
+
+def parse_header(data) -> Header:
+    '''
+    BLENDER-v293: pointer size, endianness, version
+    BLENDER17-01v0500: header size, file format, endianness, version
+    '''
+    if data[:7] != b'BLENDER':
+        raise ValueError('not a .blend file')
+    if data[7:9].isdigit():
+        size = int(data[7:9])
+        fmt = int(data[10:12])
+        endian = '<' if data[12:13] == b'v' else '>'
+        return Header(8, endian, data[13:size].decode('ascii'), size, fmt >= 1)
+    pointer_size = 8 if data[7:8] == b'-' else 4
+    endian = '<' if data[8:9] == b'v' else '>'
+    return Header(pointer_size, endian, data[9:12].decode('ascii'), 12, False)
+
+
+def iter_blocks(data, header: Header) -> Iterator[BHead]:
+    e = header.endian
+    if header.large:
+        # code, sdna, old, length, count
+        layout = struct.Struct(f'{e}4siQqq')
+    elif header.pointer_size == 8:
+        layout = struct.Struct(f'{e}4siQii')
+    else:
+        layout = struct.Struct(f'{e}4siIii')
+    offset = header.size
+    end = len(data)
+    while offset + layout.size <= end:
+        if header.large:
+            code, sdna, old, length, count = layout.unpack_from(data, offset)
+        else:
+            code, length, old, sdna, count = layout.unpack_from(data, offset)
+        offset += layout.size
+        if code == b'ENDB':
+            return
+        yield BHead(code, length, old, sdna, count, offset)
+        offset += length
+
+
+class SDNA:
+    '''
+    names, types and struct fields of a DNA1 block
+    '''
+    def __init__(self, data, offset: int, endian: str, pointer_size: int):
+        self.pointer_size = pointer_size
+        view = memoryview(data)
+        pos = offset
+
+        def expect(tag: bytes):
+            nonlocal pos
+            if bytes(view[pos:pos + 4]) != tag:
+                raise ValueError(f'SDNA: {tag!r} expected')
+            pos += 4
+
+        def strings() -> List[str]:
+            nonlocal pos
+            (count, ) = struct.unpack_from(f'{endian}i', data, pos)
+            pos += 4
+            result = []
+            for _ in range(count):
+                end = data.find(b'\0', pos)
+                result.append(bytes(view[pos:end]).decode('ascii', 'replace'))
+                pos = end + 1
+            pos = (pos + 3) & ~3
+            return result
+
+        expect(b'SDNA')
+        expect(b'NAME')
+        self.names = strings()
+        expect(b'TYPE')
+        self.types = strings()
+        expect(b'TLEN')
+        self.lengths = struct.unpack_from(f'{endian}{len(self.types)}h', data,
+                                          pos)
+        pos = (pos + 2 * len(self.types) + 3) & ~3
+        expect(b'STRC')
+        (count, ) = struct.unpack_from(f'{endian}i', data, pos)
+        pos += 4
+        # struct index => (type index, offset of the field list, field count)
+        self.structs: List[Tuple[int, int, int]] = []
+        for _ in range(count):
+            type_index, fields = struct.unpack_from(f'{endian}hh', data, pos)
+            self.structs.append((type_index, pos + 4, fields))
+            pos += 4 + fields * 4
+        self.data = data
+        self.endian = endian
+        self.struct_by_name = {
+            self.types[t]: i
+            for i, (t, _, _) in enumerate(self.structs)
+        }
+        self._fields: Dict[str, Dict[str, Tuple[int, int]]] = {}
+
+    def struct_name(self, index: int) -> str:
+        return self.types[self.structs[index][0]]
+
+    def field_size(self, type_index: int, name: str) -> Tuple[str, int]:
+        '''
+        *next => ptr, name[66] => 66 * char
+        '''
+        base = name.split('[', 1)[0]
+        count = 1
+        for dim in name.split('[')[1:]:
+            count *= int(dim.rstrip(']'))
+        if base.startswith('*') or base.startswith('(*'):
+            size = self.pointer_size
+        else:
+            size = self.lengths[type_index]
+        return base.lstrip('*').strip('()*'), size * count
+
+    def fields(self, struct_name: str) -> Dict[str, Tuple[int, int]]:
+        '''
+        field => (offset, size). dna structs have no implicit padding
+        '''
+        if struct_name in self._fields:
+            return self._fields[struct_name]
+        _type, pos, count = self.structs[self.struct_by_name[struct_name]]
+        values = struct.unpack_from(f'{self.endian}{count * 2}h', self.data,
+                                    pos)
+        result = {}
+        offset = 0
+        for i in range(count):
+            name, size = self.field_size(values[i * 2],
+                                         self.names[values[i * 2 + 1]])
+            result[name] = (offset, size)
+            offset += size
+        self._fields[struct_name] = result
+        return result
+
+
+# DNA1 block => SDNA. files of one blender version share it
+_sdna_cache: Dict[Tuple[int, bytes], SDNA] = {}
+
+
+def load_sdna(data, block: BHead, header: Header) -> SDNA:
+    raw = bytes(data[block.offset:block.offset + block.length])
+    key = (hash(raw), header.endian.encode() + bytes([header.pointer_size]))
+    sdna = _sdna_cache.get(key)
+    if not sdna:
+        sdna = SDNA(raw, 0, header.endian, header.pointer_size)
+        _sdna_cache[key] = sdna
+    return sdna
+
+
+def read_string(data, offset: int, size: int) -> str:
+    raw = bytes(data[offset:offset + size])
+    return raw.split(b'\0', 1)[0].decode('utf-8', 'replace')
+
+
+def read_pointer(data, offset: int, header: Header) -> int:
+    fmt = 'Q' if header.pointer_size == 8 else 'I'
+    return struct.unpack_from(f'{header.endian}{fmt}', data, offset)[0]
+
+
+def open_blend(path: pathlib.Path):
+    '''
+    mmap of a plain file. compressed files are read into memory
+    '''
+    with path.open('rb') as f:
+        magic = f.read(4)
+        if magic[:2] == GZIP_MAGIC:
+            f.seek(0)
+            return gzip.GzipFile(fileobj=f).read()
+        if magic == ZSTD_MAGIC:
+            f.seek(0)
+            try:
+                from compression import zstd  # type: ignore
+                return zstd.decompress(f.read())
+            except ImportError:
+                import zstandard  # type: ignore
+                # blender writes many frames and a seek table
+                with zstandard.ZstdDecompressor().stream_reader(
+                        f, read_across_frames=True) as reader:
+                    return reader.readall()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class IdRecord(NamedTuple):
+    type: str
+    name: str
+    library: str
+    filepath: str
+
+
+def read_ids(path: pathlib.Path) -> Tuple[str, List[IdRecord]]:
+    '''
+    (version, datablocks)
+    '''
+    data = open_blend(path)
+    try:
+        header = parse_header(data[:17])
+        ids = []
+        dna = None
+        for block in iter_blocks(data, header):
+            if block.code == b'DNA1':
+                dna = block
+            elif block.code[2:] == b'\0\0':
+                ids.append(block)
+        if not dna:
+            raise ValueError('no DNA1 block')
+        sdna = load_sdna(data, dna, header)
+        id_fields = sdna.fields('ID')
+        name_offset, name_size = id_fields['name']
+        lib_offset = id_fields['lib'][0]
+
+        # old pointer => library filepath
+        libraries: Dict[int, str] = {}
+        blocks = []
+        for block in ids:
+            struct_name = sdna.struct_name(block.sdna)
+            code_name = read_string(data, block.offset + name_offset, name_size)
+            name = code_name[2:]
+            filepath = ''
+            if struct_name in EXTERNAL:
+                fields = sdna.fields(struct_name)
+                for field in PATH_FIELDS:
+                    if field in fields and fields[field][1] > 66:
+                        offset, size = fields[field]
+                        filepath = read_string(data, block.offset + offset,
+                                               size)
+                        break
+            if struct_name == 'Library':
+                libraries[block.old] = filepath
+            lib = read_pointer(data, block.offset + lib_offset, header)
+            type_name = struct_name
+            if struct_name == 'ID':
+                type_name = ID_CODES.get(code_name[:2], code_name[:2])
+            blocks.append((type_name, name, lib, filepath))
+        records = [
+            IdRecord(t, n, libraries.get(lib, '') if lib else '', f)
+            for t, n, lib, f in blocks
+        ]
+        return header.version, records
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def scan_file(path: str) -> Tuple[str, str, List[IdRecord], str]:
+    '''
+    pool worker. (path, version, records, error)
+    '''
+    try:
+        version, records = read_ids(pathlib.Path(path))
+        return path, version, records, ''
+    except Exception as ex:
+        return path, '', [], f'{type(ex).__name__}: {ex}'
+
+
+def find_blends(paths: List[pathlib.Path]) -> Iterator[pathlib.Path]:
+    for path in paths:
+        if path.is_dir():
+            for root, _dirs, files in os.walk(path):
+                for name in files:
+                    if name.endswith('.blend'):
+                        yield pathlib.Path(root, name).absolute()
+        else:
+            yield path.absolute()
+
+
+def scan(db: sqlite3.Connection, paths: List[pathlib.Path],
+         jobs: int) -> Tuple[int, int]:
+    '''
+    (parsed, cached). files whose mtime and size are unchanged are skipped
+    '''
+    db.executescript(SCHEMA)
+    cached = {
+        path: (mtime, size)
+        for path, mtime, size in db.execute(
+            'SELECT path, mtime, size FROM files')
+    }
+    todo = []
+    stats: Dict[str, Tuple[int, int]] = {}
+    hits = 0
+    for path in find_blends(paths):
+        st = path.stat()
+        key = (st.st_mtime_ns, st.st_size)
+        if cached.pop(str(path), None) == key:
+            hits += 1
+            continue
+        stats[str(path)] = key
+        todo.append(str(path))
+
+    def store(path: str, version: str, records: List[IdRecord], error: str):
+        mtime, size = stats[path]
+        db.execute('DELETE FROM ids WHERE path = ?', (path, ))
+        db.execute('INSERT OR REPLACE INTO files VALUES(?, ?, ?, ?, ?)',
+                   (path, mtime, size, version, error))
+        db.executemany('INSERT INTO ids VALUES(?, ?, ?, ?, ?)',
+                       [(path, ) + tuple(r) for r in records])
+        if error:
+            print(f'{path}: {error}', file=sys.stderr)
+
+    if jobs > 1 and len(todo) > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            # workers of one blender version reuse the SDNA
+            chunksize = max(1, len(todo) // (jobs * 4))
+            for result in executor.map(scan_file, todo, chunksize=chunksize):
+                store(*result)
+    else:
+        for path in todo:
+            store(*scan_file(path))
+    # deleted files
+    for path in cached:
+        if not os.path.exists(path):
+            db.execute('DELETE FROM ids WHERE path = ?', (path, ))
+            db.execute('DELETE FROM files WHERE path = ?', (path, ))
+    db.commit()
+    return len(todo), hits
+
+
+def resolve(blend: str, filepath: str) -> pathlib.Path:
+    '''
+    // is relative to the .blend
+    '''
+    if filepath.startswith('//'):
+        return pathlib.Path(blend).parent / filepath[2:].replace('\\', '/')
+    return pathlib.Path(filepath)
+
+
+def main():
+    parser = argparse.ArgumentParser('index .blend files without bpy')
+    sub = parser.add_subparsers(dest='command', required=True)
+    scan_parser = sub.add_parser('scan')
+    scan_parser.add_argument('db')
+    scan_parser.add_argument('paths', nargs='+')
+    scan_parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    show = sub.add_parser('show')
+    show.add_argument('db')
+    show.add_argument('blend')
+    missing = sub.add_parser('missing')
+    missing.add_argument('db')
+    sql = sub.add_parser('sql')
+    sql.add_argument('db')
+    sql.add_argument('query')
+    parsed = parser.parse_args()
+
+    db = sqlite3.connect(parsed.db)
+    if parsed.command == 'scan':
+        start = time.perf_counter()
+        parsed_count, hits = scan(db,
+                                  [pathlib.Path(p) for p in parsed.paths],
+                                  parsed.jobs)
+        print(
+            f'{parsed_count} parsed, {hits} cached in {time.perf_counter() - start:.2f}s'
+        )
+    elif parsed.command == 'show':
+        path = str(pathlib.Path(parsed.blend).absolute())
+        for row in db.execute(
+                'SELECT type, name, library, filepath FROM ids WHERE path = ? ORDER BY type, name',
+            (path, )):
+            print('\t'.join(row))
+    elif parsed.command == 'missing':
+        for blend, type_name, name, filepath in db.execute(
+                "SELECT path, type, name, filepath FROM ids WHERE filepath != ''"):
+            if not resolve(blend, filepath).exists():
+                print(f'{blend}\t{type_name}\t{name}\t{filepath}')
+    elif parsed.command == 'sql':
+        for row in db.execute(parsed.query):
+            print('\t'.join('' if v is None else str(v) for v in row))
+
+
+if __name__ == '__main__':
+    main()
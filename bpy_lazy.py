@@ -0,0 +1,209 @@
+'''
+import bpy without initializing blender until it is used
+
+PyInit_bpy loads the whole of blender (see docs/bpy/source.md).
+opt-in: install() puts a proxy module at sys.modules['bpy'] and the real
+import runs on the first attribute access. a plain `import bpy` without
+install() is the eager import as before. `--help`, argument errors and modules that
+only reference bpy in functions do not pay for it.
+mathutils, bmesh, bpy_extras... exist after the initialization, importing
+them initializes bpy too.
+
+    import bpy_lazy
+    bpy_lazy.install()
+    import bpy  # the proxy
+
+    # pool workers initialize before the first job
+    ProcessPoolExecutor(initializer=bpy_lazy.preload)
+
+    # startup of the tools with and without the proxy. BPY_LAZY=0 disables it
+    python bpy_lazy.py
+    python bpy_lazy.py -- render_server.py --help
+'''
+import argparse
+import importlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import types
+from typing import List, Optional
+
+HERE = pathlib.Path(__file__).absolute().parent
+# modules that exist or are on sys.path once bpy is initialized
+DEPENDENTS = {
+    'bpy', 'mathutils', 'bmesh', 'bpy_extras', 'bpy_types', 'bgl', 'blf',
+    'gpu', 'gpu_extras', 'aud', 'freestyle', 'idprop', 'imbuf', 'bl_math',
+    'rna_info', 'rna_prop_ui', 'addon_utils', 'keyingsets_utils', 'nodeitems_utils'
+}
+# tools that install the proxy, whose startup is compared.
+# render.py imports bpy inside its functions and does not need it
+TOOLS = [
+    ['-c', 'import bpy_lazy; bpy_lazy.install(); import bpy'],
+    ['render_server.py', '--help'],
+    ['render_server.py', '--port', 'bad'],
+]
+
+_lock = threading.RLock()
+_real: Optional[types.ModuleType] = None
+_loading = False
+
+
+class LazyModule(types.ModuleType):
+    '''
+    the first attribute lookup that misses imports the real bpy
+    and copies its namespace into the proxy
+    '''
+    def __getattr__(self, name: str):
+        # introspection of the proxy does not initialize blender
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError(name)
+        return getattr(load(), name)
+
+    def __dir__(self):
+        return dir(load())
+
+
+class _Existing(importlib.abc.Loader):
+    def __init__(self, module: types.ModuleType):
+        self.module = module
+
+    def create_module(self, spec):
+        return self.module
+
+    def exec_module(self, module):
+        pass
+
+
+class _DependentFinder(importlib.abc.MetaPathFinder):
+    '''
+    last in sys.meta_path. a module from DEPENDENTS that nothing else found
+    initializes bpy and is looked up again
+    '''
+    def find_spec(self, name, path, target=None):
+        if _real or _loading or name.split('.')[0] not in DEPENDENTS:
+            return None
+        real = load()
+        module = sys.modules.get(name)
+        if module is None and name.startswith('bpy.'):
+            # bpy.types, bpy.ops... are attributes of the extension
+            module = real
+            for part in name.split('.')[1:]:
+                module = getattr(module, part, None)
+            if not isinstance(module, types.ModuleType):
+                module = None
+        if module is not None:
+            return importlib.util.spec_from_loader(name, _Existing(module))
+        if name.startswith('bpy.'):
+            path = getattr(real, '__path__', None)
+        # bpy_extras and others, the scripts directories are on sys.path now
+        return importlib.machinery.PathFinder.find_spec(name, path)
+
+
+def load() -> types.ModuleType:
+    '''
+    import and initialize the real bpy
+    '''
+    global _real, _loading
+    with _lock:
+        if _real:
+            return _real
+        proxy = sys.modules.get('bpy')
+        if isinstance(proxy, LazyModule):
+            del sys.modules['bpy']
+        else:
+            proxy = None
+        _loading = True
+        try:
+            start = time.perf_counter()
+            real = importlib.import_module('bpy')
+            if os.environ.get('BPY_LAZY_VERBOSE'):
+                print(f'bpy initialized in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+        except BaseException:
+            if proxy:
+                sys.modules['bpy'] = proxy
+            raise
+        finally:
+            _loading = False
+        if proxy:
+            # references to the proxy keep working without __getattr__
+            proxy.__dict__.update(real.__dict__)
+        _real = real
+        return real
+
+
+def install() -> types.ModuleType:
+    '''
+    import bpy returns the proxy from now on. BPY_LAZY=0 imports bpy here
+    '''
+    if os.environ.get('BPY_LAZY') == '0':
+        return load()
+    with _lock:
+        module = sys.modules.get('bpy')
+        if module:
+            return module
+        proxy = LazyModule('bpy')
+        # a package, so import bpy.types asks the finders
+        proxy.__path__ = []  # type: ignore
+        sys.modules['bpy'] = proxy
+        if not any(isinstance(f, _DependentFinder) for f in sys.meta_path):
+            sys.meta_path.append(_DependentFinder())
+        return proxy
+
+
+def is_loaded() -> bool:
+    return _real is not None
+
+
+def preload() -> types.ModuleType:
+    '''
+    initialize now. for pool initializers and servers after argument parsing
+    '''
+    return load()
+
+
+def startup(cmd: List[str], lazy: bool, repeat: int) -> float:
+    '''
+    median seconds of running cmd with python
+    '''
+    env = dict(os.environ, BPY_LAZY='1' if lazy else '0')
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + cmd,
+                       cwd=HERE,
+                       env=env,
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def benchmark(tools: List[List[str]], repeat: int):
+    print(f'{"command":<36}{"eager s":>10}{"lazy s":>10}{"saved s":>10}')
+    for cmd in tools:
+        eager = startup(cmd, False, repeat)
+        lazy = startup(cmd, True, repeat)
+        print(f'{" ".join(cmd):<36}{eager:>10.3f}{lazy:>10.3f}{eager - lazy:>10.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser('startup with the lazy bpy proxy')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('cmd',
+                        nargs=argparse.REMAINDER,
+                        help='-- SCRIPT ARGS. default: the tools of this repository')
+    parsed = parser.parse_args()
+
+    cmd = parsed.cmd[1:] if parsed.cmd[:1] == ['--'] else parsed.cmd
+    benchmark([cmd] if cmd else TOOLS, parsed.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+'''
+bulk access to bpy data with numpy
+
+installed next to the bpy module.
+foreach_get/foreach_set copy whole collections without a python object per element.
+
+    import bpy_numpy
+    co = bpy_numpy.get_vertices(mesh)
+    co[:, 2] += 1
+    bpy_numpy.set_vertices(mesh, co)
+
+    # benchmark against per element loops
+    python bpy_numpy.py
+'''
+import time
+
+import numpy
+
+# attribute data_type: (property, dtype, width)
+ATTRIBUTE_TYPES = {
+    'FLOAT': ('value', numpy.float32, 1),
+    'INT': ('value', numpy.int32, 1),
+    'INT8': ('value', numpy.int32, 1),
+    'BOOLEAN': ('value', numpy.bool_, 1),
+    'FLOAT2': ('vector', numpy.float32, 2),
+    'INT32_2D': ('value', numpy.int32, 2),
+    'FLOAT_VECTOR': ('vector', numpy.float32, 3),
+    'FLOAT_COLOR': ('color', numpy.float32, 4),
+    'BYTE_COLOR': ('color', numpy.float32, 4),
+    'QUATERNION': ('value', numpy.float32, 4),
+}
+
+
+def _buffer(out, count, width, dtype):
+    shape = (count, width) if width > 1 else (count, )
+    if out is None or out.shape != shape or out.dtype != dtype:
+        return numpy.empty(shape, dtype=dtype)
+    return out
+
+
+def foreach_get(collection, attr, dtype, width=1, out=None):
+    '''
+    Read attr of every item of a bpy_prop_collection.
+    The array has shape (len(collection), width). out is reused when the shape and dtype match.
+
+    :type collection: bpy.types.bpy_prop_collection
+    :type attr: str
+    :type dtype: Any
+    :type width: int, optional
+    :type out: numpy.ndarray, optional
+    :rtype: numpy.ndarray
+    '''
+    out = _buffer(out, len(collection), width, dtype)
+    collection.foreach_get(attr, out.reshape(-1))
+    return out
+
+
+def foreach_set(collection, attr, values):
+    '''
+    Write attr of every item of a bpy_prop_collection.
+
+    :type collection: bpy.types.bpy_prop_collection
+    :type attr: str
+    :type values: numpy.ndarray
+    '''
+    collection.foreach_set(attr, numpy.ascontiguousarray(values).reshape(-1))
+
+
+def get_vertices(mesh, out=None):
+    '''
+    Vertex positions with shape (vertices, 3).
+
+    :type mesh: bpy.types.Mesh
+    :type out: numpy.ndarray, optional
+    :rtype: numpy.ndarray
+    '''
+    return foreach_get(mesh.vertices, 'co', numpy.float32, 3, out)
+
+
+def set_vertices(mesh, co):
+    '''
+    Write vertex positions and update the mesh.
+
+    :type mesh: bpy.types.Mesh
+    :type co: numpy.ndarray
+    '''
+    foreach_set(mesh.vertices, 'co', co.astype(numpy.float32, copy=False))
+    mesh.update()
+
+
+def get_normals(mesh, out=None):
+    '''
+    Vertex normals with shape (vertices, 3).
+
+    :type mesh: bpy.types.Mesh
+    :type out: numpy.ndarray, optional
+    :rtype: numpy.ndarray
+    '''
+    if hasattr(mesh, 'vertex_normals'):
+        # 3.5 or later
+        return foreach_get(mesh.vertex_normals, 'vector', numpy.float32, 3, out)
+    return foreach_get(mesh.vertices, 'normal', numpy.float32, 3, out)
+
+
+def get_loop_vertices(mesh, out=None):
+    '''
+    Vertex index of each face corner with shape (loops, ).
+
+    :type mesh: bpy.types.Mesh
+    :type out: numpy.ndarray, optional
+    :rtype: numpy.ndarray
+    '''
+    return foreach_get(mesh.loops, 'vertex_index', numpy.int32, 1, out)
+
+
+def get_loop_normals(mesh, out=None):
+    '''
+    Face corner normals with shape (loops, 3). Split normals before 4.1.
+
+    :type mesh: bpy.types.Mesh
+    :type out: numpy.ndarray, optional
+    :rtype: numpy.ndarray
+    '''
+    if hasattr(mesh, 'calc_normals_split'):
+        mesh.calc_normals_split()
+    return foreach_get(mesh.loops, 'normal', numpy.float32, 3, out)
+
+
+def get_polygons(mesh):
+    '''
+    loop_start and loop_total of each face.
+
+    :type mesh: bpy.types.Mesh
+    :rtype: Tuple[numpy.ndarray, numpy.ndarray]
+    '''
+    return (foreach_get(mesh.polygons, 'loop_start', numpy.int32),
+            foreach_get(mesh.polygons, 'loop_total', numpy.int32))
+
+
+def get_triangles(mesh, out=None):
+    '''
+    Vertex indices of the loop triangles with shape (triangles, 3).
+
+    :type mesh: bpy.types.Mesh
+    :type out: numpy.ndarray, optional
+    :rtype: numpy.ndarray
+    '''
+    mesh.calc_loop_triangles()
+    return foreach_get(mesh.loop_triangles, 'vertices', numpy.int32, 3, out)
+
+
+def get_uvs(mesh, layer='', out=None):
+    '''
+    Face corner uvs with shape (loops, 2). The active layer if layer is empty.
+
+    :type mesh: bpy.types.Mesh
+    :type layer: str, optional
+    :type out: numpy.ndarray, optional
+    :rtype: numpy.ndarray
+    '''
+    uv_layer = mesh.uv_layers[layer] if layer else mesh.uv_layers.active
+    return foreach_get(uv_layer.data, 'uv', numpy.float32, 2, out)
+
+
+def set_uvs(mesh, uvs, layer=''):
+    '''
+    Write face corner uvs. The active layer if layer is empty.
+
+    :type mesh: bpy.types.Mesh
+    :type uvs: numpy.ndarray
+    :type layer: str, optional
+    '''
+    uv_layer = mesh.uv_layers[layer] if layer else mesh.uv_layers.active
+    foreach_set(uv_layer.data, 'uv', uvs.astype(numpy.float32, copy=False))
+
+
+def get_attribute(mesh, name, out=None):
+    '''
+    Generic attribute with shape (domain size, width).
+
+    :type mesh: bpy.types.Mesh
+    :type name: str
+    :type out: numpy.ndarray, optional
+    :rtype: numpy.ndarray
+    '''
+    attribute = mesh.attributes[name]
+    prop, dtype, width = ATTRIBUTE_TYPES[attribute.data_type]
+    return foreach_get(attribute.data, prop, dtype, width, out)
+
+
+def set_attribute(mesh, name, values):
+    '''
+    Write a generic attribute.
+
+    :type mesh: bpy.types.Mesh
+    :type name: str
+    :type values: numpy.ndarray
+    '''
+    attribute = mesh.attributes[name]
+    prop, dtype, _width = ATTRIBUTE_TYPES[attribute.data_type]
+    foreach_set(attribute.data, prop, values.astype(dtype, copy=False))
+
+
+def get_matrices(objects, attr='matrix_world', out=None):
+    '''
+    Object matrices with shape (objects, 4, 4). Rows like mathutils.Matrix.
+
+    :type objects: bpy.types.bpy_prop_collection
+    :type attr: str, optional
+    :type out: numpy.ndarray, optional
+    :rtype: numpy.ndarray
+    '''
+    flat = foreach_get(objects, attr, numpy.float32, 16)
+    # foreach_get is column major
+    matrices = flat.reshape(-1, 4, 4).transpose(0, 2, 1)
+    if out is not None and out.shape == matrices.shape and out.dtype == matrices.dtype:
+        out[...] = matrices
+        return out
+    return numpy.ascontiguousarray(matrices)
+
+
+def set_matrices(objects, matrices, attr='matrix_world'):
+    '''
+    Write object matrices with shape (objects, 4, 4).
+
+    :type objects: bpy.types.bpy_prop_collection
+    :type matrices: numpy.ndarray
+    :type attr: str, optional
+    '''
+    foreach_set(objects, attr, matrices.astype(numpy.float32).transpose(0, 2, 1))
+
+
+def benchmark(size=300):
+    import bpy
+    import mathutils
+
+    bpy.ops.mesh.primitive_grid_add(x_subdivisions=size, y_subdivisions=size)
+    mesh = bpy.context.object.data
+    print(f'{len(mesh.vertices)} vertices, {len(mesh.loops)} loops')
+
+    def measure(name, loop, bulk):
+        start = time.perf_counter()
+        loop()
+        loop_time = time.perf_counter() - start
+        start = time.perf_counter()
+        bulk()
+        bulk_time = time.perf_counter() - start
+        print(
+            f'{name:<16}{loop_time:>10.4f}{bulk_time:>10.4f}{loop_time / bulk_time:>10.1f}x'
+        )
+
+    print(f'{"":<16}{"loop":>10}{"numpy":>10}')
+    co = get_vertices(mesh)
+    measure('read vertices', lambda: [v.co.copy() for v in mesh.vertices],
+            lambda: get_vertices(mesh, co))
+
+    def write_loop():
+        for v, c in zip(mesh.vertices, co):
+            v.co = c
+
+    measure('write vertices', write_loop, lambda: set_vertices(mesh, co))
+    measure('read normals', lambda: [v.normal.copy() for v in mesh.vertices],
+            lambda: get_normals(mesh))
+    measure('read loops', lambda: [l.vertex_index for l in mesh.loops],
+            lambda: get_loop_vertices(mesh))
+    measure('read uvs', lambda: [d.uv.copy() for d in mesh.uv_layers.active.data],
+            lambda: get_uvs(mesh))
+
+    for i in range(1000):
+        o = bpy.data.objects.new(f'empty{i}', None)
+        o.matrix_world = mathutils.Matrix.Translation((i, 0, 0))
+        bpy.context.scene.collection.objects.link(o)
+    bpy.context.view_layer.update()
+    objects = bpy.data.objects
+    measure('read matrices', lambda: [o.matrix_world.copy() for o in objects],
+            lambda: get_matrices(objects))
+
+
+if __name__ == '__main__':
+    benchmark()
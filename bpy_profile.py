@@ -0,0 +1,256 @@
+'''
+operator level profiler for scripts using bpy
+
+enable() replaces __call__ of the bpy.ops operator class, the class of
+bpy.ops.SUBMOD.OP that stub_generator walks under BPyOps/BPyOpsSubMod.
+disable() puts the original back, nothing is left in the call path.
+optionally a thread samples the python stack of the main thread.
+
+    python bpy_profile.py render.py -- scene.blend -o out/####.png
+    python bpy_profile.py --sample 0.005 --folded ops.folded script.py
+    flamegraph.pl ops.folded > ops.svg
+
+    # render.py workers and other scripts that call enable_from_env()
+    BPY_PROFILE=ops.folded BPY_PROFILE_SAMPLE=0.005 python render.py ...
+'''
+import argparse
+import atexit
+import collections
+import multiprocessing
+import multiprocessing.util
+import os
+import runpy
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# frames of this module are left out of the stacks
+_THIS = __file__
+
+
+class OpStat:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class OpKey(NamedTuple):
+    idname: str
+    # context.mode, the area type of an override or EXEC/INVOKE
+    mode: str
+    context: str
+
+
+class Profiler:
+    def __init__(self, sample_interval: float = 0.0):
+        self.sample_interval = sample_interval
+        self.stats: Dict[OpKey, OpStat] = collections.defaultdict(OpStat)
+        # caller stack;bpy.ops.X => microseconds
+        self.op_stacks: Dict[str, float] = collections.Counter()
+        # sampled stack => count
+        self.samples: Dict[str, int] = collections.Counter()
+        # operators running on the main thread, innermost last
+        self.running: List[str] = []
+        self.op_class: Optional[type] = None
+        self.original: Optional[Callable[..., Any]] = None
+        self.sampler: Optional[threading.Thread] = None
+        self.stop = threading.Event()
+        self.main_thread = threading.main_thread().ident
+
+    def enable(self):
+        import bpy
+        # any operator instance, the class name changed between versions
+        self.op_class = type(bpy.ops.wm.read_factory_settings)
+        self.original = self.op_class.__call__
+        profiler = self
+        original = self.original
+
+        def __call__(op, *args, **kw):
+            idname = op.idname_py()
+            key = OpKey(idname, _mode(), _context_of(args))
+            profiler.running.append(idname)
+            start = time.perf_counter()
+            try:
+                return original(op, *args, **kw)
+            finally:
+                elapsed = time.perf_counter() - start
+                profiler.running.pop()
+                stat = profiler.stats[key]
+                stat.count += 1
+                stat.total += elapsed
+                if elapsed > stat.max:
+                    stat.max = elapsed
+                stack = _folded(sys._getframe(1))
+                profiler.op_stacks[f'{stack};bpy.ops.{idname}'
+                                   if stack else f'bpy.ops.{idname}'] += elapsed * 1e6
+
+        self.op_class.__call__ = __call__  # type: ignore
+        if self.sample_interval > 0:
+            self.stop.clear()
+            self.sampler = threading.Thread(target=self._sample,
+                                            name='bpy_profile',
+                                            daemon=True)
+            self.sampler.start()
+
+    def disable(self):
+        if self.op_class and self.original:
+            self.op_class.__call__ = self.original  # type: ignore
+        self.op_class = None
+        self.original = None
+        if self.sampler:
+            self.stop.set()
+            self.sampler.join()
+            self.sampler = None
+
+    def _sample(self):
+        while not self.stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(self.main_thread)
+            if frame is None:
+                continue
+            stack = _folded(frame)
+            # the operator the main thread is inside, C code has no frames
+            if self.running:
+                stack += ';' + ';'.join(f'bpy.ops.{op}' for op in self.running)
+            self.samples[stack] += 1
+
+    def report(self, top: int = 20, file=None):
+        file = file or sys.stdout
+        rows = sorted(self.stats.items(), key=lambda kv: kv[1].total,
+                      reverse=True)
+        total = sum(stat.total for stat in self.stats.values())
+        print(
+            f'{"operator":<40}{"mode":<14}{"context":<16}{"calls":>7}{"total ms":>11}{"mean ms":>10}{"max ms":>10}',
+            file=file)
+        for key, stat in rows[:top]:
+            print(
+                f'{key.idname:<40}{key.mode:<14}{key.context:<16}{stat.count:>7}{stat.total * 1000:>11.1f}{stat.total / stat.count * 1000:>10.2f}{stat.max * 1000:>10.1f}',
+                file=file)
+        print(f'{len(rows)} operators, {total * 1000:.1f}ms', file=file)
+        if self.samples:
+            print(f'{sum(self.samples.values())} samples', file=file)
+
+    def write_folded(self, path: str):
+        '''
+        flamegraph.pl input. samples if sampled, otherwise operator microseconds
+        '''
+        stacks = self.samples or self.op_stacks
+        with open(path, 'w') as w:
+            for stack, value in sorted(stacks.items()):
+                w.write(f'{stack} {int(value)}\n')
+
+
+def _mode() -> str:
+    import bpy
+    try:
+        return bpy.context.mode
+    except AttributeError:
+        return ''
+
+
+def _context_of(args: Tuple[Any, ...]) -> str:
+    '''
+    ops take an optional override dict and an execution context string
+    '''
+    for arg in args:
+        if isinstance(arg, str):
+            return arg
+        if isinstance(arg, dict):
+            area = arg.get('area')
+            return getattr(area, 'type', 'override')
+    return ''
+
+
+def _folded(frame) -> str:
+    names = []
+    while frame:
+        code = frame.f_code
+        # this module and the runner's runpy frames
+        if code.co_filename != _THIS and 'runpy' not in code.co_filename:
+            names.append(
+                f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+_profiler: Optional[Profiler] = None
+
+
+def enable(sample_interval: float = 0.0) -> Profiler:
+    global _profiler
+    if _profiler:
+        return _profiler
+    _profiler = Profiler(sample_interval)
+    _profiler.enable()
+    return _profiler
+
+
+def disable() -> Optional[Profiler]:
+    '''
+    the profiler with its records
+    '''
+    global _profiler
+    profiler = _profiler
+    if profiler:
+        profiler.disable()
+    _profiler = None
+    return profiler
+
+
+def enable_from_env():
+    '''
+    BPY_PROFILE=path.folded enables the profiler until exit.
+    each process writes path.PID when several processes profile
+    '''
+    path = os.environ.get('BPY_PROFILE')
+    if not path or _profiler:
+        return
+    enable(float(os.environ.get('BPY_PROFILE_SAMPLE', '0')))
+    written = []
+
+    def write():
+        if written:
+            return
+        written.append(True)
+        profiler = disable()
+        if not profiler:
+            return
+        dst = path if multiprocessing.parent_process() is None else f'{path}.{os.getpid()}'
+        profiler.write_folded(dst)
+        profiler.report(file=sys.stderr)
+
+    atexit.register(write)
+    # multiprocessing children leave through os._exit, atexit does not run
+    multiprocessing.util.Finalize(None, write, exitpriority=100)
+
+
+def main():
+    parser = argparse.ArgumentParser('bpy operator profiler')
+    parser.add_argument('--sample',
+                        type=float,
+                        default=0.0,
+                        help='stack sampling interval in seconds')
+    parser.add_argument('--folded', help='flamegraph.pl input')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('script')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    parsed = parser.parse_args()
+
+    args = parsed.args[1:] if parsed.args[:1] == ['--'] else parsed.args
+    sys.argv = [parsed.script] + args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(parsed.script)))
+    profiler = enable(parsed.sample)
+    try:
+        runpy.run_path(parsed.script, run_name='__main__')
+    finally:
+        disable()
+        profiler.report(parsed.top)
+        if parsed.folded:
+            profiler.write_folded(parsed.folded)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,395 @@
+'''
+bulk bpy arrays shared between processes without pickling them
+
+the owner reads with foreach_get straight into a shared memory segment and
+sends a small ArrayRef. peers map the segment as a numpy array, no copy.
+results written into the segment go back with foreach_set.
+
+    # owner
+    with bpy_shm.Publisher() as publisher:
+        refs = publisher.publish_mesh(mesh)
+        pool.submit(deform, refs['co']).result()
+        bpy_shm.write_back(mesh.vertices, 'co', refs['co'])
+
+    # peer
+    def deform(ref):
+        with bpy_shm.mapped(ref) as co:
+            co[:, 2] += 1
+
+segments are named bpyshm_PID_N. the publisher unlinks them on release,
+close and exit, cleanup_stale() removes those of killed owners.
+
+    # pickle against shared memory
+    python bpy_shm.py --mb 200 --jobs 16
+    python bpy_shm.py --bpy --size 1000
+'''
+import argparse
+import concurrent.futures
+import contextlib
+import itertools
+import multiprocessing
+import multiprocessing.util
+import os
+import pickle
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy
+
+import bpy_numpy
+
+PREFIX = 'bpyshm_'
+SHM_DIR = '/dev/shm'
+
+
+class ArrayRef(NamedTuple):
+    '''
+    what a peer needs to map the array. pickles to ~100 bytes
+    '''
+    segment: str
+    shape: Tuple[int, ...]
+    dtype: str
+    offset: int = 0
+
+    @property
+    def nbytes(self) -> int:
+        count = 1
+        for n in self.shape:
+            count *= n
+        return count * numpy.dtype(self.dtype).itemsize
+
+
+def _view(shm: shared_memory.SharedMemory, ref: ArrayRef) -> numpy.ndarray:
+    return numpy.ndarray(ref.shape,
+                         dtype=numpy.dtype(ref.dtype),
+                         buffer=shm.buf,
+                         offset=ref.offset)
+
+
+class Publisher:
+    '''
+    creates and owns segments. a segment lives until release or close
+    '''
+    def __init__(self):
+        self.segments: Dict[str, shared_memory.SharedMemory] = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        # runs on collection and at exit, pool workers included (os._exit skips atexit)
+        self._finalizer = multiprocessing.util.Finalize(self,
+                                                        _unlink_all,
+                                                        args=(self.segments, self.lock),
+                                                        exitpriority=100)
+
+    def allocate(self, shape: Tuple[int, ...], dtype) -> Tuple[ArrayRef, numpy.ndarray]:
+        '''
+        an empty shared array and its descriptor
+        '''
+        dtype = numpy.dtype(dtype)
+        nbytes = int(numpy.prod(shape, dtype=numpy.int64)) * dtype.itemsize
+        with self.lock:
+            name = f'{PREFIX}{os.getpid()}_{next(self.counter)}'
+            shm = shared_memory.SharedMemory(name=name, create=True, size=max(nbytes, 1))
+            _drop_fd(shm)
+            self.segments[name] = shm
+        ref = ArrayRef(name, tuple(int(n) for n in shape), dtype.str)
+        return ref, _view(shm, ref)
+
+    def publish(self, array: numpy.ndarray) -> ArrayRef:
+        '''
+        one copy into a new segment
+        '''
+        ref, view = self.allocate(array.shape, array.dtype)
+        view[...] = array
+        return ref
+
+    def publish_collection(self, collection, attr: str, dtype, width: int = 1) -> ArrayRef:
+        '''
+        foreach_get straight into the segment
+        '''
+        shape = (len(collection), width) if width > 1 else (len(collection), )
+        ref, view = self.allocate(shape, dtype)
+        bpy_numpy.foreach_get(collection, attr, dtype, width, view)
+        return ref
+
+    def publish_mesh(self, mesh) -> Dict[str, ArrayRef]:
+        '''
+        co, loop vertices, polygon loop starts and totals, uvs of the active layer
+        '''
+        refs = {
+            'co': self.publish_collection(mesh.vertices, 'co', numpy.float32, 3),
+            'loop_vertices': self.publish_collection(mesh.loops, 'vertex_index', numpy.int32),
+            'loop_start': self.publish_collection(mesh.polygons, 'loop_start', numpy.int32),
+            'loop_total': self.publish_collection(mesh.polygons, 'loop_total', numpy.int32),
+        }
+        if mesh.uv_layers.active:
+            refs['uv'] = self.publish_collection(mesh.uv_layers.active.data, 'uv', numpy.float32, 2)
+        return refs
+
+    def publish_pixels(self, reader) -> ArrayRef:
+        '''
+        the last render of a render_pixels.PixelReader, (h, w, 4) float32
+        '''
+        ref, view = self.allocate(reader.shape, numpy.float32)
+        reader.read(view)
+        return ref
+
+    def release(self, ref: ArrayRef):
+        with self.lock:
+            shm = self.segments.pop(ref.segment, None)
+        if shm:
+            _close(shm)
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        _unlink_all(self.segments, self.lock)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _unlink_all(segments: Dict[str, shared_memory.SharedMemory], lock: threading.Lock):
+    with lock:
+        owned = list(segments.values())
+        segments.clear()
+    for shm in owned:
+        _close(shm)
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# closed while a numpy view was alive. closed for real once the views are gone
+_lingering: Dict[int, shared_memory.SharedMemory] = {}
+_lingering_lock = threading.Lock()
+
+
+def _drop_fd(shm: shared_memory.SharedMemory):
+    '''
+    the mapping does not need the descriptor. a worker attaching one
+    segment per job would run out of them otherwise. posix only
+    '''
+    fd = getattr(shm, '_fd', -1)
+    if fd >= 0:
+        os.close(fd)
+        shm._fd = -1  # type: ignore
+
+
+def _close(shm: shared_memory.SharedMemory):
+    try:
+        shm.close()
+    except BufferError:
+        # a view is alive. kept referenced, SharedMemory.__del__ would fail the same way
+        with _lingering_lock:
+            _lingering[id(shm)] = shm
+
+
+def _sweep():
+    '''
+    close the mappings whose views are gone
+    '''
+    with _lingering_lock:
+        for key, shm in list(_lingering.items()):
+            try:
+                shm.close()
+            except BufferError:
+                continue
+            del _lingering[key]
+
+
+#
+# peer side
+#
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+_attach_lock = threading.Lock()
+
+
+def _open(name: str) -> shared_memory.SharedMemory:
+    '''
+    map without registering with the resource tracker. before 3.13 the
+    tracker of a peer unlinks the segment when the peer exits
+    '''
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)  # type: ignore
+    except TypeError:
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kw: None  # type: ignore
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register  # type: ignore
+    _drop_fd(shm)
+    return shm
+
+
+def attach(ref: ArrayRef) -> numpy.ndarray:
+    '''
+    the array of ref, mapped. writes are seen by the owner
+    '''
+    _sweep()
+    with _attach_lock:
+        shm = _attached.get(ref.segment)
+        if not shm:
+            shm = _open(ref.segment)
+            _attached[ref.segment] = shm
+    return _view(shm, ref)
+
+
+def detach(ref: ArrayRef):
+    '''
+    unmap. with views of the segment alive, the mapping is closed
+    by a later attach or detach once they are gone
+    '''
+    with _attach_lock:
+        shm = _attached.pop(ref.segment, None)
+    if shm:
+        _close(shm)
+    _sweep()
+
+
+@contextlib.contextmanager
+def mapped(ref: ArrayRef) -> Iterator[numpy.ndarray]:
+    '''
+    attach and detach. the array bound by `as` outlives the block,
+    its mapping is closed after it is gone
+    '''
+    array = attach(ref)
+    try:
+        yield array
+    finally:
+        del array
+        detach(ref)
+
+
+def write_back(collection, attr: str, ref: ArrayRef):
+    '''
+    foreach_set from the shared array
+    '''
+    with mapped(ref) as array:
+        bpy_numpy.foreach_set(collection, attr, array)
+
+
+def cleanup_stale() -> int:
+    '''
+    unlink segments of owners that no longer run. linux only
+    '''
+    if not os.path.isdir(SHM_DIR):
+        return 0
+    removed = 0
+    for name in os.listdir(SHM_DIR):
+        if not name.startswith(PREFIX):
+            continue
+        try:
+            pid = int(name[len(PREFIX):].split('_', 1)[0])
+            os.kill(pid, 0)
+            continue
+        except ValueError:
+            continue
+        except PermissionError:
+            continue
+        except ProcessLookupError:
+            pass
+        try:
+            os.unlink(os.path.join(SHM_DIR, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+#
+# benchmark
+#
+def _deform_pickled(array: numpy.ndarray) -> numpy.ndarray:
+    array[:, 2] += 1.0
+    return array
+
+
+def _deform_shared(ref: ArrayRef) -> None:
+    with mapped(ref) as array:
+        array[:, 2] += 1.0
+
+
+def _grid(size: int):
+    import bpy
+    bpy.ops.mesh.primitive_grid_add(x_subdivisions=size, y_subdivisions=size)
+    return bpy.context.object.data
+
+
+def benchmark(mb: int, jobs: int, workers: int, use_bpy: bool, size: int):
+    '''
+    deform jobs on a pool. arrays pickled both ways against refs to segments
+    '''
+    mesh = _grid(size) if use_bpy else None
+    count = len(mesh.vertices) if mesh else (mb << 20) // 12
+    source = numpy.random.default_rng(0).random((count, 3), dtype=numpy.float32)
+    if mesh:
+        bpy_numpy.set_vertices(mesh, source)
+    nbytes = count * 12
+    ctx = multiprocessing.get_context('spawn')
+    rows: List[Tuple[str, float, int]] = []
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+        # start the workers
+        list(pool.map(abs, range(workers)))
+
+        start = time.perf_counter()
+        copied = 0
+        for _ in range(jobs):
+            array = bpy_numpy.get_vertices(mesh) if mesh else source.copy()
+            copied += len(pickle.dumps(array, pickle.HIGHEST_PROTOCOL))
+            result = pool.submit(_deform_pickled, array).result()
+            copied += result.nbytes
+            if mesh:
+                bpy_numpy.set_vertices(mesh, result)
+        rows.append(('pickle', time.perf_counter() - start, copied))
+
+        start = time.perf_counter()
+        copied = 0
+        with Publisher() as publisher:
+            for _ in range(jobs):
+                if mesh:
+                    ref = publisher.publish_collection(mesh.vertices, 'co', numpy.float32, 3)
+                else:
+                    ref = publisher.publish(source)
+                    # the copy in, foreach_get of a mesh writes the segment directly
+                    copied += nbytes
+                copied += len(pickle.dumps(ref))
+                pool.submit(_deform_shared, ref).result()
+                if mesh:
+                    write_back(mesh.vertices, 'co', ref)
+                publisher.release(ref)
+        rows.append(('shared memory', time.perf_counter() - start, copied))
+
+    print(f'{jobs} jobs of {nbytes / (1 << 20):.1f}MB, {workers} workers')
+    print(f'{"":<16}{"seconds":>10}{"copied MB":>12}{"MB/s":>10}')
+    for name, seconds, copied in rows:
+        print(f'{name:<16}{seconds:>10.3f}{copied / (1 << 20):>12.1f}{jobs * nbytes / (1 << 20) / seconds:>10.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser('shared memory against pickle')
+    parser.add_argument('--mb', type=int, default=200, help='array size without --bpy')
+    parser.add_argument('--jobs', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--bpy', action='store_true', help='vertices of a grid mesh, written back with foreach_set')
+    parser.add_argument('--size', type=int, default=1000, help='grid subdivisions with --bpy')
+    parser.add_argument('--cleanup', action='store_true', help='unlink segments of killed owners')
+    parsed = parser.parse_args()
+
+    if parsed.cleanup:
+        print(f'removed {cleanup_stale()}')
+        return
+    benchmark(parsed.mb, parsed.jobs, parsed.workers, parsed.bpy, parsed.size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,532 @@
+'''
+where the size and the load time of bpy come from
+
+binary size is attributed to the static libraries and object files linked into
+bpy.so through the symbol tables. load cost is attributed to the dynamic
+relocations and .init_array constructors that land in each library.
+the installed scripts tree is counted per directory.
+libraries are mapped to the -DWITH_* flag that leaves them out.
+
+    python bpy_size.py tags/v2.93.5/bpy
+    python bpy_size.py tags/v2.93.5/bpy --install tags/v2.93.5/bpy_install --import-time
+    python bpy_size.py C:/bpy_module/bpy_v2.93.5 --json size.json
+
+linux and elf only, nm and readelf from binutils.
+'''
+import argparse
+import bisect
+import collections
+import concurrent.futures
+import json
+import os
+import pathlib
+import re
+import shlex
+import struct
+import subprocess
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# static library => the flag that removes it. first match wins
+FLAGS = [
+    (r'cycles|bf_intern_cycles', 'WITH_CYCLES'),
+    (r'embree', 'WITH_CYCLES_EMBREE'),
+    (r'^osl|bf_intern_cycles_osl', 'WITH_CYCLES_OSL'),
+    (r'openpgl', 'WITH_CYCLES_PATH_GUIDING'),
+    (r'cuew', 'WITH_CYCLES_DEVICE_CUDA'),
+    (r'hipew', 'WITH_CYCLES_DEVICE_HIP'),
+    (r'OpenImageDenoise|dnnl|openimagedenoise', 'WITH_OPENIMAGEDENOISE'),
+    (r'freestyle', 'WITH_FREESTYLE'),
+    (r'libmv|ceres', 'WITH_LIBMV'),
+    (r'openvdb', 'WITH_OPENVDB'),
+    (r'blosc', 'WITH_OPENVDB_BLOSC'),
+    (r'nanovdb', 'WITH_NANOVDB'),
+    (r'alembic|Alembic', 'WITH_ALEMBIC'),
+    (r'usd|^tf$|^sdf$|^vt$|^ar$|^hd|pxr', 'WITH_USD'),
+    (r'materialx|MaterialX', 'WITH_MATERIALX'),
+    (r'collada|COLLADA|GeneratedSaxParser|MathMLSolver|^buffer$|^ftoa$|^UTF$', 'WITH_OPENCOLLADA'),
+    (r'audaspace|^aud', 'WITH_AUDASPACE'),
+    (r'openal', 'WITH_OPENAL'),
+    (r'sndfile|FLAC|ogg|vorbis', 'WITH_CODEC_SNDFILE'),
+    (r'avcodec|avformat|avutil|swscale|swresample|avdevice|avfilter|x264|x265|vpx|opus|theora|mp3lame|xvidcore|openjpeg_ffmpeg|aom', 'WITH_CODEC_FFMPEG'),
+    (r'jack', 'WITH_JACK'),
+    (r'SDL|sdlew', 'WITH_SDL'),
+    (r'mantaflow|manta', 'WITH_MOD_FLUID'),
+    (r'bullet|Bullet|rigidbody|LinearMath', 'WITH_BULLET'),
+    (r'itasc', 'WITH_IK_ITASC'),
+    (r'iksolver', 'WITH_IK_SOLVER'),
+    (r'^osd|opensubdiv', 'WITH_OPENSUBDIV'),
+    (r'quadriflow', 'WITH_QUADRIFLOW_REMESHER'),
+    (r'draco', 'WITH_DRACO'),
+    (r'gmp', 'WITH_GMP'),
+    (r'fftw', 'WITH_FFTW3'),
+    (r'potrace', 'WITH_POTRACE'),
+    (r'haru|hpdf', 'WITH_HARU'),
+    (r'OpenEXR|IlmImf|Iex|Imath|Half|IlmThread|openexr', 'WITH_IMAGE_OPENEXR'),
+    (r'openjp2|openjpeg', 'WITH_IMAGE_OPENJPEG'),
+    (r'webp', 'WITH_IMAGE_WEBP'),
+    (r'tiff', 'WITH_IMAGE_TIFF'),
+    (r'cineon', 'WITH_IMAGE_CINEON'),
+    (r'dds', 'WITH_IMAGE_DDS'),
+    (r'OpenColorIO|opencolorio|yaml-cpp|pystring', 'WITH_OPENCOLORIO'),
+    (r'OpenImageIO|openimageio', 'WITH_OPENIMAGEIO'),
+    (r'spnav|ndof', 'WITH_INPUT_NDOF'),
+    (r'io_wavefront_obj', 'WITH_IO_WAVEFRONT_OBJ'),
+    (r'io_ply', 'WITH_IO_PLY'),
+    (r'io_stl', 'WITH_IO_STL'),
+    (r'io_gpencil|io_grease_pencil', 'WITH_IO_GPENCIL'),
+    (r'compositor', 'WITH_COMPOSITOR_CPU'),
+    (r'lzma', 'WITH_LZMA'),
+    (r'lzo', 'WITH_LZO'),
+    (r'tbb', 'WITH_TBB'),
+    (r'shaderc|vulkan', 'WITH_VULKAN_BACKEND'),
+    (r'LLVM|llvm|clang', 'WITH_LLVM'),
+]
+
+
+class Section(NamedTuple):
+    addr: int
+    offset: int
+    size: int
+
+
+class Owner(NamedTuple):
+    library: str
+    object: str
+
+
+class LibraryStat:
+    __slots__ = ('text', 'data', 'relative', 'symbolic', 'inits', 'objects')
+
+    def __init__(self):
+        self.text = 0
+        self.data = 0
+        # dynamic relocations in the library's data
+        self.relative = 0
+        self.symbolic = 0
+        # .init_array constructors
+        self.inits = 0
+        self.objects: Dict[str, int] = collections.Counter()
+
+    @property
+    def size(self) -> int:
+        return self.text + self.data
+
+
+def find_binary(build_dir: pathlib.Path) -> pathlib.Path:
+    '''
+    the bpy module became a package in 3.4
+    '''
+    for path in (build_dir / 'bin/bpy/__init__.so', build_dir / 'bin/bpy.so'):
+        if path.exists():
+            return path
+    raise FileNotFoundError(f'no bpy.so in {build_dir}/bin')
+
+
+def link_inputs(build_dir: pathlib.Path, binary: pathlib.Path) -> List[pathlib.Path]:
+    '''
+    static libraries on the link command line, the prebuilt ones included.
+    lib/*.a of the build dir without ninja
+    '''
+    target = os.path.relpath(binary, build_dir)
+    try:
+        commands = subprocess.run(['ninja', '-C', str(build_dir), '-t', 'commands', target],
+                                  check=True,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL).stdout.decode('utf-8')
+    except (OSError, subprocess.CalledProcessError):
+        return sorted(build_dir.glob('lib/*.a'))
+    link = commands.strip().splitlines()[-1]
+    archives = []
+    seen = set()
+    for arg in shlex.split(link):
+        if not arg.endswith('.a'):
+            continue
+        path = pathlib.Path(arg)
+        if not path.is_absolute():
+            path = build_dir / path
+        path = path.resolve()
+        if path not in seen and path.exists():
+            seen.add(path)
+            archives.append(path)
+    return archives
+
+
+def library_name(archive: pathlib.Path) -> str:
+    '''
+    libbf_blenkernel.a => bf_blenkernel
+    '''
+    name = archive.name[:-len('.a')]
+    return name[3:] if name.startswith('lib') else name
+
+
+def archive_symbols(archive: pathlib.Path) -> List[Tuple[str, str]]:
+    '''
+    (symbol, object) defined in the archive
+    '''
+    out = subprocess.run(['nm', '-P', '-A', '--defined-only', str(archive)],
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL).stdout.decode('utf-8', 'replace')
+    symbols = []
+    for line in out.splitlines():
+        # lib.a[object.o]: symbol T 0000000000000000 0000000000000010
+        head, _, rest = line.partition(': ')
+        if not rest:
+            continue
+        obj = head[head.find('[') + 1:-1] if head.endswith(']') else head
+        symbols.append((rest.split(' ', 1)[0], obj))
+    return symbols
+
+
+def symbol_owners(archives: List[pathlib.Path], jobs: int) -> Dict[str, Owner]:
+    '''
+    symbol => the first library on the link line that defines it, like the linker
+    '''
+    owners: Dict[str, Owner] = {}
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        for archive, symbols in zip(archives, executor.map(archive_symbols, archives)):
+            library = library_name(archive)
+            for name, obj in symbols:
+                if name not in owners:
+                    owners[name] = Owner(library, obj)
+    return owners
+
+
+def read_sections(binary: pathlib.Path) -> Dict[str, Section]:
+    '''
+    section headers of a little endian ELF64
+    '''
+    with binary.open('rb') as f:
+        ident = f.read(64)
+        if ident[:4] != b'\x7fELF' or ident[4] != 2 or ident[5] != 1:
+            raise ValueError(f'{binary}: not a little endian ELF64')
+        shoff, = struct.unpack_from('<Q', ident, 0x28)
+        shentsize, shnum, shstrndx = struct.unpack_from('<HHH', ident, 0x3A)
+        f.seek(shoff)
+        headers = [
+            struct.unpack('<IIQQQQIIQQ', f.read(shentsize)[:64]) for _ in range(shnum)
+        ]
+        names = headers[shstrndx]
+        f.seek(names[4])
+        strtab = f.read(names[5])
+    sections = {}
+    for name, _type, _flags, addr, offset, size, *_ in headers:
+        end = strtab.find(b'\0', name)
+        sections[strtab[name:end].decode('ascii', 'replace')] = Section(addr, offset, size)
+    return sections
+
+
+def binary_symbols(binary: pathlib.Path) -> List[Tuple[str, str, int, int]]:
+    '''
+    (symbol, type, address, size) of the linked module
+    '''
+    out = subprocess.run(['nm', '-P', '-S', '--defined-only', str(binary)],
+                         check=True,
+                         stdout=subprocess.PIPE).stdout.decode('utf-8', 'replace')
+    symbols = []
+    for line in out.splitlines():
+        fields = line.split()
+        if len(fields) < 4:
+            continue
+        symbols.append((fields[0], fields[1], int(fields[2], 16), int(fields[3], 16)))
+    return symbols
+
+
+def relocations(binary: pathlib.Path) -> Tuple[List[Tuple[int, str, Optional[int]]], int]:
+    '''
+    ([(offset, type, addend)], relr locations). RELR entries carry no type
+    '''
+    out = subprocess.run(['readelf', '-r', '-W', str(binary)],
+                         check=True,
+                         stdout=subprocess.PIPE).stdout.decode('utf-8', 'replace')
+    relocs = []
+    relr = 0
+    in_relr = False
+    for line in out.splitlines():
+        if line.startswith('Relocation section'):
+            in_relr = '.relr' in line
+            m = re.search(r'relocate (\d+) locations', line)
+            if in_relr and m:
+                relr += int(m[1])
+            continue
+        fields = line.split()
+        if in_relr or len(fields) < 3 or not fields[2].startswith('R_'):
+            continue
+        try:
+            offset = int(fields[0], 16)
+        except ValueError:
+            continue
+        addend = None
+        if len(fields) == 4:
+            # R_X86_64_RELATIVE  addend
+            addend = int(fields[3], 16)
+        relocs.append((offset, fields[2], addend))
+    return relocs, relr
+
+
+def init_targets(binary: pathlib.Path, sections: Dict[str, Section],
+                 relocs: List[Tuple[int, str, Optional[int]]]) -> List[int]:
+    '''
+    function addresses in .init_array. from the RELA addends, or the section
+    content where the addend is stored in place
+    '''
+    init = sections.get('.init_array')
+    if not init or not init.size:
+        return []
+    targets = [
+        addend for offset, _type, addend in relocs
+        if addend is not None and init.addr <= offset < init.addr + init.size
+    ]
+    if targets:
+        return targets
+    with binary.open('rb') as f:
+        f.seek(init.offset)
+        data = f.read(init.size)
+    return [v for v in struct.unpack(f'<{len(data) // 8}Q', data) if v]
+
+
+class AddressIndex:
+    '''
+    address => owner of the symbol that contains it
+    '''
+    def __init__(self, ranges: List[Tuple[int, int, Owner]]):
+        ranges.sort(key=lambda r: r[0])
+        self.starts = [r[0] for r in ranges]
+        self.ranges = ranges
+
+    def find(self, address: int) -> Optional[Owner]:
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i < 0:
+            return None
+        start, size, owner = self.ranges[i]
+        return owner if address < start + max(size, 1) else None
+
+
+def flag_of(library: str) -> str:
+    for pattern, flag in FLAGS:
+        if re.search(pattern, library):
+            return flag
+    return ''
+
+
+def read_cache(build_dir: pathlib.Path) -> Dict[str, str]:
+    '''
+    WITH_* values of CMakeCache.txt
+    '''
+    values = {}
+    try:
+        lines = (build_dir / 'CMakeCache.txt').read_text(errors='replace').splitlines()
+    except OSError:
+        return values
+    for line in lines:
+        m = re.match(r'^(WITH_\w+):\w+=(.*)$', line)
+        if m:
+            values[m[1]] = m[2]
+    return values
+
+
+def analyze(build_dir: pathlib.Path, jobs: int) -> Dict[str, Any]:
+    binary = find_binary(build_dir)
+    archives = link_inputs(build_dir, binary)
+    owners = symbol_owners(archives, jobs)
+    sections = read_sections(binary)
+    stats: Dict[str, LibraryStat] = collections.defaultdict(LibraryStat)
+    unknown = Owner('(not in a static library)', '')
+
+    ranges = []
+    symbols = binary_symbols(binary)
+    if not symbols:
+        raise ValueError(f'{binary} has no symbol table. use the binary of the build dir, not a stripped install')
+    for name, kind, address, size in symbols:
+        owner = owners.get(name, unknown)
+        stat = stats[owner.library]
+        # W: weak functions, inline and template instantiations
+        if kind in 'TtWw':
+            stat.text += size
+        elif kind in 'DdBbRrVvu':
+            stat.data += size
+        stat.objects[owner.object] += size
+        ranges.append((address, size, owner))
+    index = AddressIndex(ranges)
+
+    relocs, relr = relocations(binary)
+    types: Dict[str, int] = collections.Counter()
+    for offset, kind, _addend in relocs:
+        types[kind] += 1
+        owner = index.find(offset) or unknown
+        if kind.endswith('RELATIVE'):
+            stats[owner.library].relative += 1
+        else:
+            stats[owner.library].symbolic += 1
+    if relr:
+        types['RELR'] = relr
+    for target in init_targets(binary, sections, relocs):
+        stats[(index.find(target) or unknown).library].inits += 1
+
+    cache = read_cache(build_dir)
+    libraries = []
+    for library, stat in stats.items():
+        flag = flag_of(library)
+        libraries.append({
+            'library': library,
+            'flag': flag,
+            'enabled': cache.get(flag, ''),
+            'text': stat.text,
+            'data': stat.data,
+            'relative': stat.relative,
+            'symbolic': stat.symbolic,
+            'inits': stat.inits,
+            'objects': stat.objects.most_common(5),
+        })
+    libraries.sort(key=lambda r: r['text'] + r['data'], reverse=True)
+    return {
+        'binary': str(binary),
+        'file_size': binary.stat().st_size,
+        'archives': len(archives),
+        'sections': sorted(((name, s.size) for name, s in sections.items() if name),
+                           key=lambda kv: kv[1],
+                           reverse=True),
+        'relocations': dict(types.most_common()),
+        'libraries': libraries,
+    }
+
+
+def by_flag(libraries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    flags: Dict[str, Dict[str, Any]] = {}
+    for lib in libraries:
+        if not lib['flag']:
+            continue
+        row = flags.setdefault(lib['flag'], {
+            'flag': lib['flag'],
+            'enabled': lib['enabled'],
+            'size': 0,
+            'relocations': 0,
+            'inits': 0,
+            'libraries': 0
+        })
+        row['size'] += lib['text'] + lib['data']
+        row['relocations'] += lib['relative'] + lib['symbolic']
+        row['inits'] += lib['inits']
+        row['libraries'] += 1
+    return sorted(flags.values(), key=lambda r: r['size'], reverse=True)
+
+
+def scripts_tree(install: pathlib.Path) -> List[Tuple[str, int, int]]:
+    '''
+    (directory, files, bytes) below VERSION/scripts. each addon is a row
+    '''
+    scripts = next((p for p in install.glob('**/scripts') if (p / 'modules').is_dir()), None)
+    if not scripts:
+        return []
+    rows = []
+    for child in sorted(scripts.iterdir()):
+        if child.is_dir() and child.name.startswith('addons'):
+            parents = sorted(child.iterdir())
+        else:
+            parents = [child]
+        for path in parents:
+            files = 0
+            size = 0
+            if path.is_file():
+                files, size = 1, path.stat().st_size
+            for root, _dirs, names in os.walk(path):
+                for name in names:
+                    files += 1
+                    size += os.path.getsize(os.path.join(root, name))
+            rows.append((str(path.relative_to(scripts)), files, size))
+    rows.sort(key=lambda r: r[2], reverse=True)
+    return rows
+
+
+def import_time(install: pathlib.Path) -> Tuple[float, List[str]]:
+    '''
+    (seconds of import bpy, dynamic loader statistics)
+    '''
+    code = 'import time; t = time.perf_counter(); import bpy; print(time.perf_counter() - t)'
+    env = dict(os.environ, LD_DEBUG='statistics', PYTHONPATH=str(install))
+    p = subprocess.run([sys.executable, '-c', code],
+                       env=env,
+                       stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE,
+                       check=True)
+    lines = [
+        line.split(':', 1)[1].strip() for line in p.stderr.decode('utf-8', 'replace').splitlines()
+        if 'relocation' in line or 'startup time' in line
+    ]
+    return float(p.stdout.decode().split()[-1]), lines
+
+
+def mb(size: int) -> str:
+    return f'{size / (1 << 20):.1f}'
+
+
+def print_report(report: Dict[str, Any], top: int):
+    print(f'{report["binary"]}: {mb(report["file_size"])}MB, {report["archives"]} static libraries')
+    print()
+    print(f'{"section":<24}{"MB":>8}')
+    for name, size in report['sections'][:10]:
+        print(f'{name:<24}{mb(size):>8}')
+    print()
+    print('relocations: ' + ', '.join(f'{k} {v}' for k, v in report['relocations'].items()))
+    print()
+    print(f'{"library":<32}{"text MB":>9}{"data MB":>9}{"relocs":>9}{"inits":>7}  flag')
+    for lib in report['libraries'][:top]:
+        flag = f'{lib["flag"]}={lib["enabled"] or "?"}' if lib['flag'] else ''
+        print(
+            f'{lib["library"][:31]:<32}{mb(lib["text"]):>9}{mb(lib["data"]):>9}{lib["relative"] + lib["symbolic"]:>9}{lib["inits"]:>7}  {flag}'
+        )
+    print()
+    print('largest objects')
+    objects = sorted(((size, lib['library'], obj) for lib in report['libraries']
+                      for obj, size in lib['objects'] if obj),
+                     reverse=True)
+    for size, library, obj in objects[:top]:
+        print(f'{mb(size):>8}MB  {library}/{obj}')
+    print()
+    print(f'{"flag":<32}{"MB":>8}{"relocs":>9}{"inits":>7}{"libs":>6}  value')
+    for row in report['flags']:
+        print(
+            f'{row["flag"]:<32}{mb(row["size"]):>8}{row["relocations"]:>9}{row["inits"]:>7}{row["libraries"]:>6}  {row["enabled"]}'
+        )
+    if report.get('scripts'):
+        rows = report['scripts']
+        print()
+        print(f'scripts: {sum(r[1] for r in rows)} files, {mb(sum(r[2] for r in rows))}MB')
+        for path, files, size in rows[:top]:
+            print(f'{mb(size):>8}MB {files:>6} files  {path}')
+    if 'import' in report:
+        print()
+        print(f'import bpy: {report["import"]["seconds"]:.2f}s')
+        for line in report['import']['loader']:
+            print(f'  {line}')
+
+
+def main():
+    parser = argparse.ArgumentParser('bpy size and load cost')
+    parser.add_argument('build_dir', help='cmake build dir of bpy')
+    parser.add_argument('--install',
+                        help='install prefix for the scripts tree. default: BUILD_DIR/../bpy_install')
+    parser.add_argument('--import-time',
+                        action='store_true',
+                        help='import bpy from the install with LD_DEBUG=statistics')
+    parser.add_argument('--top', type=int, default=25)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--json', help='write the report')
+    parsed = parser.parse_args()
+
+    build_dir = pathlib.Path(parsed.build_dir).absolute()
+    report = analyze(build_dir, parsed.jobs)
+    report['flags'] = by_flag(report['libraries'])
+    install = pathlib.Path(parsed.install) if parsed.install else build_dir.parent / 'bpy_install'
+    if install.exists():
+        report['scripts'] = scripts_tree(install)
+        if parsed.import_time:
+            seconds, loader = import_time(install)
+            report['import'] = {'seconds': seconds, 'loader': loader}
+    print_report(report, parsed.top)
+    if parsed.json:
+        pathlib.Path(parsed.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
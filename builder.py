@@ -1,27 +1,139 @@
 import argparse
+import concurrent.futures
+import functools
 import pathlib
+import platform
+import shlex
 import subprocess
 import sys
+import sysconfig
 import os
 import shutil
 import re
-from typing import List, Tuple
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 from contextlib import contextmanager
 import vcenv
+import artifact_cache
+import buildstat
+import pgo
 
 GIT_BLENDER = 'git://git.blender.org/blender.git'
 HERE = pathlib.Path(__file__).parent
 VSWHERE = HERE / 'vswhere.exe'
 PY_DIR = pathlib.Path(sys.executable).parent
-BL_DIR = PY_DIR / 'Lib/site-packages/blender'
+IS_WINDOWS = platform.system() == 'Windows'
+# Lib/site-packages on windows, lib/pythonX.Y/site-packages on linux
+SITE_PACKAGES = pathlib.Path(sysconfig.get_paths()['platlib'])
+BL_DIR = SITE_PACKAGES / 'blender'
+BPY_BINARY = 'bpy.pyd' if IS_WINDOWS else 'bpy.so'
+# faster first
+LINKERS = ['mold', 'ld.lld']
+BPY_ARGS = '-DWITH_PYTHON_INSTALL=OFF -DWITH_PYTHON_INSTALL_NUMPY=OFF -DWITH_PYTHON_MODULE=ON'
+COMMON_ARGS = '-DWITH_OPENCOLLADA=OFF -DWITH_AUDASPACE=OFF -DWITH_WINDOWS_BUNDLE_CRT=OFF'
+# the tag builds of dodo.py and perf_bisect.py
+CONFIGURE_FLAGS = ' '.join([
+    '-DCMAKE_BUILD_TYPE=Release',
+    '-DWITH_INTERNATIONAL=OFF',
+    '-DWITH_INPUT_NDOF=OFF',
+    '-DWITH_CYCLES=OFF',
+    '-DWITH_OPENVDB=OFF',
+    '-DWITH_LIBMV=OFF',
+    '-DWITH_MEM_JEMALLOC=OFF',
+])
+
+BPY_FLAGS = ' '.join([
+    '-DWITH_PYTHON_INSTALL=OFF', '-DWITH_PYTHON_INSTALL_NUMPY=OFF',
+    '-DWITH_PYTHON_MODULE=ON'
+])
+# pure python helpers installed next to the bpy module
+HELPER_MODULES = ['bpy_numpy.py', 'glb_export.py', 'bpy_profile.py', 'bpy_lazy.py',
+                  'bpy_shm.py']
 
 
 def python_define():
     v = sys.version_info
+    if not IS_WINDOWS:
+        # blender's FindPythonLibsUnix. install bpy.so into BL_DIR
+        include = sysconfig.get_paths()['include']
+        libdir = sysconfig.get_config_var('LIBDIR')
+        library = sysconfig.get_config_var('LDLIBRARY')
+        return f'-DPYTHON_VERSION={v.major}.{v.minor} -DPYTHON_ROOT_DIR={sys.base_prefix} -DPYTHON_INCLUDE_DIR={include} -DPYTHON_LIBRARY={libdir}/{library} -DPYTHON_SITE_PACKAGES={BL_DIR}'
     d = str(PY_DIR).replace("\\", "/")
     return f'-DPYTHON_VERSION={v.major}.{v.minor}.{v.micro} -DPYTHON_ROOT_DIR={d} -DPYTHON_INCLUDE_DIRS={d}/include -DPYTHON_LIBRARIES={d}/libs/python{v.major}.{v.minor}.lib'
 
 
+def get_linker() -> str:
+    for name in LINKERS:
+        if shutil.which(name):
+            return name
+    return ''
+
+
+def linker_define(extra: str = '') -> str:
+    '''
+    replace blender's default gold. extra: more linker flags
+    '''
+    linker = '' if IS_WINDOWS else get_linker()
+    flags = extra
+    defines = ''
+    if linker:
+        flags = f'-fuse-ld={linker.split(".")[-1]} {extra}'.strip()
+        defines = '-DWITH_LINKER_GOLD=OFF -DWITH_LINKER_LLD=OFF '
+    if not flags:
+        return defines.strip()
+    return defines + ' '.join(
+        f'"-DCMAKE_{kind}_LINKER_FLAGS={flags}"'
+        for kind in ('EXE', 'SHARED', 'MODULE'))
+
+
+def job_pool_define(build_dir: Optional[pathlib.Path] = None) -> str:
+    '''
+    ninja pools. links get as many jobs as the total memory allows for the
+    largest link peak learned in build_dir, 6G before the first adaptive build.
+    the free memory is not used, a configure is not redone because it changed
+    '''
+    jobs = os.cpu_count() or 1
+    log = build_dir / 'buildstat.jsonl' if build_dir else None
+    link_jobs = buildstat.link_jobs(log, jobs)
+    return f'"-DCMAKE_JOB_POOLS=compile={jobs};link={link_jobs}" -DCMAKE_JOB_POOL_COMPILE=compile -DCMAKE_JOB_POOL_LINK=link'
+
+
+def build_jobs(build_dir: pathlib.Path, adaptive: bool = False) -> str:
+    '''
+    cmake --build argument. adaptive: -j from the available memory and the
+    peaks of the previous build, decided when the build starts
+    '''
+    if not adaptive or IS_WINDOWS:
+        return ''
+    jobs = buildstat.compile_jobs(build_dir / 'buildstat.jsonl', os.cpu_count() or 1)
+    return f'-j {jobs}'
+
+
+def launcher_define(build_dir: pathlib.Path, adaptive: bool = False) -> str:
+    '''
+    time and peak memory of each link in build_dir/buildstat.jsonl.
+    adaptive: compiles too, jobs wait for their memory
+    '''
+    if IS_WINDOWS:
+        return ''
+    buildstat_py = HERE.absolute() / 'buildstat.py'
+    log = build_dir.absolute() / 'buildstat.jsonl'
+    if not adaptive:
+        launcher = f'{sys.executable};{buildstat_py};{log}'
+        return f'"-DCMAKE_C_LINKER_LAUNCHER={launcher}" "-DCMAKE_CXX_LINKER_LAUNCHER={launcher}"'
+    launcher = f'{sys.executable};{buildstat_py};--throttle;{log}'
+    return ' '.join(f'"-DCMAKE_{lang}_{kind}_LAUNCHER={launcher}"'
+                    for lang in ('C', 'CXX') for kind in ('COMPILER', 'LINKER'))
+
+
+def install_helpers(dst: pathlib.Path) -> None:
+    for name in HELPER_MODULES:
+        print(f'copy {name} to {dst}')
+        shutil.copy(HERE / name, dst)
+
+
 @contextmanager
 def pushd(new_dir):
     previous_dir = os.getcwd()
@@ -35,9 +147,25 @@ def pushd(new_dir):
         os.chdir(previous_dir)
 
 
-def run_command(cmd: str, encoding='utf-8') -> Tuple[int, List[str]]:
-    print(f'# {cmd}')
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+# name of the step running in this thread, prefixes the output
+_step = threading.local()
+
+
+def run_command(cmd: str,
+                encoding='utf-8',
+                cwd: Optional[pathlib.Path] = None,
+                env: Optional[Dict[str, str]] = None) -> Tuple[int, List[str]]:
+    '''
+    cwd instead of pushd and env instead of os.environ.
+    both are shared by the step threads
+    '''
+    prefix = f'[{_step.name}] ' if getattr(_step, 'name', '') else ''
+    print(f'{prefix}# {cmd}')
+    p = subprocess.Popen(cmd if IS_WINDOWS else shlex.split(cmd),
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.STDOUT,
+                         cwd=cwd,
+                         env=env)
     if not p.stdout:
         raise Exception("fail to popen")
     lines = []
@@ -48,7 +176,7 @@ def run_command(cmd: str, encoding='utf-8') -> Tuple[int, List[str]]:
         except Exception:
             encoding = 'utf-8'
             line = line_bytes.decode(encoding)
-        print(line)
+        print(prefix + line)
         lines.append(line)
     p.wait()
     if p.returncode != 0:
@@ -56,7 +184,13 @@ def run_command(cmd: str, encoding='utf-8') -> Tuple[int, List[str]]:
     return p.returncode, lines
 
 
+@functools.lru_cache(maxsize=None)
 def get_cmake() -> pathlib.Path:
+    if not IS_WINDOWS:
+        cmake = shutil.which('cmake')
+        if not cmake:
+            raise Exception('cmake not found')
+        return pathlib.Path(cmake)
     ret, outs = run_command(
         f'{VSWHERE} -latest -products * -requires Microsoft.VisualStudio.Component.VC.CMake.Project -property installationPath'
     )
@@ -94,6 +228,8 @@ def get_codepage() -> int:
 
 
 def get_console_encoding() -> str:
+    if not IS_WINDOWS:
+        return 'utf-8'
     cp = get_codepage()
     if cp == 932:
         return 'cp932'
@@ -103,12 +239,107 @@ def get_console_encoding() -> str:
         raise NotImplementedError()
 
 
+class Step(NamedTuple):
+    name: str
+    func: Callable[[], None]
+    deps: Tuple[str, ...] = ()
+    # steps with the same lock do not overlap. builds use every core
+    lock: str = ''
+
+
+class Phase(NamedTuple):
+    name: str
+    start: float
+    end: float
+
+
+def run_steps(steps: List[Step], jobs: int) -> List[Phase]:
+    '''
+    run each step when its deps are done. stops at the first failure
+    '''
+    names = {step.name for step in steps}
+    for step in steps:
+        for dep in step.deps:
+            if dep not in names:
+                raise Exception(f'{step.name}: unknown dep {dep}')
+    pending = list(steps)
+    done: Dict[str, Phase] = {}
+    locks = set()
+    running = {}
+    failed = None
+    origin = time.perf_counter()
+
+    def run(step: Step) -> Phase:
+        _step.name = step.name
+        start = time.perf_counter() - origin
+        try:
+            step.func()
+        finally:
+            _step.name = ''
+        return Phase(step.name, start, time.perf_counter() - origin)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            if not failed:
+                for step in list(pending):
+                    if len(running) >= jobs:
+                        break
+                    if any(dep not in done for dep in step.deps):
+                        continue
+                    if step.lock and step.lock in locks:
+                        continue
+                    pending.remove(step)
+                    if step.lock:
+                        locks.add(step.lock)
+                    running[executor.submit(run, step)] = step
+            if not running:
+                if failed:
+                    break
+                raise Exception(
+                    f'unreachable steps: {[step.name for step in pending]}')
+            finished, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                step = running.pop(future)
+                locks.discard(step.lock)
+                try:
+                    done[step.name] = future.result()
+                except Exception as ex:
+                    print(f'[{step.name}] failed: {ex}')
+                    failed = failed or ex
+    timeline = sorted(done.values(), key=lambda phase: phase.start)
+    print_timeline(timeline)
+    if failed:
+        raise failed
+    return timeline
+
+
+def print_timeline(timeline: List[Phase], width: int = 50) -> None:
+    if not timeline:
+        return
+    total = max(phase.end for phase in timeline) or 1
+    for phase in timeline:
+        begin = int(phase.start / total * width)
+        end = max(begin + 1, int(phase.end / total * width))
+        bar = ' ' * begin + '#' * (end - begin)
+        print(
+            f'{phase.name:<16}{phase.start:>8.1f}{phase.end - phase.start:>8.1f}s |{bar:<{width}}|'
+        )
+    print(f'{"total":<16}{total:>16.1f}s')
+
+
 class Builder:
     '''
     blender bpy module builder
     '''
-    def __init__(self, tag: str, workspace: pathlib.Path, encoding: str):
+    def __init__(self,
+                 tag: str,
+                 workspace: pathlib.Path,
+                 encoding: str,
+                 adaptive: bool = False):
         self.tag = tag
+        # job pools and throttling from memory
+        self.adaptive = adaptive
         self.branch = self.tag
         m = re.match(r'v(\d).(\d+).(\d+)', self.tag)
         if m:
@@ -120,49 +351,63 @@ class Builder:
         self.repository: pathlib.Path = self.workspace / 'blender'
         self.encoding = encoding
         self.bin_install_dir = self.workspace / 'install'
+        # msvc variables of cmake and ninja. once, before the step threads
+        self.env: Optional[Dict[str, str]] = vcenv.environ() if IS_WINDOWS else None
 
     def git(self, is_master: bool = False) -> None:
         '''
         clone repository and checkout specific tag version
         '''
         self.workspace.mkdir(parents=True, exist_ok=True)
-        with pushd(self.workspace):
-            if not self.repository.exists():
-                print(f'clone: {self.repository}')
-                # clone
-                run_command(f'git clone {GIT_BLENDER} blender')
-
-            branch = self.branch
-            if is_master:
-                branch = 'master'
-            with pushd('blender') as current:
-                # switch branch
-                run_command('git fetch --tags')
-                run_command(f'git switch -C {branch}')
-                run_command('git restore .')
-                if branch == 'master':
-                    run_command('git pull origin master')
-                else:
-                    run_command(f'git reset tags/{self.tag} --hard')
-                run_command('git submodule update --init --recursive')
-                run_command('git status')
-
-                # patch
-                # # uncached vars
-                # set(PYTHON_INCLUDE_DIRS "${PYTHON_INCLUDE_DIR}")
-                # set(PYTHON_LIBRARIES debug "${PYTHON_LIBRARY_DEBUG}" optimized "${PYTHON_LIBRARY}" )
-                path = current / 'build_files/cmake/platform/platform_win32.cmake'
-                lines = []
-                d = str(PY_DIR).replace("\\", "/")
-                v = sys.version_info
-                for line in path.read_text().splitlines():
-                    if re.match(r'^\s*set\(PYTHON_INCLUDE_DIRS ', line):
-                        line = f'set(PYTHON_INCLUDE_DIRS "{d}/include")'
-                    elif re.match(r'^\s*set\(PYTHON_LIBRARIES ', line):
-                        line = f'set(PYTHON_LIBRARIES "{d}/libs/python{v.major}{v.minor}.lib")'
-                    lines.append(line + '\n')
-                with path.open('w') as w:
-                    w.writelines(lines)
+        if not self.repository.exists():
+            print(f'clone: {self.repository}')
+            # clone
+            run_command(f'git clone {GIT_BLENDER} blender', cwd=self.workspace)
+
+        branch = self.branch
+        if is_master:
+            branch = 'master'
+        # switch branch
+        current = self.repository
+        run_command('git fetch --tags', cwd=current)
+        run_command(f'git switch -C {branch}', cwd=current)
+        run_command('git restore .', cwd=current)
+        if branch == 'master':
+            run_command('git pull origin master', cwd=current)
+        else:
+            run_command(f'git reset tags/{self.tag} --hard', cwd=current)
+        run_command('git status', cwd=current)
+
+        if IS_WINDOWS:
+            self.patch_win32(current)
+
+    def submodules(self) -> None:
+        '''
+        addons and source/tools. independent of the svn libraries
+        '''
+        run_command('git submodule update --init --recursive',
+                    cwd=self.repository)
+
+    def patch_win32(self, current: pathlib.Path) -> None:
+        '''
+        python paths of platform_win32.cmake
+        '''
+        # patch
+        # # uncached vars
+        # set(PYTHON_INCLUDE_DIRS "${PYTHON_INCLUDE_DIR}")
+        # set(PYTHON_LIBRARIES debug "${PYTHON_LIBRARY_DEBUG}" optimized "${PYTHON_LIBRARY}" )
+        path = current / 'build_files/cmake/platform/platform_win32.cmake'
+        lines = []
+        d = str(PY_DIR).replace("\\", "/")
+        v = sys.version_info
+        for line in path.read_text().splitlines():
+            if re.match(r'^\s*set\(PYTHON_INCLUDE_DIRS ', line):
+                line = f'set(PYTHON_INCLUDE_DIRS "{d}/include")'
+            elif re.match(r'^\s*set\(PYTHON_LIBRARIES ', line):
+                line = f'set(PYTHON_LIBRARIES "{d}/libs/python{v.major}{v.minor}.lib")'
+            lines.append(line + '\n')
+        with path.open('w') as w:
+            w.writelines(lines)
 
     def svn(self) -> None:
         '''
@@ -170,8 +415,10 @@ class Builder:
         '''
         # print('svn')
         make_update_py = self.repository / 'build_files/utils/make_update.py'
-        with pushd(self.repository):
-            run_command(f'{sys.executable} {make_update_py}')
+        # git() and submodules() update the sources
+        run_command(
+            f'{sys.executable} {make_update_py} --no-blender --no-submodules',
+            cwd=self.repository)
 
         # with pushd(self.workspace / 'lib/win64_vc15'):
         #     run_command(
@@ -189,26 +436,29 @@ class Builder:
         '''
         shutil.rmtree(dir, ignore_errors=True)
 
-    def cmake(self, is_bpy: bool) -> pathlib.Path:
+    def cmake(self, is_bpy: bool, extra: str = '') -> pathlib.Path:
         '''
         generate vc solutions to build_dir
         '''
         if is_bpy:
             dir = self.bpy_dir
-            cmake_args = f'{python_define()} -DWITH_PYTHON_INSTALL=OFF -DWITH_PYTHON_INSTALL_NUMPY=OFF -DWITH_PYTHON_MODULE=ON '
+            cmake_args = f'{python_define()} {BPY_ARGS} '
         else:
             dir = self.bin_dir
             cmake_args = ''
+        if not extra:
+            extra = linker_define()
+        pools = job_pool_define(dir)
+        cmake_args += f' {extra} {pools} {launcher_define(dir, self.adaptive)}'
         dir.mkdir(parents=True, exist_ok=True)
 
         cmake = get_cmake()
-        vcenv.update_environ()
 
         # https://devtalk.blender.org/t/bpy-module-dll-load-failed/11765
-        with pushd(dir):
-            run_command(
-                f'{cmake} -B . -S ../blender -G Ninja -DCMAKE_BUILD_TYPE=Release {cmake_args} -DWITH_OPENCOLLADA=OFF -DWITH_AUDASPACE=OFF -DWITH_WINDOWS_BUNDLE_CRT=OFF'
-            )
+        run_command(
+            f'{cmake} -B . -S ../blender -G Ninja -DCMAKE_BUILD_TYPE=Release {cmake_args} {COMMON_ARGS}',
+            cwd=dir,
+            env=self.env)
 
         return dir
 
@@ -219,28 +469,75 @@ class Builder:
         print('build', dir)
         cmake = get_cmake()
 
-        with pushd(dir):
-            run_command(f'{cmake} --build . --config Release',
-                        encoding=self.encoding)
+        start = time.time()
+        run_command(f'{cmake} --build . --config Release {build_jobs(dir, self.adaptive)}',
+                    encoding=self.encoding,
+                    cwd=dir,
+                    env=self.env)
+        buildstat.report(dir / 'buildstat.jsonl', since=start)
+        if self.adaptive:
+            # the next configure sizes the pools from this build
+            buildstat.update_history(dir / 'buildstat.jsonl')
+
+    def pgo(self, blends: List[str]) -> pathlib.Path:
+        '''
+        instrumented build, training with the instrumented install,
+        optimized rebuild in the same build_dir
+        '''
+        compiler = pgo.detect_compiler()
+        profile = self.workspace / ('pgo_' + self.tag)
+        shutil.rmtree(profile, ignore_errors=True)
+        dir = self.cmake(is_bpy=True,
+                         extra=pgo.pgo_define('instrument', compiler, profile))
+        self.build(dir)
+        self.install_bpy()
+        pgo.train(BL_DIR, profile, blends, 20, compiler)
+        dir = self.cmake(is_bpy=True,
+                         extra=pgo.pgo_define('use', compiler, profile))
+        self.build(dir)
+        return dir
 
     def install_bin(self) -> None:
         cmake = get_cmake()
-        with pushd(self.bin_dir):
-            run_command(
-                f'{cmake} --install . --config Release --prefix {self.bin_install_dir}',
-                encoding=self.encoding)
+        run_command(
+            f'{cmake} --install . --config Release --prefix {self.bin_install_dir}',
+            encoding=self.encoding,
+            cwd=self.bin_dir,
+            env=self.env)
 
-    def install_bpy(self) -> None:
+    def artifact_key(self, is_pgo: bool) -> Tuple[str, dict]:
         '''
-        copy bpy.pyd and *.dll and *.py to python lib folder
+        flags that change bpy. python paths are covered by the abi
+        '''
+        commit = artifact_cache.tag_commit(self.repository, self.tag)
+        flags = f'-DCMAKE_BUILD_TYPE=Release {BPY_ARGS} {COMMON_ARGS} {linker_define()}'
+        if is_pgo:
+            flags += ' pgo'
+        return artifact_cache.cache_key(commit, flags)
+
+    def install_bpy(self,
+                    cache: Optional[artifact_cache.ArtifactCache] = None,
+                    key: Tuple[str, dict] = ('', {}),
+                    cached: bool = False) -> None:
+        '''
+        copy bpy.pyd and *.dll and *.py to python lib folder.
+        cached: the build was skipped for the archive of key
         '''
         print('install')
 
         shutil.rmtree(BL_DIR, ignore_errors=True)
 
-        with (PY_DIR / 'Lib/site-packages/blender.pth').open('w') as w:
+        with (SITE_PACKAGES / 'blender.pth').open('w') as w:
             w.write("blender")
 
+        if cache and cache.get(key[0], BL_DIR):
+            self.install_scripts()
+            install_helpers(BL_DIR)
+            return
+        if cached:
+            # bpy_dir was not built
+            raise Exception(f'artifact {key[0][:12]} was evicted. run again')
+
         BL_DIR.mkdir(parents=True, exist_ok=True)
 
         # with pushd(self.build_dir / 'bin/Release'):
@@ -253,18 +550,30 @@ class Builder:
 
         #     shutil.copy('bpy.pyd', BL_DIR)
         cmake = get_cmake()
-        with pushd(self.bpy_dir):
-            run_command(
-                f'{cmake} --install . --config Release --prefix {BL_DIR}',
-                encoding=self.encoding)
-
+        run_command(f'{cmake} --install . --config Release --prefix {BL_DIR}',
+                    encoding=self.encoding,
+                    cwd=self.bpy_dir,
+                    env=self.env)
+        if IS_WINDOWS:
+            shutil.copy(self.bpy_dir / f'bin/{BPY_BINARY}', BL_DIR)
+        if cache:
+            cache.put(key[0], BL_DIR, key[1])
+
+        self.install_scripts()
+        install_helpers(BL_DIR)
+
+    def install_scripts(self) -> None:
+        '''
+        windows bpy.pyd finds the scripts next to python.exe
+        '''
         def get_dir():
             for f in BL_DIR.iterdir():
                 if f.is_dir() and re.match(r'\d.\d+', f.name):
                     return f
 
         bl_scripts = get_dir()
-        if bl_scripts:
+        # on linux bpy.so finds the scripts next to itself
+        if bl_scripts and IS_WINDOWS:
             src = bl_scripts
             dst = PY_DIR / bl_scripts.name
             if dst.exists():
@@ -273,32 +582,36 @@ class Builder:
             print(f'copy {src} to {dst}')
             shutil.copytree(src, dst)
 
-        shutil.copy(self.bpy_dir / 'bin/bpy.pyd', BL_DIR)
-
 
 def main():
     if sys.version_info.major != 3:
         raise Exception()
 
-    try:
-        run_command('git --version')
-    except FileNotFoundError as ex:
-        print(ex)
-        return
-    try:
-        run_command('svn --version --quiet')
-    except FileNotFoundError as ex:
-        print(ex)
-        return
-
-    get_msbuild()
-    get_cmake()
-
     parser = argparse.ArgumentParser('blender module builder')
     parser.add_argument("--update", action='store_true')
     parser.add_argument("--clean", action='store_true')
     parser.add_argument("--bpy", action='store_true')
     parser.add_argument("--bin", action='store_true')
+    parser.add_argument("--pgo",
+                        action='store_true',
+                        help='profile guided build of bpy')
+    parser.add_argument("--train",
+                        nargs='*',
+                        default=[],
+                        help='.blend files rendered in the pgo training')
+    parser.add_argument("--cache",
+                        default=os.environ.get('BPY_ARTIFACT_CACHE', ''),
+                        help='artifact cache directory. skips the bpy build on a hit')
+    parser.add_argument("--cache-size",
+                        default=os.environ.get('BPY_ARTIFACT_CACHE_SIZE',
+                                               artifact_cache.DEFAULT_SIZE))
+    parser.add_argument("--adaptive",
+                        action='store_true',
+                        help='size and throttle build jobs by memory')
+    parser.add_argument("--jobs",
+                        type=int,
+                        default=4,
+                        help='steps running at the same time')
     parser.add_argument("workspace")
     parser.add_argument("tag")
     try:
@@ -307,24 +620,105 @@ def main():
         print(ex)
         parser.print_help()
         sys.exit(1)
+    if parsed.pgo and IS_WINDOWS:
+        parser.error('--pgo: msvc is not supported, clang or gcc only')
 
     print(parsed)
+    if not IS_WINDOWS:
+        print(f'linker: {get_linker() or "default"}')
     builder = Builder(parsed.tag, pathlib.Path(parsed.workspace),
-                      get_console_encoding())
+                      get_console_encoding(), parsed.adaptive)
+
+    steps = [
+        Step('git --version', lambda: run_command('git --version')),
+        Step('svn --version', lambda: run_command('svn --version --quiet')),
+        Step('cmake', get_cmake),
+    ]
+    if IS_WINDOWS:
+        steps.append(Step('msbuild', get_msbuild))
+    probes = tuple(step.name for step in steps)
+
+    # configure needs the libraries, install needs the addons
+    sources = probes
+    installs: Tuple[str, ...] = ()
     if parsed.update:
-        builder.git()
-        builder.svn()
+        steps += [
+            Step('git', builder.git, probes),
+            Step('submodules', builder.submodules, ('git', )),
+            Step('svn', builder.svn, ('git', )),
+        ]
+        sources = ('git', 'svn')
+        installs = ('submodules', )
+
     if parsed.clean:
-        builder.clear(builder.bpy_dir)
-        builder.clear(builder.bin_dir)
+        # both, with or without --bpy and --bin
+        steps += [
+            Step('bpy clean', lambda: builder.clear(builder.bpy_dir), probes),
+            Step('bin clean', lambda: builder.clear(builder.bin_dir), probes),
+        ]
+
     if parsed.bpy:
-        dir = builder.cmake(is_bpy=True)
-        builder.build(dir)
-        builder.install_bpy()
+        cache = None
+        if parsed.cache:
+            cache = artifact_cache.ArtifactCache(
+                pathlib.Path(parsed.cache),
+                artifact_cache.parse_size(parsed.cache_size))
+
+        @functools.lru_cache(maxsize=None)
+        def key() -> Tuple[str, dict]:
+            # after git, the tag may be fetched by the update
+            return builder.artifact_key(parsed.pgo) if cache else ('', {})
+
+        @functools.lru_cache(maxsize=None)
+        def hit() -> bool:
+            # once. configure, build and install agree on it
+            if cache and cache.has(key()[0]):
+                print(f'artifact cache has {key()[0][:12]}. skip the build')
+                return True
+            return False
+
+        deps = sources
+        if parsed.clean:
+            deps += ('bpy clean', )
+        if parsed.pgo:
+            steps.append(
+                Step('bpy pgo',
+                     lambda: hit() or builder.pgo(parsed.train),
+                     deps,
+                     lock='build'))
+            built = 'bpy pgo'
+        else:
+            steps += [
+                Step('bpy configure',
+                     lambda: hit() or builder.cmake(is_bpy=True), deps),
+                Step('bpy build',
+                     lambda: hit() or builder.build(builder.bpy_dir),
+                     ('bpy configure', ),
+                     lock='build'),
+            ]
+            built = 'bpy build'
+        steps.append(
+            Step('bpy install', lambda: builder.install_bpy(cache, key(), hit()),
+                 (built, ) + installs))
+
     if parsed.bin:
-        dir = builder.cmake(is_bpy=False)
-        builder.build(dir)
-        builder.install_bin()
+        deps = sources
+        if parsed.clean:
+            deps += ('bin clean', )
+        steps += [
+            Step('bin configure', lambda: builder.cmake(is_bpy=False), deps),
+            Step('bin build',
+                 lambda: builder.build(builder.bin_dir), ('bin configure', ),
+                 lock='build'),
+            Step('bin install', builder.install_bin,
+                 ('bin build', ) + installs),
+        ]
+
+    try:
+        run_steps(steps, parsed.jobs)
+    except FileNotFoundError as ex:
+        print(ex)
+        sys.exit(1)
 
 
 if __name__ == '__main__':
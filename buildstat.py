@@ -0,0 +1,323 @@
+'''
+compile and link launcher that records wall time and peak memory of each job
+
+with --throttle a job waits until the memory it needed last time is available.
+the running jobs reserve their expected peak, minus what they already use.
+
+    cmake -DCMAKE_CXX_LINKER_LAUNCHER="python;buildstat.py;bpy/buildstat.jsonl" ...
+    cmake -DCMAKE_CXX_COMPILER_LAUNCHER="python;buildstat.py;--throttle;bpy/buildstat.jsonl" ...
+    python buildstat.py report bpy/buildstat.jsonl
+    # fold the records into bpy/buildstat.history.json
+    python buildstat.py history bpy/buildstat.jsonl
+'''
+import json
+import os
+import pathlib
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# kept free for the rest of the system
+RESERVE = 1 << 30
+# a job without history
+DEFAULT_COMPILE_MEMORY = 1 << 30
+DEFAULT_LINK_MEMORY = 6 << 30
+# the throttle gives up waiting and runs the job
+MAX_WAIT = 600
+
+
+def output_of(cmd: List[str]) -> str:
+    for i, arg in enumerate(cmd):
+        if arg == '-o' and i + 1 < len(cmd):
+            return cmd[i + 1]
+        if arg.startswith('-o') and len(arg) > 2:
+            return arg[2:]
+    return ''
+
+
+def kind_of(cmd: List[str]) -> str:
+    return 'compile' if '-c' in cmd else 'link'
+
+
+def available_memory() -> int:
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def total_memory() -> int:
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def process_children() -> Dict[int, List[int]]:
+    '''
+    ppid => pids, from one walk of /proc
+    '''
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # pid (comm) state ppid. comm may contain spaces
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def tree_rss(root: int, children: Optional[Dict[int, List[int]]] = None) -> int:
+    '''
+    resident memory of root and its descendants. gcc runs cc1plus as a child
+    '''
+    if children is None:
+        children = process_children()
+    page = os.sysconf('SC_PAGE_SIZE')
+    rss = 0
+    stack = [root]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                rss += int(f.read().split()[1]) * page
+        except (OSError, IndexError, ValueError):
+            pass
+        stack.extend(children.get(pid, []))
+    return rss
+
+
+def history_path(log: pathlib.Path) -> pathlib.Path:
+    return log.with_name(log.stem + '.history.json')
+
+
+def read_history(log: pathlib.Path) -> Dict[str, List[Any]]:
+    '''
+    output => [kind, peak, seconds]
+    '''
+    try:
+        return json.loads(history_path(log).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+class Throttle:
+    '''
+    admission of jobs sharing a build dir. flock serializes the decisions
+    '''
+    def __init__(self, log: pathlib.Path):
+        self.dir = log.with_name('.buildstat')
+        self.dir.mkdir(exist_ok=True)
+        self.lock_path = self.dir / 'lock'
+        self.mine = self.dir / str(os.getpid())
+
+    def outstanding(self) -> Tuple[int, int]:
+        '''
+        (reserved but not yet used, running jobs)
+        '''
+        total = 0
+        running = 0
+        # one walk of /proc for all the running jobs, the lock is held meanwhile
+        children: Optional[Dict[int, List[int]]] = None
+        for path in self.dir.iterdir():
+            if not path.name.isdigit():
+                continue
+            pid = int(path.name)
+            try:
+                os.kill(pid, 0)
+                estimate = int(path.read_text())
+            except (ProcessLookupError, ValueError):
+                # a killed launcher
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                continue
+            except (PermissionError, FileNotFoundError):
+                continue
+            running += 1
+            if children is None:
+                children = process_children()
+            total += max(0, estimate - tree_rss(pid, children))
+        return total, running
+
+    def acquire(self, estimate: int):
+        import fcntl
+        deadline = time.time() + MAX_WAIT
+        with self.lock_path.open('a') as lock:
+            while True:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                outstanding, running = self.outstanding()
+                free = available_memory() - outstanding - RESERVE
+                if free >= estimate or running == 0 or time.time() > deadline:
+                    self.mine.write_text(str(estimate))
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+                    return
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                # jitter, the waiting jobs do not wake up together
+                time.sleep(0.2 + random.random() * 0.3)
+
+    def release(self):
+        try:
+            self.mine.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def run(log: pathlib.Path, cmd: List[str], throttle: bool = False) -> int:
+    import resource
+    output = output_of(cmd)
+    kind = kind_of(cmd)
+    gate = None
+    waited = 0.0
+    if throttle:
+        known = read_history(log).get(output)
+        estimate = known[1] if known else (DEFAULT_COMPILE_MEMORY if kind
+                                           == 'compile' else DEFAULT_LINK_MEMORY)
+        gate = Throttle(log)
+        start = time.perf_counter()
+        gate.acquire(estimate)
+        waited = time.perf_counter() - start
+    try:
+        start = time.perf_counter()
+        returncode = subprocess.call(cmd)
+        elapsed = time.perf_counter() - start
+    finally:
+        if gate:
+            gate.release()
+    # kilobytes on linux
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    record = {
+        'output': output,
+        'kind': kind,
+        'seconds': round(elapsed, 3),
+        'waited': round(waited, 3),
+        'peak': peak,
+        'returncode': returncode,
+        'time': time.time(),
+    }
+    # one short line per append stays intact between parallel jobs
+    with log.open('a') as w:
+        w.write(json.dumps(record) + '\n')
+    return returncode
+
+
+def read(log: pathlib.Path) -> List[Dict[str, Any]]:
+    if not log.exists():
+        return []
+    records = []
+    for line in log.read_text().splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            pass
+    return records
+
+
+def report(log: pathlib.Path, top: int = 10, since: float = 0) -> None:
+    records = [r for r in read(log) if r['time'] >= since]
+    if not records:
+        return
+    links = [r for r in records if r.get('kind', 'link') == 'link']
+    compiles = [r for r in records if r.get('kind') == 'compile']
+    if compiles:
+        waited = sum(r.get('waited', 0) for r in compiles + links)
+        peak = max(r['peak'] for r in compiles)
+        print(
+            f'{len(compiles)} compiles, largest {peak / (1 << 20):.0f}MB, throttled {waited:.1f}s'
+        )
+    links.sort(key=lambda r: r['seconds'], reverse=True)
+    total = sum(r['seconds'] for r in links)
+    print(f'{len(links)} links, {total:.1f}s')
+    for r in links[:top]:
+        print(
+            f'{r["seconds"]:8.1f}s {r["peak"] / (1 << 20):8.0f}MB  {r["output"]}'
+        )
+
+
+def update_history(log: pathlib.Path) -> Dict[str, List[Any]]:
+    '''
+    the latest peak of each output. the log starts over
+    '''
+    history = read_history(log)
+    for r in read(log):
+        if r['returncode'] == 0 and r['output']:
+            history[r['output']] = [
+                r.get('kind', 'link'), r['peak'], r['seconds']
+            ]
+    path = history_path(log)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(history))
+    os.replace(tmp, path)
+    if log.exists():
+        log.unlink()
+    return history
+
+
+def compile_jobs(log: Optional[pathlib.Path], cpus: int) -> int:
+    '''
+    compile jobs that fit in the available memory, decided when a build starts.
+    a heavy unit is caught by the throttle
+    '''
+    history = read_history(log) if log else {}
+    compile_peaks = sorted(v[1] for v in history.values() if v[0] == 'compile')
+    # the 90th percentile. the few huge units wait for memory
+    compile_memory = compile_peaks[int(len(compile_peaks) * 0.9)] \
+        if compile_peaks else DEFAULT_COMPILE_MEMORY
+    memory = max(0, available_memory() - RESERVE)
+    return max(1, min(cpus, memory // max(compile_memory, 1)))
+
+
+def link_memory(log: Optional[pathlib.Path]) -> int:
+    '''
+    the largest link peak of the history rounded up to GiB, so the pool
+    changes when the links grow, not at every build
+    '''
+    history = read_history(log) if log else {}
+    link_peaks = [v[1] for v in history.values() if v[0] == 'link']
+    if not link_peaks:
+        return DEFAULT_LINK_MEMORY
+    return -(-max(link_peaks) // (1 << 30)) << 30
+
+
+def link_jobs(log: Optional[pathlib.Path], cpus: int) -> int:
+    '''
+    the ninja link pool. from the total memory, it is set at configure time
+    '''
+    return max(1, min(cpus, total_memory() // link_memory(log)))
+
+
+def main():
+    if len(sys.argv) >= 3 and sys.argv[1] == 'report':
+        report(pathlib.Path(sys.argv[2]))
+        return
+    if len(sys.argv) >= 3 and sys.argv[1] == 'history':
+        log = pathlib.Path(sys.argv[2])
+        history = update_history(log)
+        print(f'{len(history)} outputs in {history_path(log)}')
+        cpus = os.cpu_count() or 1
+        print(f'pools: compile={compile_jobs(log, cpus)} link={link_jobs(log, cpus)}')
+        return
+    throttle = len(sys.argv) >= 2 and sys.argv[1] == '--throttle'
+    args = sys.argv[2:] if throttle else sys.argv[1:]
+    if len(args) < 2:
+        print(__doc__)
+        sys.exit(1)
+    sys.exit(run(pathlib.Path(args[0]), args[1:], throttle))
+
+
+if __name__ == '__main__':
+    main()
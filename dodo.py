@@ -1,33 +1,148 @@
+import functools
+import os
 import pathlib
 import site
+import subprocess
+import sys
+import time
+from typing import Dict, List
 
 HERE = pathlib.Path(__file__).absolute().parent
 CLONE_DIR = HERE / 'blender'
+TAG_CACHE = HERE / 'tags/.tags.json'
 
-from git.repo import Repo
+from doit import get_var
+from doit.action import CmdAction
+from doit.tools import config_changed
+from builder import BPY_FLAGS, CONFIGURE_FLAGS, build_jobs, install_helpers, job_pool_define, launcher_define, linker_define
+import artifact_cache
+import buildstat
+import gittags
+import pgo
+import seed_build
 
-REPO = None
-if CLONE_DIR.exists():
-    REPO = Repo(CLONE_DIR)
+# doit tags="v2.93.*" or doit tags=">=2.93,<3.0"
+TAG_FILTER = get_var('tags', '')
+# doit seed=commits or doit seed=files. copy the build of the nearest built tag
+SEED = get_var('seed', '')
+# doit pgo_build pgo_blend=a.blend,b.blend. rendered in the pgo training
+PGO_BLEND = [b for b in get_var('pgo_blend', '').split(',') if b]
+# doit adaptive=1. compile and link pools from memory, jobs wait for memory
+ADAPTIVE = bool(get_var('adaptive', ''))
+# doit artifacts=/shared/bpy-cache. installs are served from and stored to the cache
+ARTIFACTS = get_var('artifacts', os.environ.get('BPY_ARTIFACT_CACHE', ''))
+# doit artifacts_size=20G. lru bound of the artifact cache
+ARTIFACTS_SIZE = get_var('artifacts_size',
+                         os.environ.get('BPY_ARTIFACT_CACHE_SIZE', artifact_cache.DEFAULT_SIZE))
 
-from doit.action import CmdAction
 
-CONFIGURE_FLAGS = ' '.join([
-    '-DCMAKE_BUILD_TYPE=Release',
-    '-DWITH_INTERNATIONAL=OFF',
-    '-DWITH_INPUT_NDOF=OFF',
-    '-DWITH_CYCLES=OFF',
-    '-DWITH_OPENVDB=OFF',
-    '-DWITH_LIBMV=OFF',
-    '-DWITH_MEM_JEMALLOC=OFF',
-])
+@functools.lru_cache(maxsize=None)
+def get_tags() -> List[str]:
+    '''
+    read once per doit run from a cache that follows packed-refs
+    '''
+    return gittags.filter_tags(gittags.cached_tags(CLONE_DIR, TAG_CACHE),
+                               TAG_FILTER)
+
+
+def bpy_binary(tag: str) -> pathlib.Path:
+    '''
+    the bpy module became a package in 3.4
+    '''
+    version = gittags.parse_version(tag)
+    bin_dir = HERE / f'tags/{tag}/bpy/bin'
+    if version and version >= (3, 4, 0):
+        return bin_dir / 'bpy/__init__.so'
+    return bin_dir / 'bpy.so'
+
+
+@functools.lru_cache(maxsize=None)
+def get_commits() -> Dict[str, str]:
+    '''
+    tag => commit from the same cache as get_tags. no git per tag
+    '''
+    return gittags.cached_commits(CLONE_DIR, TAG_CACHE)
+
+
+def get_artifacts() -> artifact_cache.ArtifactCache:
+    return artifact_cache.ArtifactCache(pathlib.Path(ARTIFACTS),
+                                        artifact_cache.parse_size(ARTIFACTS_SIZE))
+
+
+@functools.lru_cache(maxsize=None)
+def artifact_key(tag: str):
+    return artifact_cache.cache_key(
+        get_commits()[tag], f'{CONFIGURE_FLAGS} {BPY_FLAGS} {linker_define()}')
+
+
+@functools.lru_cache(maxsize=None)
+def artifact_hit(tag: str) -> bool:
+    '''
+    a hit skips configure and compile. decided once per doit run
+    '''
+    if not ARTIFACTS:
+        return False
+    return get_artifacts().has(artifact_key(tag)[0])
+
+
+def store_artifact(tag: str, install: pathlib.Path):
+    key, inputs = artifact_key(tag)
+    get_artifacts().put(key, install, inputs)
+
+
+def restore_artifact(tag: str, install: pathlib.Path):
+    key, _inputs = artifact_key(tag)
+    if not get_artifacts().get(key, install):
+        raise Exception(f'{tag}: artifact {key[:12]} was evicted. run again')
+    install_helpers(install)
+
+
+@functools.lru_cache(maxsize=None)
+def pgo_compiler() -> str:
+    '''
+    c++ --version once, from the actions and uptodate checks. not at task load
+    '''
+    return pgo.detect_compiler()
+
+
+def pgo_flags(phase: str, base_dir: pathlib.Path) -> str:
+    return f'{CONFIGURE_FLAGS} {BPY_FLAGS} {job_pool_define(base_dir / "bpy_pgo")} {pgo.pgo_define(phase, pgo_compiler(), base_dir / "pgo")}'
+
 
-BPY_FLAGS = ' '.join([
-    '-DWITH_PYTHON_INSTALL=OFF', '-DWITH_PYTHON_INSTALL_NUMPY=OFF',
-    '-DWITH_PYTHON_MODULE=ON'
-])
+def pgo_flags_changed(phase: str, base_dir: pathlib.Path):
+    '''
+    config_changed of pgo_flags, computed when doit checks the task
+    '''
+    def uptodate(task, values):
+        flags = pgo_flags(phase, base_dir)
+        task.value_savers.append(lambda: {'pgo_flags': flags})
+        return values.get('pgo_flags') == flags
 
-if not REPO:
+    return uptodate
+
+
+def pgo_train(base_dir: pathlib.Path):
+    pgo.train(base_dir / 'bpy_pgo_train', base_dir / 'pgo', PGO_BLEND, 20, pgo_compiler())
+
+
+def touch(path: pathlib.Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+
+def ninja_uptodate(build_dir: pathlib.Path) -> bool:
+    '''
+    dry run. cheap compared to cmake --build with nothing to do
+    '''
+    if not (build_dir / 'build.ninja').exists():
+        return False
+    p = subprocess.run(['ninja', '-C', str(build_dir), '-n'],
+                       stdout=subprocess.PIPE,
+                       stderr=subprocess.STDOUT)
+    return p.returncode == 0 and b'no work to do' in p.stdout
+
+
+if not CLONE_DIR.exists():
 
     def task_clone():
         return {
@@ -40,49 +155,255 @@ if not REPO:
 else:
 
     def task__worktree():
-        for tag in REPO.tags:
-            base_dir = HERE / f'tags/{tag.name}'
+        for tag in get_tags():
+            base_dir = HERE / f'tags/{tag}'
             worktree = base_dir / 'blender'
-            action = {
+            yield {
                 'name':
-                tag.name,
+                tag,
                 'actions': [
-                    CmdAction(f'git worktree add {worktree} {tag.name}',
+                    CmdAction(f'git worktree add {worktree} {tag}',
                               cwd=CLONE_DIR),
                     CmdAction(f'git submodule update --init', cwd=worktree)
                 ],
+                # a worktree stays at its tag
                 'uptodate': [True],
-                'targets':
-                [worktree / 'release/scripts/addons/io_scene_obj/__init__.py']
+                'targets': [
+                    worktree / '.git',
+                    worktree / 'release/scripts/addons/io_scene_obj/__init__.py'
+                ]
+            }
+
+    def task_bpy_configure():
+        for tag in get_tags():
+            base_dir = HERE / f'tags/{tag}'
+            if artifact_hit(tag):
+                yield {'name': tag, 'actions': None}
+                continue
+            actions = []
+            if SEED:
+                actions.append(
+                    (seed_build.seed_from_nearest, [tag, get_tags(), SEED]))
+            # mold or lld, a link pool sized by memory, link time and peak RAM
+            build_dir = base_dir / 'bpy'
+            build_flags = f'{linker_define()} {job_pool_define(build_dir)} {launcher_define(build_dir, ADAPTIVE)}'
+            actions.append(
+                CmdAction(
+                    f'cmake -S blender -B bpy -G Ninja {CONFIGURE_FLAGS} {BPY_FLAGS} {build_flags}',
+                    cwd=base_dir))
+            yield {
+                'name': tag,
+                'task_dep': [f'_worktree:{tag}'],
+                'file_dep': [base_dir / 'blender/CMakeLists.txt'],
+                'targets': [base_dir / 'bpy/CMakeCache.txt'],
+                'uptodate': [
+                    config_changed(f'{CONFIGURE_FLAGS} {BPY_FLAGS} {build_flags}')
+                ],
+                'verbosity': 2,
+                'actions': actions,
+            }
+
+    def task_bpy_compile():
+        for tag in get_tags():
+            base_dir = HERE / f'tags/{tag}'
+            if artifact_hit(tag):
+                yield {'name': tag, 'actions': None}
+                continue
+            yield {
+                'name': tag,
+                'task_dep': [f'bpy_configure:{tag}'],
+                'targets': [bpy_binary(tag)],
+                'uptodate': [(ninja_uptodate, [base_dir / 'bpy'])],
+                'verbosity': 2,
+                'actions': [
+                    # adaptive -j from the memory available when the compile starts
+                    CmdAction(lambda base_dir=base_dir: f'cmake --build bpy {build_jobs(base_dir / "bpy", ADAPTIVE)}',
+                              cwd=base_dir),
+                    (buildstat.report, [base_dir / 'bpy/buildstat.jsonl'], {
+                        'since': time.time()
+                    }),
+                ] + ([(buildstat.update_history,
+                       [base_dir / 'bpy/buildstat.jsonl'])] if ADAPTIVE else []),
+            }
+
+    def task_bpy_install():
+        for tag in get_tags():
+            base_dir = HERE / f'tags/{tag}'
+            install = base_dir / 'bpy_install'
+            if artifact_hit(tag):
+                yield {
+                    'name': tag,
+                    'targets': [install],
+                    'uptodate': [config_changed(artifact_key(tag)[0])],
+                    'verbosity': 2,
+                    'actions': [(restore_artifact, [tag, install])],
+                }
+                continue
+            actions = [
+                CmdAction(
+                    f'cmake --install bpy --config Release --prefix {install}',
+                    cwd=base_dir)
+            ]
+            if ARTIFACTS:
+                actions.append((store_artifact, [tag, install]))
+            actions.append((install_helpers, [install]))
+            yield {
+                'name': tag,
+                'task_dep': [f'bpy_compile:{tag}'],
+                'file_dep': [bpy_binary(tag)],
+                'targets': [base_dir / 'bpy/install_manifest.txt'],
+                'verbosity': 2,
+                'actions': actions,
             }
-            yield action
 
     def task_bpy_build():
+        '''
+        link a tag's install to the user site-packages
+        '''
         user_site = pathlib.Path(site.getusersitepackages())
         pth = user_site / 'blender.pth'
         dst = user_site / 'bpy'
-        for tag in REPO.tags:
-            base_dir = HERE / f'tags/{tag.name}'
-            install = base_dir / 'bpy_install'
+        for tag in get_tags():
+            install = HERE / f'tags/{tag}/bpy_install'
             yield {
                 'name':
-                tag.name,
-                'task_dep': [f'_worktree:{tag.name}'],
+                tag,
+                'task_dep': [f'bpy_install:{tag}'],
+                'uptodate': [
+                    lambda install=install: pth.exists() and dst.is_symlink()
+                    and dst.resolve() == install.resolve()
+                ],
                 'verbosity':
                 2,
                 'actions': [
+                    f'echo bpy > {pth}',
+                    f'ln -sfn {install} {dst}',
+                ],
+            }
+
+    def task_pgo_instrument():
+        '''
+        instrumented bpy in tags/TAG/bpy_pgo, installed to bpy_pgo_train
+        '''
+        for tag in get_tags():
+            base_dir = HERE / f'tags/{tag}'
+            profile = base_dir / 'pgo'
+            install = base_dir / 'bpy_pgo_train'
+            yield {
+                'name': tag,
+                'task_dep': [f'_worktree:{tag}'],
+                'targets': [profile / 'instrumented'],
+                'uptodate': [pgo_flags_changed('instrument', base_dir)],
+                'verbosity': 2,
+                'actions': [
+                    CmdAction(lambda base_dir=base_dir: f'cmake -S blender -B bpy_pgo -G Ninja {pgo_flags("instrument", base_dir)}',
+                              cwd=base_dir),
+                    CmdAction(f'cmake --build bpy_pgo', cwd=base_dir),
                     CmdAction(
-                        f'cmake -S blender -B bpy -G Ninja {CONFIGURE_FLAGS} {BPY_FLAGS}',
+                        f'cmake --install bpy_pgo --config Release --prefix {install}',
                         cwd=base_dir),
-                    CmdAction(f'cmake --build bpy', cwd=base_dir),
+                    (install_helpers, [install]),
+                    (touch, [profile / 'instrumented']),
+                ],
+            }
+
+    def task_pgo_train():
+        for tag in get_tags():
+            base_dir = HERE / f'tags/{tag}'
+            profile = base_dir / 'pgo'
+            yield {
+                'name':
+                tag,
+                'file_dep': [profile / 'instrumented'] + PGO_BLEND,
+                'targets': [profile / 'trained'],
+                'verbosity':
+                2,
+                'actions': [
+                    # profiles of an older instrumented build
                     CmdAction(
-                        f'cmake --install bpy --config Release --prefix {install}',
+                        f'find {profile} -name "*.gcda" -delete -o -name "*.profraw" -delete'
+                    ),
+                    (pgo_train, [base_dir]),
+                    (touch, [profile / 'trained']),
+                ],
+            }
+
+    def task_pgo_build():
+        '''
+        rebuild tags/TAG/bpy_pgo with the profile, installed to bpy_pgo_install
+        '''
+        for tag in get_tags():
+            base_dir = HERE / f'tags/{tag}'
+            profile = base_dir / 'pgo'
+            install = base_dir / 'bpy_pgo_install'
+            yield {
+                'name': tag,
+                'file_dep': [profile / 'trained'],
+                'targets': [profile / 'optimized'],
+                'uptodate': [pgo_flags_changed('use', base_dir)],
+                'verbosity': 2,
+                'actions': [
+                    CmdAction(lambda base_dir=base_dir: f'cmake -S blender -B bpy_pgo -G Ninja {pgo_flags("use", base_dir)}',
+                              cwd=base_dir),
+                    CmdAction(f'cmake --build bpy_pgo', cwd=base_dir),
+                    CmdAction(
+                        f'cmake --install bpy_pgo --config Release --prefix {install}',
                         cwd=base_dir),
-                    f'echo bpy > {pth}',
-                    f'ln -s {install} {dst}',
+                    (install_helpers, [install]),
+                    (touch, [profile / 'optimized']),
+                ],
+            }
+
+    def task_pgo_compare():
+        '''
+        training workload throughput of the release and the pgo install
+        '''
+        for tag in get_tags():
+            base_dir = HERE / f'tags/{tag}'
+            report = base_dir / 'pgo/report.json'
+            yield {
+                'name':
+                tag,
+                'task_dep': [f'bpy_install:{tag}'],
+                'file_dep': [base_dir / 'pgo/optimized'],
+                'targets': [report],
+                'verbosity':
+                2,
+                'actions': [
+                    f'{sys.executable} {HERE / "pgo.py"} compare {base_dir / "bpy_install"} {base_dir / "bpy_pgo_install"} --report {report} --blend {" ".join(PGO_BLEND)}'
+                ],
+            }
+
+    def task_bpy_size():
+        '''
+        size and load cost of bpy per static library and WITH_* flag
+        '''
+        for tag in get_tags():
+            base_dir = HERE / f'tags/{tag}'
+            report = base_dir / 'size.json'
+            yield {
+                'name': tag,
+                'task_dep': [f'bpy_install:{tag}'],
+                'file_dep': [bpy_binary(tag)],
+                'targets': [report],
+                'verbosity': 2,
+                'actions': [
+                    f'{sys.executable} {HERE / "bpy_size.py"} {base_dir / "bpy"} --install {base_dir / "bpy_install"} --json {report}'
                 ],
             }
 
+    def task_perf_suite():
+        '''
+        procedural workloads on the tags already installed, appended to perf/history.jsonl.
+        builds nothing, perf_suite.py finds the installs
+        '''
+        return {
+            'verbosity': 2,
+            'actions': [
+                f'{sys.executable} {HERE / "perf_suite.py"} run --tags "{TAG_FILTER}"'
+            ],
+        }
+
     DOIT_CONFIG = {
         'default_tasks': [],
     }
@@ -0,0 +1,186 @@
+'''
+tag names of a git clone without walking the refs through GitPython
+
+the list and the commits of the tags are cached in a json file and read
+again only when packed-refs or refs/tags change.
+'''
+import fnmatch
+import json
+import operator
+import os
+import pathlib
+import re
+import subprocess
+from typing import Callable, Dict, List, Optional, Tuple
+
+VERSION_PATTERN = re.compile(r'^v?(\d+)\.(\d+)(?:\.(\d+))?')
+CONSTRAINT_PATTERN = re.compile(r'^(>=|<=|==|!=|>|<)\s*(.+)$')
+OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+}
+
+
+def parse_version(tag: str) -> Optional[Tuple[int, int, int]]:
+    '''
+    v2.93.5 => (2, 93, 5)
+    '''
+    m = VERSION_PATTERN.match(tag)
+    if not m:
+        return None
+    return (int(m[1]), int(m[2]), int(m[3] or 0))
+
+
+def sort_key(tag: str):
+    version = parse_version(tag)
+    return (0, version, tag) if version else (1, (0, 0, 0), tag)
+
+
+def read_tags(clone: pathlib.Path) -> List[str]:
+    git_dir = clone / '.git'
+    tags = set()
+    packed = git_dir / 'packed-refs'
+    if packed.exists():
+        for line in packed.read_text().splitlines():
+            # "sha refs/tags/NAME", peeled lines start with ^
+            if line.startswith('#') or line.startswith('^'):
+                continue
+            _sha, _, ref = line.partition(' ')
+            if ref.startswith('refs/tags/'):
+                tags.add(ref[len('refs/tags/'):])
+    loose = git_dir / 'refs/tags'
+    if loose.exists():
+        for path in loose.rglob('*'):
+            if path.is_file():
+                tags.add(path.relative_to(loose).as_posix())
+    return sorted(tags, key=sort_key)
+
+
+def read_commits(clone: pathlib.Path) -> Dict[str, str]:
+    '''
+    tag => commit, annotated tags peeled.
+    packed-refs has them with the peeled lines. loose tags, or a packed-refs
+    written without peeling, take one git for-each-ref for all tags
+    '''
+    git_dir = clone / '.git'
+    commits: Dict[str, str] = {}
+    packed = git_dir / 'packed-refs'
+    peeled = False
+    if packed.exists():
+        name = ''
+        for line in packed.read_text().splitlines():
+            if line.startswith('#'):
+                peeled = 'fully-peeled' in line
+                continue
+            if line.startswith('^'):
+                # the commit of the annotated tag above
+                if name:
+                    commits[name] = line[1:]
+                continue
+            sha, _, ref = line.partition(' ')
+            name = ref[len('refs/tags/'):] if ref.startswith('refs/tags/') else ''
+            if name:
+                commits[name] = sha
+    loose = git_dir / 'refs/tags'
+    if peeled and not (loose.exists() and any(p.is_file() for p in loose.rglob('*'))):
+        return commits
+    out = subprocess.run(
+        ['git', 'for-each-ref', '--format=%(refname) %(objectname) %(*objectname)', 'refs/tags'],
+        cwd=clone,
+        check=True,
+        stdout=subprocess.PIPE).stdout.decode('utf-8')
+    commits = {}
+    for line in out.splitlines():
+        ref, sha, *peel = line.split()
+        commits[ref[len('refs/tags/'):]] = peel[0] if peel else sha
+    return commits
+
+
+def refs_key(clone: pathlib.Path) -> List[int]:
+    '''
+    mtimes that change when a tag is added or removed
+    '''
+    git_dir = clone / '.git'
+    key = []
+    packed = git_dir / 'packed-refs'
+    key.append(packed.stat().st_mtime_ns if packed.exists() else 0)
+    loose = git_dir / 'refs/tags'
+    if loose.exists():
+        for root, _dirs, _files in os.walk(loose):
+            key.append(os.stat(root).st_mtime_ns)
+    return key
+
+
+def cached_refs(clone: pathlib.Path, cache: pathlib.Path) -> dict:
+    '''
+    {'key': refs_key, 'tags': read_tags, 'commits': read_commits}
+    '''
+    key = refs_key(clone)
+    try:
+        data = json.loads(cache.read_text())
+        if data['key'] == key and 'commits' in data:
+            return data
+    except (OSError, ValueError, KeyError):
+        pass
+    data = {'key': key, 'tags': read_tags(clone), 'commits': read_commits(clone)}
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache.with_name(f'.{cache.name}.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, cache)
+    return data
+
+
+def cached_tags(clone: pathlib.Path, cache: pathlib.Path) -> List[str]:
+    return cached_refs(clone, cache)['tags']
+
+
+def cached_commits(clone: pathlib.Path, cache: pathlib.Path) -> Dict[str, str]:
+    return cached_refs(clone, cache)['commits']
+
+
+def make_filter(spec: str) -> Callable[[str], bool]:
+    '''
+    comma separated globs and version constraints.
+    a tag matches any glob and every constraint
+
+        v2.93.*
+        >=2.93,<3.0
+        v2.9*,!=2.93.0
+    '''
+    globs: List[str] = []
+    constraints = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        m = CONSTRAINT_PATTERN.match(item)
+        if m:
+            version = parse_version(m[2])
+            if not version:
+                raise Exception(f'invalid version: {item}')
+            constraints.append((OPERATORS[m[1]], version))
+        else:
+            globs.append(item)
+
+    def match(tag: str) -> bool:
+        if globs and not any(fnmatch.fnmatchcase(tag, g) for g in globs):
+            return False
+        if constraints:
+            version = parse_version(tag)
+            if not version:
+                return False
+            return all(op(version, v) for op, v in constraints)
+        return True
+
+    return match
+
+
+def filter_tags(tags: List[str], spec: str) -> List[str]:
+    if not spec:
+        return tags
+    match = make_filter(spec)
+    return [tag for tag in tags if match(tag)]
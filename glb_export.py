@@ -0,0 +1,323 @@
+'''
+streaming glb export for headless pipelines
+
+mesh data is read with bpy_numpy into buffers reused across objects and
+appended to a spooled BIN chunk, only the json is kept in memory.
+face corners become vertices, no vertex welding.
+
+    import glb_export
+    glb_export.export_scene('out.glb')
+
+    python glb_export.py out.glb --blend scene.blend
+    # against the obj exporter
+    python glb_export.py out.glb --bench
+'''
+import argparse
+import json
+import os
+import pathlib
+import shutil
+import struct
+import tempfile
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy
+
+import bpy_numpy
+
+GLB_MAGIC = 0x46546C67
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+FLOAT = 5126
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+# blender z up => gltf y up
+Z_UP = [-0.7071068, 0.0, 0.0, 0.7071068]
+# BIN chunk in memory up to this size, then a temporary file
+SPOOL_SIZE = 64 << 20
+
+
+class GlbWriter:
+    '''
+    accessors are appended as they come. the BIN chunk is copied behind
+    the json on close, when every offset is known
+    '''
+    def __init__(self, path: pathlib.Path, spool_size: int = SPOOL_SIZE):
+        self.path = path
+        self.bin = tempfile.SpooledTemporaryFile(max_size=spool_size,
+                                                 dir=path.parent)
+        self.offset = 0
+        self.gltf: Dict[str, Any] = {
+            'asset': {
+                'version': '2.0',
+                'generator': 'bpy glb_export'
+            },
+            'scene': 0,
+            'scenes': [{
+                'nodes': [0]
+            }],
+            'nodes': [{
+                'name': 'Z_UP',
+                'rotation': Z_UP,
+                'children': []
+            }],
+            'meshes': [],
+            'accessors': [],
+            'bufferViews': [],
+            'buffers': [],
+        }
+
+    def add_view(self, array: numpy.ndarray, target: int) -> int:
+        pad = (4 - self.offset % 4) % 4
+        if pad:
+            self.bin.write(b'\0' * pad)
+            self.offset += pad
+        # the buffer protocol, no bytes copy
+        data = memoryview(numpy.ascontiguousarray(array)).cast('B')
+        self.bin.write(data)
+        views = self.gltf['bufferViews']
+        views.append({
+            'buffer': 0,
+            'byteOffset': self.offset,
+            'byteLength': data.nbytes,
+            'target': target,
+        })
+        self.offset += data.nbytes
+        return len(views) - 1
+
+    def add_accessor(self,
+                     array: numpy.ndarray,
+                     type: str,
+                     component: int,
+                     target: int = ARRAY_BUFFER,
+                     bounds: bool = False) -> int:
+        accessor: Dict[str, Any] = {
+            'bufferView': self.add_view(array, target),
+            'componentType': component,
+            'count': len(array),
+            'type': type,
+        }
+        if bounds and len(array):
+            accessor['min'] = array.min(axis=0).tolist()
+            accessor['max'] = array.max(axis=0).tolist()
+        accessors = self.gltf['accessors']
+        accessors.append(accessor)
+        return len(accessors) - 1
+
+    def add_mesh(self, name: str, positions: numpy.ndarray,
+                 normals: numpy.ndarray, uvs: Optional[numpy.ndarray],
+                 indices: numpy.ndarray) -> int:
+        attributes = {
+            'POSITION':
+            self.add_accessor(positions, 'VEC3', FLOAT, bounds=True),
+            'NORMAL': self.add_accessor(normals, 'VEC3', FLOAT),
+        }
+        if uvs is not None:
+            attributes['TEXCOORD_0'] = self.add_accessor(uvs, 'VEC2', FLOAT)
+        primitive = {
+            'attributes':
+            attributes,
+            'indices':
+            self.add_accessor(indices.reshape(-1), 'SCALAR', UNSIGNED_INT,
+                              ELEMENT_ARRAY_BUFFER),
+        }
+        meshes = self.gltf['meshes']
+        meshes.append({'name': name, 'primitives': [primitive]})
+        return len(meshes) - 1
+
+    def add_node(self, name: str, mesh: int, matrix: numpy.ndarray) -> int:
+        nodes = self.gltf['nodes']
+        # gltf matrices are column major
+        nodes.append({
+            'name': name,
+            'mesh': mesh,
+            'matrix': matrix.T.reshape(-1).tolist()
+        })
+        nodes[0]['children'].append(len(nodes) - 1)
+        return len(nodes) - 1
+
+    def close(self) -> int:
+        pad = (4 - self.offset % 4) % 4
+        self.bin.write(b'\0' * pad)
+        self.offset += pad
+        if self.offset:
+            self.gltf['buffers'].append({'byteLength': self.offset})
+        text = json.dumps(self.gltf, separators=(',', ':')).encode('utf-8')
+        text += b' ' * ((4 - len(text) % 4) % 4)
+        # no BIN chunk without meshes, a buffer of 0 bytes is invalid
+        total = 12 + 8 + len(text) + (8 + self.offset if self.offset else 0)
+
+        tmp = self.path.with_name(f'.{self.path.name}.{os.getpid()}.tmp')
+        with tmp.open('wb') as w:
+            w.write(struct.pack('<III', GLB_MAGIC, 2, total))
+            w.write(struct.pack('<II', len(text), CHUNK_JSON))
+            w.write(text)
+            if self.offset:
+                w.write(struct.pack('<II', self.offset, CHUNK_BIN))
+                self.bin.seek(0)
+                shutil.copyfileobj(self.bin, w, 1 << 20)
+        self.bin.close()
+        os.replace(tmp, self.path)
+        return total
+
+
+class MeshBuffers:
+    '''
+    arrays reused by every mesh. they only grow
+    '''
+    def __init__(self):
+        self.arrays: Dict[str, numpy.ndarray] = {}
+
+    def get(self, name: str, shape: Tuple[int, ...],
+            dtype: Any) -> numpy.ndarray:
+        count = 1
+        for n in shape:
+            count *= n
+        array = self.arrays.get(name)
+        if array is None or array.size < count or array.dtype != dtype:
+            array = numpy.empty(max(count, 1), dtype=dtype)
+            self.arrays[name] = array
+        return array[:count].reshape(shape)
+
+
+def read_mesh(mesh, buffers: MeshBuffers):
+    '''
+    (positions, normals, uvs, indices) per face corner
+    '''
+    mesh.calc_loop_triangles()
+    loops = len(mesh.loops)
+    loop_vertices = bpy_numpy.get_loop_vertices(
+        mesh, buffers.get('loop_vertices', (loops, ), numpy.int32))
+    co = bpy_numpy.get_vertices(
+        mesh, buffers.get('co', (len(mesh.vertices), 3), numpy.float32))
+    positions = buffers.get('positions', (loops, 3), numpy.float32)
+    numpy.take(co, loop_vertices, axis=0, out=positions)
+    normals = bpy_numpy.get_loop_normals(
+        mesh, buffers.get('normals', (loops, 3), numpy.float32))
+    uvs = None
+    if mesh.uv_layers.active:
+        uvs = bpy_numpy.get_uvs(mesh,
+                                out=buffers.get('uvs', (loops, 2),
+                                                numpy.float32))
+        # gltf uv origin is top left
+        uvs[:, 1] = 1.0 - uvs[:, 1]
+    indices = bpy_numpy.foreach_get(
+        mesh.loop_triangles, 'loops', numpy.int32, 3,
+        buffers.get('indices', (len(mesh.loop_triangles), 3), numpy.int32))
+    return positions, normals, uvs, indices.view(numpy.uint32)
+
+
+def export_scene(path,
+                 scene=None,
+                 spool_size: int = SPOOL_SIZE,
+                 depsgraph=None) -> Dict[str, Any]:
+    '''
+    mesh objects of the scene with modifiers applied.
+    depsgraph: the first view layer of scene if None, not the one of the context
+    '''
+    import bpy
+    path = pathlib.Path(path).absolute()
+    scene = scene or bpy.context.scene
+    if depsgraph is None:
+        depsgraph = scene.view_layers[0].depsgraph
+        # evaluated, a scene that is not the context one may never have been
+        depsgraph.update()
+    writer = GlbWriter(path, spool_size)
+    buffers = MeshBuffers()
+    # unmodified meshes are written once per datablock
+    shared: Dict[str, Optional[int]] = {}
+    stats = {'objects': 0, 'meshes': 0, 'triangles': 0, 'corners': 0, 'empty': 0}
+    start = time.perf_counter()
+    for o in scene.objects:
+        if o.type != 'MESH':
+            continue
+        key = '' if o.modifiers else o.data.name
+        if key and key in shared:
+            mesh_index = shared[key]
+        else:
+            mesh_index = None
+            evaluated = o.evaluated_get(depsgraph)
+            mesh = evaluated.to_mesh()
+            try:
+                positions, normals, uvs, indices = read_mesh(mesh, buffers)
+                # no triangles, e.g. loose edges. a bufferView of 0 bytes is invalid
+                if len(indices):
+                    mesh_index = writer.add_mesh(o.data.name, positions, normals,
+                                                 uvs, indices)
+                    stats['meshes'] += 1
+                    stats['triangles'] += len(indices)
+                    stats['corners'] += len(positions)
+            finally:
+                evaluated.to_mesh_clear()
+            if key:
+                shared[key] = mesh_index
+        if mesh_index is None:
+            stats['empty'] += 1
+            continue
+        writer.add_node(o.name, mesh_index,
+                        numpy.array(o.matrix_world, dtype=numpy.float32))
+        stats['objects'] += 1
+    stats['bytes'] = writer.close()
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def export_obj(path: pathlib.Path):
+    '''
+    io_scene_obj before 3.3, the C++ exporter after
+    '''
+    import bpy
+    if hasattr(bpy.ops.wm, 'obj_export'):
+        bpy.ops.wm.obj_export(filepath=str(path))
+        return
+    if not hasattr(bpy.ops.export_scene, 'obj'):
+        bpy.ops.preferences.addon_enable(module='io_scene_obj')
+    bpy.ops.export_scene.obj(filepath=str(path))
+
+
+def benchmark(dst: pathlib.Path, size: int = 300, count: int = 8):
+    '''
+    glb and obj of the loaded scene. a generated one if it has no mesh
+    '''
+    import bpy
+    if not any(o.type == 'MESH' for o in bpy.context.scene.objects):
+        for i in range(count):
+            bpy.ops.mesh.primitive_grid_add(x_subdivisions=size,
+                                            y_subdivisions=size,
+                                            location=(i * 3, 0, 0))
+    print(f'{"":<8}{"seconds":>10}{"MB":>10}{"corners/s":>14}')
+    stats = export_scene(dst)
+    corners = stats['corners']
+    print(
+        f'{"glb":<8}{stats["seconds"]:>10.2f}{stats["bytes"] / (1 << 20):>10.1f}{corners / stats["seconds"]:>14.0f}'
+    )
+    obj = dst.with_suffix('.obj')
+    start = time.perf_counter()
+    export_obj(obj)
+    seconds = time.perf_counter() - start
+    print(
+        f'{"obj":<8}{seconds:>10.2f}{obj.stat().st_size / (1 << 20):>10.1f}{corners / seconds:>14.0f}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser('streaming glb export')
+    parser.add_argument('dst')
+    parser.add_argument('--blend')
+    parser.add_argument('--bench', action='store_true')
+    parsed = parser.parse_args()
+
+    import bpy
+    if parsed.blend:
+        bpy.ops.wm.open_mainfile(filepath=parsed.blend)
+    dst = pathlib.Path(parsed.dst).absolute()
+    if parsed.bench:
+        benchmark(dst)
+    else:
+        print(export_scene(dst))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+'''
+find the commit that made bpy slower
+
+one worktree, bisect/blender, is moved from candidate to candidate and built
+in the single bisect/bpy, so ninja recompiles only what the checkout changed
+and ccache serves the files an earlier candidate already compiled.
+the install of the good commit is kept and the benchmark alternates between
+it and the candidate. slower than good by the threshold and by 3 standard
+errors is bad.
+
+    python perf_bisect.py v4.0.0 v4.1.0 bench.py
+    python perf_bisect.py v4.0.0 v4.1.0 bench.py --runs 9 --threshold 0.1 -- --size 500
+
+the benchmark is a python script run with the install on PYTHONPATH. the last
+line of its stdout is the seconds it measured, otherwise its wall time is taken.
+a non-zero exit skips the commit, as does a failed build.
+measurements go to bisect/results.jsonl, an interrupted bisect resumes.
+'''
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from builder import (BPY_FLAGS, CONFIGURE_FLAGS, install_helpers, job_pool_define,
+                     launcher_define, linker_define)
+from perf_suite import SIGMAS, THRESHOLD, Summary, verdict
+
+HERE = pathlib.Path(__file__).absolute().parent
+CLONE_DIR = HERE / 'blender'
+WORK_DIR = HERE / 'bisect'
+
+
+def git(args: List[str], cwd: pathlib.Path) -> str:
+    return subprocess.run(['git'] + args,
+                          cwd=cwd,
+                          check=True,
+                          stdout=subprocess.PIPE).stdout.decode('utf-8')
+
+
+def ccache_define() -> str:
+    '''
+    compiles of a commit seen before are cache hits. the worktree path
+    does not change, so the hits survive between bisects too
+    '''
+    if not shutil.which('ccache'):
+        return ''
+    return '-DCMAKE_C_COMPILER_LAUNCHER=ccache -DCMAKE_CXX_COMPILER_LAUNCHER=ccache'
+
+
+class Measurement(NamedTuple):
+    commit: str
+    # interleaved runs of the good install and the candidate
+    good: List[float]
+    samples: List[float]
+
+    def verdict(self, threshold: float):
+        return verdict(Summary.of(self.good), Summary.of(self.samples), threshold)
+
+
+class Bisect:
+    '''
+    commits are the first parents from good (excluded) to bad
+    '''
+    def __init__(self, clone: pathlib.Path, work: pathlib.Path, good: str, bad: str,
+                 script: pathlib.Path, args: List[str], runs: int, threshold: float):
+        self.clone = clone
+        self.work = work
+        self.worktree = work / 'blender'
+        self.build_dir = work / 'bpy'
+        self.install = work / 'bpy_install'
+        self.good_install = work / 'good_install'
+        self.good = git(['rev-parse', f'{good}^{{commit}}'], clone).strip()
+        self.bad = git(['rev-parse', f'{bad}^{{commit}}'], clone).strip()
+        self.commits = git(['rev-list', '--first-parent', '--reverse', f'{self.good}..{self.bad}'],
+                           clone).split()
+        self.script = script.absolute()
+        self.args = args
+        self.runs = runs
+        self.threshold = threshold
+        # a result of another script, arguments or good commit is not reused
+        digest = hashlib.sha1(script.read_bytes())
+        digest.update(json.dumps([args, runs, self.good]).encode('utf-8'))
+        self.key = digest.hexdigest()
+        self.results = work / 'results.jsonl'
+
+    #
+    # build
+    #
+    def checkout(self, commit: str):
+        if not (self.worktree / '.git').exists():
+            self.work.mkdir(parents=True, exist_ok=True)
+            git(['worktree', 'add', '--quiet', '--detach', str(self.worktree), commit], self.clone)
+        else:
+            git(['checkout', '--quiet', '--detach', '--force', commit], self.worktree)
+        git(['submodule', 'update', '--init'], self.worktree)
+
+    def configure(self):
+        '''
+        once. ninja reruns cmake when a checkout changes the CMakeLists
+        '''
+        if (self.build_dir / 'CMakeCache.txt').exists():
+            return
+        build_flags = f'{linker_define()} {job_pool_define(self.build_dir)} {launcher_define(self.build_dir)} {ccache_define()}'
+        subprocess.run(
+            f'cmake -S blender -B bpy -G Ninja {CONFIGURE_FLAGS} {BPY_FLAGS} {build_flags}',
+            shell=True,
+            cwd=self.work,
+            check=True)
+
+    def build(self, commit: str) -> bool:
+        '''
+        commit installed to bisect/bpy_install. False if it does not build
+        '''
+        start = time.perf_counter()
+        try:
+            self.checkout(commit)
+            self.configure()
+            subprocess.run(['cmake', '--build', 'bpy'], cwd=self.work, check=True)
+            shutil.rmtree(self.install, ignore_errors=True)
+            subprocess.run(
+                ['cmake', '--install', 'bpy', '--config', 'Release', '--prefix',
+                 str(self.install)],
+                cwd=self.work,
+                check=True)
+        except subprocess.CalledProcessError as ex:
+            print(f'{commit[:10]}: build failed ({ex.returncode})')
+            return False
+        install_helpers(self.install)
+        print(f'{commit[:10]}: built in {time.perf_counter() - start:.0f}s', flush=True)
+        return True
+
+    def prepare_good(self):
+        '''
+        a copy of the good install. candidates move the worktree away from good
+        '''
+        marker = self.good_install / '.commit'
+        if marker.exists() and marker.read_text() == self.good:
+            return
+        if not self.build(self.good):
+            raise Exception(f'good {self.good[:10]} does not build')
+        shutil.rmtree(self.good_install, ignore_errors=True)
+        shutil.copytree(self.install, self.good_install, symlinks=True)
+        marker.write_text(self.good)
+
+    #
+    # measure
+    #
+    def run_script(self, install: pathlib.Path) -> Optional[float]:
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([str(install.absolute()), str(HERE)])
+        start = time.perf_counter()
+        p = subprocess.run([sys.executable, str(self.script)] + self.args,
+                           env=env,
+                           stdout=subprocess.PIPE)
+        seconds = time.perf_counter() - start
+        if p.returncode != 0:
+            return None
+        # bpy prints to stdout too, the result is the last line
+        lines = p.stdout.decode('utf-8', errors='replace').splitlines()
+        try:
+            return float(lines[-1])
+        except (IndexError, ValueError):
+            return seconds
+
+    def read_results(self) -> Dict[str, Optional[Measurement]]:
+        '''
+        commit => measurement, None for a skipped commit
+        '''
+        results: Dict[str, Optional[Measurement]] = {}
+        if not self.results.exists():
+            return results
+        for line in self.results.read_text().splitlines():
+            try:
+                r = json.loads(line)
+            except json.JSONDecodeError:
+                # the line of an interrupted write
+                continue
+            if r['key'] != self.key:
+                continue
+            results[r['commit']] = Measurement(r['commit'], r['good'], r['samples']) if r['samples'] else None
+        return results
+
+    def measure(self, commit: str) -> Optional[Measurement]:
+        result = None
+        if self.build(commit):
+            good: List[float] = []
+            samples: List[float] = []
+            for i in range(self.runs):
+                # alternated. a slow period of the machine hits both
+                order = [(self.good_install, good), (self.install, samples)]
+                for install, dst in (order if i % 2 == 0 else reversed(order)):
+                    seconds = self.run_script(install)
+                    if seconds is not None:
+                        dst.append(seconds)
+            if samples and good:
+                result = Measurement(commit, good, samples)
+            else:
+                print(f'{commit[:10]}: benchmark failed')
+        self.results.parent.mkdir(parents=True, exist_ok=True)
+        with self.results.open('a') as w:
+            w.write(json.dumps({
+                'key': self.key,
+                'commit': commit,
+                'time': time.time(),
+                'good': result.good if result else [],
+                'samples': result.samples if result else [],
+            }) + '\n')
+        return result
+
+    def subject(self, commit: str) -> str:
+        return git(['show', '-s', '--format=%h %s', commit], self.clone).strip()
+
+    def print_measurement(self, m: Measurement, label: str, left: int):
+        change, _direction = m.verdict(self.threshold)
+        summary = Summary.of(m.samples)
+        print(
+            f'[{left} left] {summary.median * 1000:.1f}ms±{summary.mad / summary.median:.0%} {change:+.1%} {label:<4} {self.subject(m.commit)}',
+            flush=True)
+
+    #
+    # search
+    #
+    def run(self) -> Optional[str]:
+        '''
+        the first slow commit. None if bad is not slower or it can not be told
+        '''
+        if not self.commits:
+            print(f'no commits between {self.good[:10]} and {self.bad[:10]}')
+            return None
+        results = self.read_results()
+        self.prepare_good()
+
+        def classify(index: int, left: int) -> Optional[bool]:
+            commit = self.commits[index]
+            if commit in results:
+                m = results[commit]
+            else:
+                m = self.measure(commit)
+                results[commit] = m
+            if m is None:
+                print(f'[{left} left] skip {self.subject(commit)}')
+                return None
+            is_bad = m.verdict(self.threshold)[1] == 'slower'
+            self.print_measurement(m, 'bad' if is_bad else 'good', left)
+            return is_bad
+
+        # the regression has to be there at all
+        if not classify(len(self.commits) - 1, len(self.commits) - 1):
+            print(f'{self.bad[:10]} is not slower than {self.good[:10]} by {self.threshold:.0%}')
+            return None
+
+        # commits[lo] is good (-1: good itself), commits[hi] is bad
+        lo, hi = -1, len(self.commits) - 1
+        skipped: Set[int] = set()
+        while hi - lo > 1:
+            untested = [i for i in range(lo + 1, hi) if i not in skipped]
+            if not untested:
+                break
+            middle = (lo + hi) // 2
+            index = min(untested, key=lambda i: abs(i - middle))
+            is_bad = classify(index, len(untested) - 1)
+            if is_bad is None:
+                skipped.add(index)
+            elif is_bad:
+                hi = index
+            else:
+                lo = index
+
+        first = self.commits[hi]
+        if hi - lo > 1:
+            print('the first slow commit is one of')
+            for commit in self.commits[lo + 1:hi + 1]:
+                print(f'  {self.subject(commit)}')
+            return None
+        print(f'first slow commit: {self.subject(first)}')
+        print(git(['show', '-s', '--stat', first], self.clone))
+        return first
+
+
+def main():
+    parser = argparse.ArgumentParser('first commit that made a benchmark slower')
+    parser.add_argument('good', help='fast ref')
+    parser.add_argument('bad', help='slow ref')
+    parser.add_argument('script', help='python script. prints the seconds on its last line')
+    parser.add_argument('--runs', type=int, default=5, help='runs per commit, as many of good')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--clone', default=str(CLONE_DIR))
+    parser.add_argument('--work', default=str(WORK_DIR), help='worktree, build and results')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='-- ARGS of the script')
+    parsed = parser.parse_args()
+
+    args = parsed.args[1:] if parsed.args[:1] == ['--'] else parsed.args
+    bisect = Bisect(pathlib.Path(parsed.clone), pathlib.Path(parsed.work), parsed.good,
+                    parsed.bad, pathlib.Path(parsed.script), args, parsed.runs,
+                    parsed.threshold)
+    print(f'{len(bisect.commits)} commits, {SIGMAS:.0f} standard errors and {parsed.threshold:.0%}')
+    if not bisect.run():
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+'''
+performance of bpy across tags
+
+procedural workloads run in a child process against each tags/TAG/bpy_install.
+runs are interleaved between tags, so machine noise hits every tag alike.
+results are appended to perf/history.jsonl, the report compares each tag
+with the previous one by median and MAD.
+
+    python perf_suite.py run --tags ">=3.6" --runs 5
+    python perf_suite.py report --threshold 0.05
+    # exit 1 on a regression
+    python perf_suite.py report --fail
+    doit perf_suite tags=">=3.6"
+'''
+import argparse
+import json
+import math
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import gittags
+
+HERE = pathlib.Path(__file__).absolute().parent
+TAGS_DIR = HERE / 'tags'
+HISTORY = HERE / 'perf/history.jsonl'
+# a change below this is noise whatever the statistics say
+THRESHOLD = 0.05
+# the difference of medians has to exceed this many standard errors
+SIGMAS = 3.0
+RENDER_SIZE = 128
+
+
+#
+# workloads. run in the child with bpy of the install in PYTHONPATH.
+# each takes repeat and returns the seconds of its iterations, the scene
+# construction before them is not timed
+#
+def _grid_arrays(n: int):
+    import numpy
+    xs, ys = numpy.meshgrid(numpy.arange(n + 1), numpy.arange(n + 1))
+    co = numpy.zeros(((n + 1) * (n + 1), 3), dtype=numpy.float32)
+    co[:, 0] = xs.reshape(-1)
+    co[:, 1] = ys.reshape(-1)
+    i = numpy.arange(n)
+    corners = (i[None, :] + i[:, None] * (n + 1)).reshape(-1)
+    loops = numpy.stack([corners, corners + 1, corners + n + 2, corners + n + 1],
+                        axis=1).astype(numpy.int32).reshape(-1)
+    return co, loops
+
+
+def workload_mesh_create(repeat: int) -> float:
+    '''
+    meshes built with foreach_set and removed
+    '''
+    import bpy
+    import numpy
+    n = 200
+    co, loops = _grid_arrays(n)
+    count = n * n
+    start = time.perf_counter()
+    for _ in range(repeat):
+        mesh = bpy.data.meshes.new('perf')
+        mesh.vertices.add(len(co))
+        mesh.loops.add(len(loops))
+        mesh.polygons.add(count)
+        mesh.vertices.foreach_set('co', co.reshape(-1))
+        mesh.loops.foreach_set('vertex_index', loops)
+        mesh.polygons.foreach_set('loop_start', numpy.arange(0, len(loops), 4, dtype=numpy.int32))
+        try:
+            mesh.polygons.foreach_set('loop_total', numpy.full(count, 4, dtype=numpy.int32))
+        except (AttributeError, TypeError):
+            # read only since 4.0, derived from loop_start
+            pass
+        mesh.update()
+        bpy.data.meshes.remove(mesh)
+    return time.perf_counter() - start
+
+
+def workload_mesh_access(repeat: int) -> float:
+    '''
+    the loop of the pgo training workload, without the grid it reads
+    '''
+    import pgo
+    mesh = pgo.mesh_setup()
+    start = time.perf_counter()
+    pgo.mesh_access(mesh, repeat)
+    return time.perf_counter() - start
+
+
+def workload_evaluate(repeat: int) -> float:
+    import pgo
+    o = pgo.evaluate_setup(repeat)
+    start = time.perf_counter()
+    pgo.evaluate_frames(o, repeat)
+    return time.perf_counter() - start
+
+
+def _render_scene(engine: str):
+    import bpy
+    scene = bpy.context.scene
+    bpy.ops.mesh.primitive_monkey_add()
+    bpy.context.object.modifiers.new('subsurf', 'SUBSURF').levels = 2
+    bpy.ops.object.light_add(type='SUN', location=(2, -2, 4))
+    bpy.ops.object.camera_add(location=(0, -4, 0.5), rotation=(math.radians(85), 0, 0))
+    scene.camera = bpy.context.object
+    scene.render.engine = engine
+    scene.render.resolution_x = RENDER_SIZE
+    scene.render.resolution_y = RENDER_SIZE
+    scene.render.resolution_percentage = 100
+
+
+def _engine(*candidates: str) -> str:
+    '''
+    the first engine this version has. BLENDER_EEVEE_NEXT in 4.2 to 4.4
+    '''
+    import bpy
+    items = bpy.context.scene.render.bl_rna.properties['engine'].enum_items.keys()
+    for engine in candidates:
+        if engine in items:
+            return engine
+    raise Exception(f'none of {candidates}')
+
+
+def _render(engine: str, repeat: int) -> float:
+    import bpy
+    _render_scene(engine)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        bpy.ops.render.render()
+    return time.perf_counter() - start
+
+
+def workload_workbench(repeat: int) -> float:
+    return _render('BLENDER_WORKBENCH', repeat)
+
+
+def workload_eevee(repeat: int) -> float:
+    '''
+    needs a gpu context, fails on headless machines without one
+    '''
+    return _render(_engine('BLENDER_EEVEE', 'BLENDER_EEVEE_NEXT'), repeat)
+
+
+def workload_save_load(repeat: int) -> float:
+    import bpy
+    for i in range(20):
+        bpy.ops.mesh.primitive_uv_sphere_add(segments=64, ring_count=32, location=(i * 3, 0, 0))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'perf.blend')
+        start = time.perf_counter()
+        for _ in range(repeat):
+            bpy.ops.wm.save_as_mainfile(filepath=path)
+            bpy.ops.wm.open_mainfile(filepath=path)
+        return time.perf_counter() - start
+
+
+WORKLOADS: Dict[str, Callable[[int], float]] = {
+    'mesh_create': workload_mesh_create,
+    'mesh_access': workload_mesh_access,
+    'evaluate': workload_evaluate,
+    'workbench': workload_workbench,
+    'eevee': workload_eevee,
+    'save_load': workload_save_load,
+}
+
+
+def run_workloads(names: List[str], repeat: int) -> Dict[str, Any]:
+    '''
+    name => seconds per iteration. errors under '_errors'
+    '''
+    import bpy
+    result: Dict[str, Any] = {'_version': bpy.app.version_string, '_errors': {}}
+    for name in names:
+        try:
+            # the same empty scene for every workload, then a warm up
+            bpy.ops.wm.read_factory_settings(use_empty=True)
+            WORKLOADS[name](1)
+            bpy.ops.wm.read_factory_settings(use_empty=True)
+            result[name] = WORKLOADS[name](repeat) / repeat
+        except Exception as ex:
+            result['_errors'][name] = f'{type(ex).__name__}: {ex}'
+    return result
+
+
+def run_child(install: pathlib.Path, names: List[str], repeat: int) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([str(install.absolute()), str(HERE)])
+    p = subprocess.run([
+        sys.executable, __file__, 'child', '--repeat',
+        str(repeat), '--workloads', ','.join(names)
+    ],
+                       env=env,
+                       check=True,
+                       stdout=subprocess.PIPE)
+    # bpy prints to stdout too, the result is the last line
+    return json.loads(p.stdout.decode('utf-8').splitlines()[-1])
+
+
+#
+# main process
+#
+def installed_tags(spec: str = '') -> List[str]:
+    if not TAGS_DIR.exists():
+        return []
+    tags = [p.parent.name for p in TAGS_DIR.glob('*/bpy_install') if p.is_dir()]
+    return sorted(gittags.filter_tags(tags, spec), key=gittags.sort_key)
+
+
+def run(tags: List[str], names: List[str], runs: int, repeat: int,
+        history: pathlib.Path) -> str:
+    '''
+    append the samples to history. returns the session id
+    '''
+    session = time.strftime('%Y%m%d-%H%M%S')
+    host = platform.node()
+    history.parent.mkdir(parents=True, exist_ok=True)
+    for i in range(runs):
+        # interleaved. a slow period of the machine is spread over all tags
+        order = tags if i % 2 == 0 else list(reversed(tags))
+        for tag in order:
+            try:
+                result = run_child(TAGS_DIR / tag / 'bpy_install', names, repeat)
+            except subprocess.CalledProcessError as ex:
+                print(f'[{i + 1}/{runs}] {tag}: child failed ({ex.returncode})')
+                continue
+            records = [{
+                'session': session,
+                'time': time.time(),
+                'host': host,
+                'tag': tag,
+                'version': result['_version'],
+                'workload': name,
+                'seconds': result[name],
+            } for name in names if name in result]
+            with history.open('a') as w:
+                for r in records:
+                    w.write(json.dumps(r) + '\n')
+            errors = ', '.join(f'{k}: {v}' for k, v in result['_errors'].items())
+            print(f'[{i + 1}/{runs}] {tag}: {len(records)} workloads {errors}', flush=True)
+    return session
+
+
+def read_history(history: pathlib.Path) -> List[Dict[str, Any]]:
+    if not history.exists():
+        return []
+    records = []
+    for line in history.read_text().splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            pass
+    return records
+
+
+class Summary(NamedTuple):
+    median: float
+    # median absolute deviation, scaled to a standard deviation
+    mad: float
+    n: int
+
+    @staticmethod
+    def of(samples: List[float]) -> 'Summary':
+        median = statistics.median(samples)
+        mad = statistics.median(abs(x - median) for x in samples) * 1.4826
+        return Summary(median, mad, len(samples))
+
+    def error(self) -> float:
+        '''
+        standard error of the median
+        '''
+        return 1.2533 * self.mad / math.sqrt(self.n)
+
+
+def verdict(base: Summary, new: Summary, threshold: float = THRESHOLD,
+            sigmas: float = SIGMAS) -> Tuple[float, str]:
+    '''
+    (relative change of seconds, 'slower' | 'faster' | '')
+    '''
+    change = new.median / base.median - 1
+    noise = sigmas * math.sqrt(base.error()**2 + new.error()**2)
+    if abs(change) < threshold or abs(new.median - base.median) <= noise:
+        return change, ''
+    return change, 'slower' if change > 0 else 'faster'
+
+
+def samples_by_tag(records: List[Dict[str, Any]], host: str,
+                   sessions: int) -> Dict[str, Dict[str, List[float]]]:
+    '''
+    tag => workload => seconds of the last sessions that measured the tag
+    '''
+    by_tag: Dict[str, List[Dict[str, Any]]] = {}
+    for r in records:
+        if r['host'] == host:
+            by_tag.setdefault(r['tag'], []).append(r)
+    result: Dict[str, Dict[str, List[float]]] = {}
+    for tag, rs in by_tag.items():
+        keep = set(sorted({r['session'] for r in rs})[-sessions:])
+        for r in rs:
+            if r['session'] in keep:
+                result.setdefault(tag, {}).setdefault(r['workload'], []).append(r['seconds'])
+    return result
+
+
+def report(history: pathlib.Path, spec: str = '', threshold: float = THRESHOLD,
+           sessions: int = 1, host: Optional[str] = None) -> List[Tuple[str, str, str, float]]:
+    '''
+    print a workload x tag table. returns the regressions (workload, base, tag, change)
+    '''
+    samples = samples_by_tag(read_history(history), host or platform.node(), sessions)
+    tags = sorted(gittags.filter_tags(list(samples), spec), key=gittags.sort_key)
+    if not tags:
+        print(f'no samples in {history}')
+        return []
+    workloads = [name for name in WORKLOADS if any(name in samples[t] for t in tags)]
+    width = max(14, max(len(t) for t in tags) + 2)
+    print(f'{"ms":<14}' + ''.join(f'{t:>{width}}' for t in tags))
+    regressions = []
+    for name in workloads:
+        cells = []
+        previous: Optional[Tuple[str, Summary]] = None
+        for tag in tags:
+            values = samples[tag].get(name)
+            if not values:
+                cells.append(f'{"-":>{width}}')
+                continue
+            summary = Summary.of(values)
+            mark = ''
+            if previous:
+                change, kind = verdict(previous[1], summary, threshold)
+                mark = {'slower': '!', 'faster': '+'}.get(kind, '')
+                if kind == 'slower':
+                    regressions.append((name, previous[0], tag, change))
+            spread = summary.mad / summary.median * 100 if summary.median else 0
+            cells.append(f'{summary.median * 1000:.1f}±{spread:.0f}%{mark:1}'.rjust(width))
+            previous = (tag, summary)
+        print(f'{name:<14}' + ''.join(cells))
+    print(f'median±MAD of {sessions} session(s). ! slower, + faster than the previous tag by >{threshold:.0%} and {SIGMAS:.0f} standard errors')
+    for name, base, tag, change in regressions:
+        print(f'regression: {name} {base} => {tag} {change:+.1%}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser('bpy performance across tags')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run')
+    run_parser.add_argument('--runs', type=int, default=5, help='child processes per tag')
+    run_parser.add_argument('--repeat', type=int, default=5, help='iterations per workload')
+    report_parser = sub.add_parser('report')
+    report_parser.add_argument('--sessions', type=int, default=1, help='latest sessions per tag')
+    report_parser.add_argument('--host', help='default: this machine')
+    for p in (run_parser, report_parser):
+        p.add_argument('--tags', default='', help='globs and version constraints')
+        p.add_argument('--history', default=str(HISTORY))
+        p.add_argument('--threshold', type=float, default=THRESHOLD)
+        p.add_argument('--fail', action='store_true', help='exit 1 on a regression')
+    run_parser.add_argument('--workloads', default=','.join(WORKLOADS))
+    child = sub.add_parser('child')
+    child.add_argument('--repeat', type=int, default=5)
+    child.add_argument('--workloads', default=','.join(WORKLOADS))
+    parsed = parser.parse_args()
+
+    if parsed.command == 'child':
+        print(json.dumps(run_workloads(parsed.workloads.split(','), parsed.repeat)))
+        return
+
+    history = pathlib.Path(parsed.history)
+    if parsed.command == 'run':
+        tags = installed_tags(parsed.tags)
+        if not tags:
+            print(f'no bpy_install in {TAGS_DIR}')
+            sys.exit(1)
+        names = [n for n in parsed.workloads.split(',') if n]
+        run(tags, names, parsed.runs, parsed.repeat, history)
+        regressions = report(history, parsed.tags, parsed.threshold)
+    else:
+        regressions = report(history, parsed.tags, parsed.threshold, parsed.sessions, parsed.host)
+    if regressions and parsed.fail:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+'''
+profile guided optimization of bpy for headless workloads
+
+instrumented build, training run, merge, optimized rebuild in the same build dir.
+gcc finds the .gcda files by object path, clang merges .profraw into one file.
+
+    # training workload under the bpy in PYTHONPATH
+    python pgo.py run --blend scene.blend
+    # instrumented install => PROFILE
+    python pgo.py train tags/v2.93.5/bpy_pgo_train tags/v2.93.5/pgo --blend scene.blend
+    # throughput of the release and the pgo install
+    python pgo.py compare tags/v2.93.5/bpy_install tags/v2.93.5/bpy_pgo_install
+'''
+import argparse
+import json
+import os
+import pathlib
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+HERE = pathlib.Path(__file__).absolute().parent
+PROFDATA = 'merged.profdata'
+
+
+def detect_compiler() -> str:
+    '''
+    the compiler cmake picks. clang or gcc
+    '''
+    cxx = os.environ.get('CXX') or shutil.which('c++') or 'c++'
+    p = subprocess.run([cxx, '--version'],
+                       stdout=subprocess.PIPE,
+                       stderr=subprocess.STDOUT)
+    return 'clang' if b'clang' in p.stdout else 'gcc'
+
+
+def compile_flags(phase: str, compiler: str, profile: pathlib.Path) -> str:
+    if phase == 'instrument':
+        if compiler == 'clang':
+            return f'-fprofile-generate={profile}'
+        return f'-fprofile-generate={profile} -fprofile-update=atomic'
+    if compiler == 'clang':
+        return f'-fprofile-use={profile / PROFDATA} -Wno-profile-instr-unprofiled -Wno-profile-instr-out-of-date'
+    return f'-fprofile-use={profile} -fprofile-correction -Wno-missing-profile'
+
+
+def pgo_define(phase: str, compiler: str, profile: pathlib.Path) -> str:
+    '''
+    cmake arguments of phase. instrument or use
+    '''
+    from builder import IS_WINDOWS, linker_define
+    if IS_WINDOWS:
+        raise Exception('pgo: msvc is not supported, clang or gcc only')
+    flags = compile_flags(phase, compiler, profile.absolute())
+    link = flags if phase == 'instrument' else ''
+    return f'"-DCMAKE_C_FLAGS={flags}" "-DCMAKE_CXX_FLAGS={flags}" {linker_define(link)}'
+
+
+def merge(profile: pathlib.Path, compiler: str):
+    '''
+    clang only. gcc reads the .gcda files as they are
+    '''
+    if compiler != 'clang':
+        return
+    raws = [str(p) for p in profile.glob('*.profraw')]
+    if not raws:
+        raise Exception(f'no profile in {profile}')
+    subprocess.run(['llvm-profdata', 'merge', f'-output={profile / PROFDATA}'] +
+                   raws,
+                   check=True)
+
+
+#
+# workload. runs in a child process with bpy of the install in PYTHONPATH
+#
+def mesh_setup():
+    import bpy
+    bpy.ops.mesh.primitive_grid_add(x_subdivisions=300, y_subdivisions=300)
+    return bpy.context.object.data
+
+
+def mesh_access(mesh, repeat: int):
+    import bpy_numpy
+    co = bpy_numpy.get_vertices(mesh)
+    for _ in range(repeat):
+        bpy_numpy.get_vertices(mesh, co)
+        co[:, 2] += 0.01
+        bpy_numpy.set_vertices(mesh, co)
+        mesh.update()
+        bpy_numpy.get_normals(mesh)
+        bpy_numpy.get_loop_vertices(mesh)
+        bpy_numpy.get_uvs(mesh)
+
+
+def workload_mesh(repeat: int) -> int:
+    '''
+    bulk data access through bpy_numpy
+    '''
+    mesh_access(mesh_setup(), repeat)
+    return repeat
+
+
+def evaluate_setup(repeat: int):
+    import bpy
+    bpy.ops.mesh.primitive_uv_sphere_add(segments=64, ring_count=32)
+    o = bpy.context.object
+    o.modifiers.new('subsurf', 'SUBSURF').levels = 2
+    o.keyframe_insert('location', frame=1)
+    o.location = (0, 0, 10)
+    o.keyframe_insert('location', frame=repeat)
+    return o
+
+
+def evaluate_frames(o, repeat: int):
+    import bpy
+    scene = bpy.context.scene
+    for frame in range(1, repeat + 1):
+        scene.frame_set(frame)
+        o.evaluated_get(bpy.context.evaluated_depsgraph_get()).to_mesh()
+
+
+def workload_evaluate(repeat: int) -> int:
+    '''
+    animated modifiers evaluated per frame
+    '''
+    evaluate_frames(evaluate_setup(repeat), repeat)
+    return repeat
+
+
+def workload_load(repeat: int) -> int:
+    '''
+    save and open the scene built by the other workloads
+    '''
+    import bpy
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'load.blend')
+        bpy.ops.wm.save_as_mainfile(filepath=path)
+        for _ in range(repeat):
+            bpy.ops.wm.open_mainfile(filepath=path)
+    return repeat
+
+
+def make_render_workload(blends: List[str]) -> Callable[[int], int]:
+    '''
+    render.py loading and rendering of the given files
+    '''
+    def workload_render(repeat: int) -> int:
+        import render
+        count = 0
+        with tempfile.TemporaryDirectory() as tmp:
+            for blend in blends:
+                render.load(blend)
+                for frame in render.scene_frames(blend)[:repeat]:
+                    render.render_frame(frame,
+                                        pathlib.Path(tmp) / f'{frame}.png')
+                    count += 1
+        return count
+
+    return workload_render
+
+
+def run_workloads(blends: List[str], repeat: int) -> Dict[str, float]:
+    '''
+    name => iterations per second
+    '''
+    workloads: Dict[str, Callable[[int], int]] = {
+        'mesh': workload_mesh,
+        'evaluate': workload_evaluate,
+        'load': workload_load,
+    }
+    if blends:
+        workloads['render'] = make_render_workload(blends)
+    result = {}
+    for name, workload in workloads.items():
+        start = time.perf_counter()
+        count = workload(repeat)
+        result[name] = count / (time.perf_counter() - start)
+    return result
+
+
+def run_child(install: pathlib.Path, blends: List[str], repeat: int,
+              env: Dict[str, str]) -> Dict[str, float]:
+    env = dict(os.environ, **env)
+    env['PYTHONPATH'] = os.pathsep.join([str(install.absolute()), str(HERE)])
+    p = subprocess.run([
+        sys.executable, __file__, 'run', '--json', '--repeat',
+        str(repeat), '--blend'
+    ] + blends,
+                       env=env,
+                       check=True,
+                       stdout=subprocess.PIPE)
+    # bpy prints to stdout too, the result is the last line
+    return json.loads(p.stdout.decode('utf-8').splitlines()[-1])
+
+
+def train(install: pathlib.Path, profile: pathlib.Path, blends: List[str],
+          repeat: int, compiler: str):
+    profile.mkdir(parents=True, exist_ok=True)
+    env = {}
+    if compiler == 'clang':
+        # %m merges the processes of one binary online
+        env['LLVM_PROFILE_FILE'] = str(profile.absolute() / 'bpy-%m.profraw')
+    result = run_child(install, blends, repeat, env)
+    print(f'trained: {result}')
+    merge(profile, compiler)
+
+
+def compare(release: pathlib.Path, pgo: pathlib.Path, blends: List[str],
+            repeat: int, runs: int) -> Dict[str, Dict[str, float]]:
+    samples: Dict[str, Dict[str, List[float]]] = {'release': {}, 'pgo': {}}
+    for _ in range(runs):
+        # interleaved, machine noise hits both
+        for name, install in (('release', release), ('pgo', pgo)):
+            for k, v in run_child(install, blends, repeat, {}).items():
+                samples[name].setdefault(k, []).append(v)
+    report = {}
+    print(f'{"workload":<12}{"release/s":>12}{"pgo/s":>12}{"speedup":>10}')
+    for k in samples['release']:
+        r = statistics.median(samples['release'][k])
+        p = statistics.median(samples['pgo'][k])
+        report[k] = {'release': r, 'pgo': p, 'speedup': p / r}
+        print(f'{k:<12}{r:>12.2f}{p:>12.2f}{p / r:>9.2f}x')
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser('bpy pgo')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run')
+    run.add_argument('--json', action='store_true')
+    train_parser = sub.add_parser('train')
+    train_parser.add_argument('install')
+    train_parser.add_argument('profile')
+    compare_parser = sub.add_parser('compare')
+    compare_parser.add_argument('release')
+    compare_parser.add_argument('pgo')
+    compare_parser.add_argument('--runs', type=int, default=5)
+    compare_parser.add_argument('--report', help='json output')
+    for p in (run, train_parser, compare_parser):
+        p.add_argument('--blend', nargs='*', default=[])
+        p.add_argument('--repeat', type=int, default=20)
+    parsed = parser.parse_args()
+
+    if parsed.command == 'run':
+        result = run_workloads(parsed.blend, parsed.repeat)
+        print(json.dumps(result) if parsed.json else result)
+    elif parsed.command == 'train':
+        train(pathlib.Path(parsed.install), pathlib.Path(parsed.profile),
+              parsed.blend, parsed.repeat, detect_compiler())
+    elif parsed.command == 'compare':
+        report = compare(pathlib.Path(parsed.release), pathlib.Path(parsed.pgo),
+                         parsed.blend, parsed.repeat, parsed.runs)
+        if parsed.report:
+            pathlib.Path(parsed.report).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,520 @@
-import bpy
-bpy.ops.render.render()
-bpy.data.images['Render Result'].save_render(filepath='image.png')
+'''
+render .blend files
+
+    # render current scene to image.png
+    python render.py
+
+    # batch. FILE[@FRAMES] FRAMES: 1-250 or 1,5,10-20
+    python render.py --output out/{name}_####.png a.blend@1-250 b.blend
+
+    # pixels without png encoding. see render_pixels.py
+    python render.py --output out/{name}_####.npy a.blend@1-250
+    python render.py --pipe "ffmpeg ..." a.blend@1-250
+
+    # skip frames whose content hash is in the cache. see render_cache.py
+    python render.py --cache /tmp/frames --output out/####.png a.blend@1-250
+'''
+import argparse
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import pathlib
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import List, NamedTuple, Optional, Set, Tuple
+
+HERE = pathlib.Path(__file__).absolute().parent
+DEFAULT_OUTPUT = 'image.png'
+# resident memory a worker needs for one loaded scene. used to size the pool
+WORKER_MEMORY = 2 * 1024 * 1024 * 1024
+FRAME_PATTERN = re.compile(r'#+')
+FRAME_RANGE = re.compile(r'^(-?\d+)-(-?\d+)$')
+
+
+class Job(NamedTuple):
+    blend: str
+    frames: List[int]
+    output: str
+
+    @staticmethod
+    def parse(src: str, output: str) -> 'Job':
+        blend, frames = src, ''
+        if '@' in src:
+            blend, frames = src.rsplit('@', 1)
+        return Job(str(pathlib.Path(blend).absolute()), parse_frames(frames),
+                   output)
+
+
+class Chunk(NamedTuple):
+    blend: str
+    frames: List[int]
+    output: str
+
+
+def parse_frames(src: str) -> List[int]:
+    '''
+    '1-3,7' => [1, 2, 3, 7]
+    '''
+    frames: List[int] = []
+    for part in src.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        m = FRAME_RANGE.match(part)
+        if m:
+            frames += range(int(m[1]), int(m[2]) + 1)
+        else:
+            frames.append(int(part))
+    return frames
+
+
+def frame_path(pattern: str, blend: str, frame: int) -> pathlib.Path:
+    '''
+    {name} is replaced by the .blend stem, #### by the zero padded frame
+    '''
+    path = pattern.replace('{name}', pathlib.Path(blend).stem)
+    if FRAME_PATTERN.search(path):
+        path = FRAME_PATTERN.sub(lambda m: f'{frame:0{len(m[0])}}', path, 1)
+    else:
+        p = pathlib.Path(path)
+        path = str(p.with_name(f'{p.stem}_{frame:04}{p.suffix}'))
+    return pathlib.Path(path)
+
+
+def available_memory() -> int:
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def cpu_count() -> int:
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def pool_size(worker_memory: int = WORKER_MEMORY) -> int:
+    '''
+    one worker per core, as long as the scenes fit into memory
+    '''
+    cores = cpu_count()
+    memory = available_memory()
+    if not memory:
+        return cores
+    return max(1, min(cores, memory // worker_memory))
+
+
+def split_chunks(jobs: List[Job], workers: int,
+                 chunk_size: int = 0) -> List[Chunk]:
+    '''
+    chunks of the same .blend are kept together, so a worker that picks the
+    next chunk usually has the file loaded already
+    '''
+    chunks = []
+    for job in jobs:
+        size = chunk_size
+        if not size:
+            size = max(1, math.ceil(len(job.frames) / (workers * 2)))
+        for i in range(0, len(job.frames), size):
+            chunks.append(Chunk(job.blend, job.frames[i:i + size], job.output))
+    return chunks
+
+
+#
+# worker process
+#
+_progress = None
+_threads = 0
+_loaded = ''
+_pixels = None
+_cache = None
+
+
+def _init_worker(progress, threads: int, cache_dir: str = ''):
+    global _progress, _threads
+    _progress = progress
+    _threads = threads
+    use_cache(cache_dir)
+    # pay the blender initialization before the first chunk arrives
+    import bpy_lazy
+    bpy_lazy.preload()
+    import bpy_profile
+    bpy_profile.enable_from_env()
+
+
+def use_cache(cache_dir: str, cache_size: str = ''):
+    global _cache
+    if not cache_dir:
+        return None
+    import render_cache
+    _cache = render_cache.FrameCache(
+        pathlib.Path(cache_dir),
+        render_cache.parse_size(cache_size or render_cache.DEFAULT_SIZE))
+    return _cache
+
+
+def load(blend: str):
+    global _loaded, _pixels
+    import bpy
+    if blend and blend != _loaded:
+        bpy.ops.wm.open_mainfile(filepath=blend)
+        _loaded = blend
+        _pixels = None
+        if _threads:
+            # the pool already uses the cores
+            bpy.context.scene.render.threads_mode = 'FIXED'
+            bpy.context.scene.render.threads = _threads
+    return bpy.context.scene
+
+
+def pixel_reader():
+    '''
+    reader for the loaded scene. links the compositor viewer before rendering
+    '''
+    global _pixels
+    import bpy
+    import render_pixels
+    if not _pixels:
+        _pixels = render_pixels.PixelReader(bpy.context.scene)
+    return _pixels
+
+
+def release_pixels():
+    '''
+    the compositor as it was before pixel_reader. nothing saved or hashed
+    afterwards sees the viewer
+    '''
+    global _pixels
+    if _pixels:
+        _pixels.restore()
+        _pixels = None
+
+
+def render_frame(frame: Optional[int], dst: pathlib.Path):
+    '''
+    render the current scene and write dst atomically.
+    .npy is written from the pixel buffer, others by save_render
+    '''
+    import bpy
+    scene = bpy.context.scene
+    if frame is not None:
+        scene.frame_set(frame)
+    if dst.suffix == '.npy':
+        import render_pixels
+        reader = pixel_reader()
+        try:
+            bpy.ops.render.render()
+            render_pixels.write_npy(reader, dst)
+        finally:
+            # the frame cache keys the next frame without the viewer
+            release_pixels()
+        return
+    bpy.ops.render.render()
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f'.{dst.name}.{os.getpid()}.tmp')
+    bpy.data.images['Render Result'].save_render(filepath=str(tmp))
+    os.replace(tmp, dst)
+
+
+def render_cached(frame: int, dst: pathlib.Path) -> bool:
+    '''
+    True if dst was copied from the cache
+    '''
+    import bpy
+    scene = bpy.context.scene
+    scene.frame_set(frame)
+    key = _cache.key(scene, dst.suffix)
+    if _cache.get(key, dst):
+        return True
+    render_frame(None, dst)
+    _cache.put(key, dst)
+    return False
+
+
+def scene_frames(blend: str) -> List[int]:
+    scene = load(blend)
+    return list(range(scene.frame_start, scene.frame_end + 1,
+                      scene.frame_step))
+
+
+def render_chunk(chunk: Chunk) -> List[int]:
+    '''
+    returns the failed frames
+    '''
+    load(chunk.blend)
+    failed = []
+    for frame in chunk.frames:
+        start = time.perf_counter()
+        dst = frame_path(chunk.output, chunk.blend, frame)
+        cached = False
+        try:
+            if _cache:
+                cached = render_cached(frame, dst)
+            else:
+                render_frame(frame, dst)
+        except Exception as ex:
+            failed.append(frame)
+            if _progress:
+                _progress.put(('fail', chunk.blend, frame, str(ex)))
+            continue
+        if _progress:
+            _progress.put(('cached' if cached else 'done', chunk.blend, frame,
+                           time.perf_counter() - start))
+    return failed
+
+
+def stream_frames(jobs: List[Job], command: str):
+    '''
+    render in order and write raw frames to command's stdin
+    '''
+    import bpy
+    import render_pixels
+    with render_pixels.RawPipe(command) as pipe:
+        for job in jobs:
+            load(job.blend)
+            frames = job.frames or scene_frames(job.blend)
+            reader = pixel_reader()
+            try:
+                for frame in frames:
+                    bpy.context.scene.frame_set(frame)
+                    bpy.ops.render.render()
+                    pipe.write(reader)
+                    print(f'{pathlib.Path(job.blend).name}:{frame}',
+                          file=sys.stderr,
+                          flush=True)
+            finally:
+                release_pixels()
+
+
+#
+# main process
+#
+def _print_progress(progress, total: int, done: Set[Tuple[str, int]],
+                    cached: Set[Tuple[str, int]], synced: threading.Event):
+    start = time.perf_counter()
+    while True:
+        msg = progress.get()
+        if msg is None:
+            break
+        kind, blend, frame, value = msg
+        if kind == 'sync':
+            synced.set()
+        elif kind in ('done', 'cached'):
+            done.add((blend, frame))
+            if kind == 'cached':
+                cached.add((blend, frame))
+            elapsed = time.perf_counter() - start
+            print(
+                f'[{len(done)}/{total}] {pathlib.Path(blend).name}:{frame} {value:.2f}s{" cached" if kind == "cached" else ""} ({len(done) / elapsed:.2f} frames/s)',
+                flush=True)
+        else:
+            print(f'[fail] {pathlib.Path(blend).name}:{frame} {value}',
+                  flush=True)
+
+
+def render_batch(jobs: List[Job],
+                 workers: int = 0,
+                 chunk_size: int = 0,
+                 retries: int = 2,
+                 threads: int = 0,
+                 cache_dir: str = '',
+                 cache_size: str = '') -> List[Tuple[str, int]]:
+    '''
+    render all frames of jobs on a process pool.
+    returns the frames that still fail after retries
+    '''
+    if not workers:
+        workers = pool_size()
+    if not threads:
+        threads = max(1, cpu_count() // workers)
+    ctx = multiprocessing.get_context('spawn')
+    progress = ctx.Queue()
+
+    def new_pool():
+        return concurrent.futures.ProcessPoolExecutor(
+            workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(progress, threads, cache_dir))
+
+    # frame range from the scene for jobs without frames
+    missing = [job for job in jobs if not job.frames]
+    if missing:
+        with new_pool() as pool:
+            probed = list(pool.map(scene_frames, [j.blend for j in missing]))
+        frames_map = {j.blend: f for j, f in zip(missing, probed)}
+        jobs = [
+            job if job.frames else job._replace(frames=frames_map[job.blend])
+            for job in jobs
+        ]
+
+    total = sum(len(job.frames) for job in jobs)
+    done: Set[Tuple[str, int]] = set()
+    cached: Set[Tuple[str, int]] = set()
+    synced = threading.Event()
+    printer = threading.Thread(target=_print_progress,
+                               args=(progress, total, done, cached, synced))
+    printer.start()
+    try:
+        pending = jobs
+        for attempt in range(retries + 1):
+            if attempt:
+                print(f'retry {sum(len(j.frames) for j in pending)} frames')
+            with new_pool() as pool:
+                futures = [
+                    pool.submit(render_chunk, chunk)
+                    for chunk in split_chunks(pending, workers, chunk_size)
+                ]
+                for f in futures:
+                    try:
+                        f.result()
+                    except Exception as ex:
+                        # worker crashed. frames not reported done are retried
+                        print(f'[error] {ex}')
+            # all workers exited. drain their progress before collecting
+            synced.clear()
+            progress.put(('sync', '', 0, 0))
+            synced.wait()
+            pending = [
+                job._replace(frames=[
+                    frame for frame in job.frames
+                    if (job.blend, frame) not in done
+                ]) for job in pending
+            ]
+            pending = [job for job in pending if job.frames]
+            if not pending:
+                break
+    finally:
+        progress.put(None)
+        printer.join()
+
+    cache = use_cache(cache_dir, cache_size)
+    if cache:
+        cache.record(len(cached), len(done) - len(cached))
+        cache.gc()
+
+    return [(job.blend, frame) for job in pending for frame in job.frames]
+
+
+def benchmark(jobs: List[Job], workers: int):
+    '''
+    compare the pool with launching one blender process per frame
+    '''
+    cores = cpu_count()
+    missing = [job.blend for job in jobs if not job.frames]
+    if missing:
+        # the scene range, probed outside of the timing and of this process
+        with concurrent.futures.ProcessPoolExecutor(
+                1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            probed = dict(zip(missing, pool.map(scene_frames, missing)))
+        jobs = [job if job.frames else job._replace(frames=probed[job.blend]) for job in jobs]
+    for job in jobs:
+        if not job.frames:
+            raise Exception(f'no frames: {job.blend}')
+
+    start = time.perf_counter()
+    render_batch(jobs, workers)
+    pool_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for job in jobs:
+        for frame in job.frames:
+            subprocess.run([
+                sys.executable, __file__, '--inline', '--output', job.output,
+                f'{job.blend}@{frame}'
+            ],
+                           check=True)
+    process_time = time.perf_counter() - start
+
+    frames = sum(len(job.frames) for job in jobs)
+    print(f'{"mode":<20}{"seconds":>10}{"frames/s":>10}{"frames/s/core":>15}')
+    for name, t in [('pool', pool_time), ('process per frame', process_time)]:
+        rate = frames / t if t > 0 else 0
+        print(f'{name:<20}{t:>10.2f}{rate:>10.2f}{rate / cores:>15.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser('render .blend files')
+    parser.add_argument('jobs',
+                        nargs='*',
+                        help='FILE[@FRAMES]. FRAMES: 1-250 or 1,5,10-20')
+    parser.add_argument('--output',
+                        default='',
+                        help='output pattern. {name}: .blend stem, ####: frame')
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--chunk', type=int, default=0)
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--pipe',
+                        default='',
+                        help='write raw float32 RGBA frames to this command. - for stdout')
+    parser.add_argument('--inline',
+                        action='store_true',
+                        help='render in this process without the pool')
+    parser.add_argument('--bench',
+                        action='store_true',
+                        help='compare with one process per frame')
+    parser.add_argument('--cache',
+                        default='',
+                        help='frame cache directory. see render_cache.py')
+    parser.add_argument('--cache-size',
+                        default='',
+                        help='lru bound of the frame cache. 20G')
+    parsed = parser.parse_args()
+
+    if not parsed.jobs or parsed.inline:
+        # BPY_PROFILE=ops.folded
+        import bpy_profile
+        bpy_profile.enable_from_env()
+
+    if not parsed.jobs:
+        # current scene
+        render_frame(None, pathlib.Path(parsed.output or DEFAULT_OUTPUT))
+        return
+
+    output = parsed.output or '{name}_####.png'
+    jobs = [Job.parse(src, output) for src in parsed.jobs]
+
+    if parsed.pipe:
+        stream_frames(jobs, parsed.pipe)
+        return
+
+    if parsed.inline:
+        cache = use_cache(parsed.cache, parsed.cache_size)
+        for job in jobs:
+            frames = job.frames or scene_frames(job.blend)
+            render_chunk(Chunk(job.blend, frames, job.output))
+        if cache:
+            cache.record(cache.hits, cache.misses)
+            cache.gc()
+        return
+
+    if parsed.bench:
+        benchmark(jobs, parsed.workers or pool_size())
+        return
+
+    failed = render_batch(jobs,
+                          parsed.workers,
+                          parsed.chunk,
+                          parsed.retries,
+                          cache_dir=parsed.cache,
+                          cache_size=parsed.cache_size)
+    for blend, frame in failed:
+        print(f'failed: {blend}@{frame}')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,561 @@
+'''
+frame cache for render.py
+
+a frame is addressed by the hash of what it is made of: the state of the
+objects, materials, cameras, lights and world of the scene, the evaluated
+geometry, the object matrices, the images on disk, the render settings and
+the bpy build. datablocks without animation are hashed once per load, the
+animated ones and the deformed geometry at every frame. the bytes of the
+.blend are not, saving it re-renders the frames whose datablocks changed.
+frames that depend on the frame number alone (particles, simulations,
+image sequences, animated seed) include it in the key.
+
+    ROOT/
+        objects/ab/abcdef....png
+        digests/       file hashes by path, mtime and size
+        stats.jsonl    hits and misses of each run
+        tmp/
+
+    python render.py --cache ROOT --cache-size 20G --output out/####.png a.blend@1-250
+    python render_cache.py ROOT stats
+    python render_cache.py ROOT gc --size 10G
+'''
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import struct
+import time
+from typing import AbstractSet, Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from artifact_cache import parse_size
+
+DEFAULT_SIZE = '20G'
+# bump when the key changes
+KEY_VERSION = 3
+# properties that do not change the pixels. the ID ones are runtime state,
+# users changes when a viewer node is added and tag has no defined value
+SKIP_PROPERTIES = {
+    'rna_type', 'threads', 'threads_mode', 'filepath', 'select',
+    'session_uid', 'users', 'tag', 'is_evaluated', 'original', 'is_runtime_data', 'use_fake_user'
+}
+# where a node is drawn in the editor
+NODE_LAYOUT = {'location', 'width', 'height', 'dimensions', 'hide', 'show_options', 'show_preview'}
+# modifiers whose result depends on the frame and their cache
+VOLATILE_MODIFIERS = {
+    'CLOTH', 'SOFT_BODY', 'FLUID', 'DYNAMIC_PAINT', 'PARTICLE_SYSTEM',
+    'EXPLODE', 'COLLISION'
+}
+# evaluated per frame, hashed from the object matrices
+OBJECT_TRANSFORMS = {
+    'location', 'rotation_euler', 'rotation_quaternion', 'rotation_axis_angle', 'scale',
+    'delta_location', 'delta_rotation_euler', 'delta_rotation_quaternion', 'delta_scale',
+    'matrix_world', 'matrix_local', 'matrix_basis', 'dimensions', 'bound_box'
+}
+# object types whose evaluated geometry is hashed. curves and point clouds by their positions
+GEOMETRY_TYPES = {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META', 'CURVES', 'POINTCLOUD'}
+
+
+def file_digest(path: pathlib.Path, memo: Optional[pathlib.Path] = None) -> str:
+    '''
+    sha256 of the file. memo stores it by path, mtime and size
+    '''
+    try:
+        st = path.stat()
+    except OSError:
+        return 'missing'
+    stamp = f'{path.absolute()}:{st.st_mtime_ns}:{st.st_size}'
+    memo_path = None
+    if memo:
+        memo_path = memo / hashlib.sha1(stamp.encode('utf-8')).hexdigest()
+        try:
+            return memo_path.read_text()
+        except OSError:
+            pass
+    h = hashlib.sha256()
+    with path.open('rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    digest = h.hexdigest()
+    if memo_path:
+        memo.mkdir(parents=True, exist_ok=True)
+        tmp = memo_path.with_name(f'.{memo_path.name}.{os.getpid()}.tmp')
+        tmp.write_text(digest)
+        os.replace(tmp, memo_path)
+    return digest
+
+
+def rna_values(struct_, skip: AbstractSet[str] = frozenset()) -> Iterator[Tuple[str, Any]]:
+    '''
+    values of the bool, int, float, string and enum properties, linked ids by name
+    '''
+    if struct_ is None:
+        return
+    for prop in struct_.bl_rna.properties:
+        if prop.identifier in SKIP_PROPERTIES or prop.identifier in skip or prop.type == 'COLLECTION':
+            continue
+        value = getattr(struct_, prop.identifier, None)
+        if prop.type == 'POINTER':
+            # embedded structs have no name_full and are not followed
+            value = getattr(value, 'name_full', None)
+        elif isinstance(value, (set, frozenset)):
+            # enum flags. set order differs between processes
+            value = tuple(sorted(value))
+        elif hasattr(value, '__len__') and not isinstance(value, str):
+            value = tuple(tuple(v) if hasattr(v, '__len__') else v for v in value)
+        yield prop.identifier, value
+
+
+def matrix_bytes(matrix) -> bytes:
+    '''
+    the rows of a 4x4 mathutils.Matrix as float32
+    '''
+    return struct.pack('<16f', *(v for row in matrix for v in row))
+
+
+def render_settings(scene) -> List[Any]:
+    r = scene.render
+    settings = [
+        ('camera', scene.camera.name if scene.camera else ''),
+        ('engine', r.engine),
+    ]
+    for name, struct_ in [
+        ('render', r),
+        ('image', r.image_settings),
+        ('view', scene.view_settings),
+        ('display', scene.display_settings),
+        ('cycles', getattr(scene, 'cycles', None)),
+        ('eevee', getattr(scene, 'eevee', None)),
+    ]:
+        settings.append((name, sorted(rna_values(struct_), key=lambda kv: kv[0])))
+    return settings
+
+
+def animated_ids(bpy) -> Iterator[Any]:
+    collections = [
+        'objects', 'meshes', 'materials', 'lights', 'cameras', 'worlds',
+        'scenes', 'node_groups', 'shape_keys', 'textures', 'curves',
+        'armatures', 'particles'
+    ]
+    for name in collections:
+        for id_ in getattr(bpy.data, name, []):
+            yield id_
+            # embedded node trees of materials, worlds and scenes
+            tree = getattr(id_, 'node_tree', None)
+            if tree:
+                yield tree
+
+
+def fcurves(id_) -> List[Any]:
+    '''
+    of the action, the nla strips and the drivers
+    '''
+    anim = getattr(id_, 'animation_data', None)
+    if not anim:
+        return []
+    actions = [anim.action] if anim.action else []
+    for track in anim.nla_tracks:
+        actions += [strip.action for strip in track.strips if strip.action]
+    return [fc for action in actions for fc in action.fcurves] + list(anim.drivers)
+
+
+def animated_paths(bpy) -> List[Tuple[Any, str, int]]:
+    '''
+    (id, data_path, index) driven by actions, nla strips or drivers
+    '''
+    return [(id_, fc.data_path, fc.array_index) for id_ in animated_ids(bpy) for fc in fcurves(id_)]
+
+
+def frame_dependent(bpy, scene) -> str:
+    '''
+    the reason a frame can change while nothing hashed changes. '' if none
+    '''
+    cycles = getattr(scene, 'cycles', None)
+    if cycles and getattr(cycles, 'use_animated_seed', False):
+        return 'animated seed'
+    if scene.rigidbody_world:
+        return 'rigid body'
+    for image in bpy.data.images:
+        if image.source in ('SEQUENCE', 'MOVIE'):
+            return f'image {image.name}'
+    for o in scene.objects:
+        if o.particle_systems:
+            return f'particles {o.name}'
+        for m in o.modifiers:
+            if m.type in VOLATILE_MODIFIERS:
+                return f'{m.type} {o.name}'
+    if any(getattr(c, 'is_sequence', False) for c in getattr(bpy.data, 'volumes', [])):
+        return 'volume sequence'
+    if len(getattr(bpy.data, 'cache_files', [])):
+        return 'cache file'
+    return ''
+
+
+def is_animated(id_) -> bool:
+    if id_ is None:
+        return False
+    if fcurves(id_):
+        return True
+    tree = getattr(id_, 'node_tree', None)
+    return tree is not None and is_animated(tree)
+
+
+def node_tree_state(tree) -> List[Any]:
+    state: List[Any] = []
+    for node in tree.nodes:
+        inputs = []
+        for socket in node.inputs:
+            value = getattr(socket, 'default_value', None)
+            if hasattr(value, '__len__') and not isinstance(value, str):
+                value = tuple(value)
+            inputs.append((socket.identifier, socket.is_linked or value))
+        state.append((node.bl_idname, node.name, sorted(rna_values(node, NODE_LAYOUT)), inputs))
+    for link in tree.links:
+        state.append((link.from_node.name, link.from_socket.identifier, link.to_node.name,
+                      link.to_socket.identifier, link.is_muted))
+    return state
+
+
+def id_state(id_) -> str:
+    '''
+    hash of the properties and the node tree of a datablock
+    '''
+    h = hashlib.sha256(f'{type(id_).__name__}:{id_.name_full}'.encode('utf-8'))
+    skip = OBJECT_TRANSFORMS if type(id_).__name__ == 'Object' else frozenset()
+    h.update(repr(sorted(rna_values(id_, skip))).encode('utf-8'))
+    # node groups and the compositor are trees themselves
+    tree = id_ if hasattr(id_, 'nodes') else getattr(id_, 'node_tree', None)
+    if tree:
+        h.update(repr(node_tree_state(tree)).encode('utf-8'))
+    if hasattr(id_, 'modifiers'):
+        for m in id_.modifiers:
+            h.update(repr((m.type, sorted(rna_values(m)))).encode('utf-8'))
+    for slot in getattr(id_, 'material_slots', []):
+        h.update(f'{slot.link}:{slot.material.name_full if slot.material else ""}'.encode('utf-8'))
+    for material in getattr(id_, 'materials', []):
+        h.update(f'{material.name_full if material else ""}'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def geometry_state(o, depsgraph) -> str:
+    '''
+    hash of the evaluated geometry, modifiers and shape keys applied
+    '''
+    import numpy
+
+    import bpy_numpy
+    evaluated = o.evaluated_get(depsgraph)
+    if o.type in ('CURVES', 'POINTCLOUD'):
+        positions = evaluated.data.attributes['position'].data
+        return hashlib.sha256(bpy_numpy.foreach_get(positions, 'vector', numpy.float32, 3).tobytes()).hexdigest()
+    mesh = evaluated.to_mesh()
+    if mesh is None:
+        return ''
+    try:
+        h = hashlib.sha256(bpy_numpy.get_vertices(mesh).tobytes())
+        h.update(bpy_numpy.get_loop_vertices(mesh).tobytes())
+        h.update(bpy_numpy.get_polygons(mesh)[1].tobytes())
+        if mesh.uv_layers.active:
+            h.update(bpy_numpy.get_uvs(mesh).tobytes())
+        return h.hexdigest()
+    finally:
+        evaluated.to_mesh_clear()
+
+
+def deforms_per_frame(o) -> bool:
+    '''
+    the evaluated geometry can change between frames
+    '''
+    if any(is_animated(id_) for id_ in (o.data, getattr(o.data, 'shape_keys', None))):
+        return True
+    # moving the object does not change its geometry, animated modifiers do
+    if any(fc.data_path.split('.')[0] not in OBJECT_TRANSFORMS for fc in fcurves(o)):
+        return True
+    for m in o.modifiers:
+        # inputs of geometry nodes are id properties, scene time is a node
+        if m.type == 'NODES':
+            return True
+        # armature, hook, lattice, curve, boolean... follow another object
+        for prop in m.bl_rna.properties:
+            if prop.type == 'POINTER' and isinstance(getattr(m, prop.identifier, None), type(o)):
+                return True
+    return False
+
+
+def scene_objects(scene) -> List[Any]:
+    '''
+    the objects of the scene and of the collections they instance, by name
+    '''
+    found: Dict[str, Any] = {}
+    stack = list(scene.objects)
+    while stack:
+        o = stack.pop()
+        if o.name_full in found:
+            continue
+        found[o.name_full] = o
+        if o.instance_type == 'COLLECTION' and o.instance_collection:
+            stack.extend(o.instance_collection.all_objects)
+    return [found[name] for name in sorted(found)]
+
+
+def scene_ids(scene, objects: List[Any]) -> List[Any]:
+    '''
+    the datablocks that make the pixels, besides the geometry
+    '''
+    ids: Dict[int, Any] = {}
+
+    def add(id_):
+        if id_ is not None:
+            ids.setdefault(id_.as_pointer(), id_)
+
+    add(scene.world)
+    if scene.use_nodes:
+        add(scene.node_tree)
+    for o in objects:
+        # cameras, lights, probes. the geometry of meshes and curves is hashed evaluated too
+        add(o)
+        add(o.data)
+        for slot in o.material_slots:
+            add(slot.material)
+    return list(ids.values())
+
+
+class SceneState(NamedTuple):
+    '''
+    what the key of every frame of a loaded .blend shares
+    '''
+    # files, build and the datablocks that do not change with the frame
+    static: str
+    # the reason frames differ by number alone
+    volatile: str
+    paths: List[Tuple[Any, str, int]]
+    # datablocks hashed at every frame
+    animated: List[Any]
+    # objects whose evaluated geometry is hashed at every frame
+    deformed: List[Any]
+    objects: List[Any]
+
+
+class FrameCache:
+    '''
+    objects are written to tmp and renamed, like ArtifactCache.
+    workers share the directory. gc runs in the main process
+    '''
+    def __init__(self, root: pathlib.Path, max_size: int = parse_size(DEFAULT_SIZE)):
+        self.root = root
+        self.objects = root / 'objects'
+        self.digests = root / 'digests'
+        self.tmp = root / 'tmp'
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # of the loaded .blend only, the ids of a previous load are freed
+        self._loaded: Optional[Tuple[str, int, str]] = None
+        self._state: Optional[SceneState] = None
+
+    def path(self, key: str, suffix: str) -> pathlib.Path:
+        return self.objects / key[:2] / f'{key}{suffix}'
+
+    def _temp(self, name: str) -> pathlib.Path:
+        self.tmp.mkdir(parents=True, exist_ok=True)
+        return self.tmp / f'{name}.{os.getpid()}.{time.time_ns()}'
+
+    def static(self, bpy, scene) -> SceneState:
+        '''
+        once per loaded .blend and scene. the bytes of the .blend are not hashed,
+        saving it changes the keys of the frames whose datablocks changed only
+        '''
+        loaded = (bpy.data.filepath, bpy.data.as_pointer(), scene.name_full)
+        if self._state and self._loaded == loaded:
+            return self._state
+        h = hashlib.sha256(f'{bpy.app.version_string}:{bpy.app.build_hash!r}:{KEY_VERSION}'.encode('utf-8'))
+        # images, volumes and caches on disk. linked libraries are hashed by their datablocks
+        for name in ('images', 'volumes', 'cache_files'):
+            for item in getattr(bpy.data, name, []):
+                packed = getattr(item, 'packed_file', None)
+                if packed:
+                    h.update(f'{item.name_full}:'.encode('utf-8') + hashlib.sha256(packed.data).digest())
+                elif getattr(item, 'filepath', ''):
+                    path = pathlib.Path(bpy.path.abspath(item.filepath, library=item.library))
+                    h.update(f'{item.name_full}:{file_digest(path, self.digests)}\n'.encode('utf-8'))
+        objects = scene_objects(scene)
+        animated = []
+        # node groups are referenced by name from the node trees
+        for id_ in list(bpy.data.node_groups) + scene_ids(scene, objects):
+            if is_animated(id_):
+                animated.append(id_)
+            else:
+                h.update(id_state(id_).encode('ascii'))
+        deformed = []
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        for o in objects:
+            if o.type not in GEOMETRY_TYPES:
+                continue
+            if deforms_per_frame(o):
+                deformed.append(o)
+            else:
+                h.update(f'{o.name_full}:{geometry_state(o, depsgraph)}'.encode('utf-8'))
+        self._loaded = loaded
+        self._state = SceneState(h.hexdigest(), frame_dependent(bpy, scene), animated_paths(bpy),
+                                 animated, deformed, objects)
+        return self._state
+
+    def key(self, scene, suffix: str) -> str:
+        '''
+        key of the current frame. call after frame_set
+        '''
+        import bpy
+        state = self.static(bpy, scene)
+        h = hashlib.sha256(state.static.encode('ascii'))
+        h.update(suffix.encode('utf-8'))
+        h.update(repr(render_settings(scene)).encode('utf-8'))
+        if state.volatile:
+            h.update(struct.pack('<i', scene.frame_current))
+        # animated values as evaluated at this frame
+        for id_, data_path, index in state.paths:
+            try:
+                value = id_.path_resolve(data_path)
+                if hasattr(value, '__len__') and not isinstance(value, str):
+                    value = value[index]
+            except (ValueError, IndexError, TypeError):
+                value = None
+            h.update(repr(value).encode('utf-8'))
+        for id_ in state.animated:
+            h.update(id_state(id_).encode('ascii'))
+        # a list, instanced collections included. not a bpy_prop_collection for foreach_get
+        for o in state.objects:
+            h.update(matrix_bytes(o.matrix_world))
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        for o in state.deformed:
+            h.update(f'{o.name_full}:{geometry_state(o, depsgraph)}'.encode('utf-8'))
+        if any(o.is_instancer for o in state.objects):
+            for instance in depsgraph.object_instances:
+                if instance.is_instance:
+                    h.update(instance.object.name.encode('utf-8'))
+                    h.update(matrix_bytes(instance.matrix_world))
+        return h.hexdigest()
+
+    def get(self, key: str, dst: pathlib.Path) -> bool:
+        src = self.path(key, dst.suffix)
+        tmp = dst.with_name(f'.{dst.name}.{os.getpid()}.tmp')
+        try:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(src, tmp)
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        os.replace(tmp, dst)
+        # mtime is the lru clock
+        try:
+            os.utime(src)
+        except OSError:
+            pass
+        self.hits += 1
+        return True
+
+    def put(self, key: str, src: pathlib.Path) -> pathlib.Path:
+        dst = self.path(key, src.suffix)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._temp(key)
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+        return dst
+
+    def entries(self) -> List[Tuple[float, int, pathlib.Path]]:
+        '''
+        (mtime, size, path), oldest first
+        '''
+        entries = []
+        for path in self.objects.glob('*/*'):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def gc(self, max_size: Optional[int] = None) -> int:
+        '''
+        remove the least recently used frames over max_size
+        '''
+        if max_size is None:
+            max_size = self.max_size
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        if self.tmp.exists():
+            for tmp in self.tmp.iterdir():
+                try:
+                    if time.time() - tmp.stat().st_mtime > 24 * 3600:
+                        tmp.unlink()
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def record(self, hits: int, misses: int):
+        '''
+        append the counts of a run to stats.jsonl and print the hit rate
+        '''
+        total = hits + misses
+        if not total:
+            return
+        print(f'frame cache: {hits}/{total} hits ({hits / total:.0%})')
+        self.root.mkdir(parents=True, exist_ok=True)
+        with (self.root / 'stats.jsonl').open('a') as w:
+            w.write(json.dumps({'time': time.time(), 'hits': hits, 'misses': misses}) + '\n')
+
+    def stats(self) -> List[Dict[str, Any]]:
+        try:
+            lines = (self.root / 'stats.jsonl').read_text().splitlines()
+        except OSError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+        return records
+
+
+def main():
+    parser = argparse.ArgumentParser('render.py frame cache')
+    parser.add_argument('root')
+    sub = parser.add_subparsers(dest='command', required=True)
+    stats = sub.add_parser('stats')
+    stats.add_argument('--last', type=int, default=10)
+    gc = sub.add_parser('gc')
+    gc.add_argument('--size', default=DEFAULT_SIZE)
+    parsed = parser.parse_args()
+
+    cache = FrameCache(pathlib.Path(parsed.root))
+    if parsed.command == 'stats':
+        entries = cache.entries()
+        print(f'{len(entries)} frames, {sum(size for _, size, _ in entries) >> 20}MB')
+        records = cache.stats()
+        for r in records[-parsed.last:]:
+            total = r['hits'] + r['misses']
+            run = time.strftime('%Y-%m-%d %H:%M', time.localtime(r['time']))
+            print(f'{run} {r["hits"]:>6}/{total:<6} {r["hits"] / total:>5.0%}')
+        hits = sum(r['hits'] for r in records)
+        total = hits + sum(r['misses'] for r in records)
+        if total:
+            print(f'all runs {hits}/{total} {hits / total:.0%}')
+    elif parsed.command == 'gc':
+        print(f'removed {cache.gc(parse_size(parsed.size))}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+'''
+read rendered pixels without encoding an image file
+
+    # .npy sequence
+    python render.py --output out/{name}_####.npy a.blend@1-250
+
+    # raw float32 RGBA frames to an encoder. rows are bottom to top
+    python render.py --pipe "ffmpeg -f rawvideo -pix_fmt gbrapf32le ..." a.blend@1-250
+
+    # frames per second against save_render
+    python render_pixels.py a.blend --frames 1-10
+'''
+import argparse
+import os
+import pathlib
+import subprocess
+import sys
+import time
+from typing import BinaryIO, Optional, Tuple
+
+import numpy
+
+VIEWER_NODE = 'Viewer Node'
+RENDER_RESULT = 'Render Result'
+
+
+def resolution(scene) -> Tuple[int, int]:
+    r = scene.render
+    return (r.resolution_x * r.resolution_percentage // 100,
+            r.resolution_y * r.resolution_percentage // 100)
+
+
+def setup_viewer(scene):
+    '''
+    Render Result has no pixels from python.
+    link the render layer to a compositor viewer so 'Viewer Node' receives them.
+    a viewer of the file that shows another node is left alone, a new one
+    becomes the active viewer
+    '''
+    scene.use_nodes = True
+    tree = scene.node_tree
+
+    def is_render_layer(node) -> bool:
+        return node.bl_idname == 'CompositorNodeRLayers' and node.scene in (None, scene)
+
+    for node in tree.nodes:
+        if node.bl_idname != 'CompositorNodeViewer':
+            continue
+        links = node.inputs['Image'].links
+        if links and is_render_layer(links[0].from_node) and links[0].from_socket.identifier == 'Image':
+            tree.nodes.active = node
+            return node
+    layers = next((n for n in tree.nodes if is_render_layer(n)), None)
+    if not layers:
+        layers = tree.nodes.new('CompositorNodeRLayers')
+    viewer = tree.nodes.new('CompositorNodeViewer')
+    viewer.use_alpha = True
+    tree.links.new(layers.outputs['Image'], viewer.inputs['Image'])
+    # the active viewer writes 'Viewer Node'
+    tree.nodes.active = viewer
+    return viewer
+
+
+class PixelReader:
+    '''
+    copy the pixels of the last render into a preallocated float32 buffer
+    with foreach_get. no python object per pixel
+    '''
+    def __init__(self, scene):
+        # what setup_viewer changes, for restore
+        tree = scene.node_tree
+        active = tree.nodes.active if tree else None
+        self.saved = (scene.use_nodes, {n.name for n in tree.nodes} if tree else set(),
+                      active.name if active else '')
+        setup_viewer(scene)
+        self.scene = scene
+        self.buffer = numpy.empty(0, dtype=numpy.float32)
+
+    def restore(self):
+        '''
+        the compositor of the scene as it was before setup_viewer
+        '''
+        use_nodes, names, active = self.saved
+        tree = self.scene.node_tree
+        if tree:
+            for node in [n for n in tree.nodes if n.name not in names]:
+                tree.nodes.remove(node)
+            if active in tree.nodes:
+                tree.nodes.active = tree.nodes[active]
+        self.scene.use_nodes = use_nodes
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        w, h = resolution(self.scene)
+        return (h, w, 4)
+
+    def image(self):
+        import bpy
+        size = self.shape[0] * self.shape[1] * 4
+        result = bpy.data.images.get(RENDER_RESULT)
+        if result and len(result.pixels) == size:
+            return result
+        viewer = bpy.data.images.get(VIEWER_NODE)
+        if viewer and len(viewer.pixels) == size:
+            return viewer
+        raise Exception(f'no pixels for {self.shape}')
+
+    def read(self, out: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+        '''
+        out: contiguous float32 array with shape (h, w, 4). the reused buffer if None
+        '''
+        shape = self.shape
+        if out is None:
+            if self.buffer.shape != shape:
+                self.buffer = numpy.empty(shape, dtype=numpy.float32)
+            out = self.buffer
+        self.image().pixels.foreach_get(out.reshape(-1))
+        return out
+
+
+def write_npy(reader: PixelReader, dst: pathlib.Path):
+    '''
+    foreach_get straight into a memory mapped .npy. renamed when complete
+    '''
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f'.{dst.name}.{os.getpid()}.tmp')
+    mm = numpy.lib.format.open_memmap(str(tmp),
+                                      mode='w+',
+                                      dtype=numpy.float32,
+                                      shape=reader.shape)
+    reader.read(mm)
+    mm.flush()
+    del mm
+    os.replace(tmp, dst)
+
+
+class RawPipe:
+    '''
+    raw float32 RGBA frames to a command's stdin, or stdout for '-'.
+    for '-' the frames get their own copy of the stdout fd and fd 1 points at
+    stderr, so what blender prints does not end up between the frames
+    '''
+    def __init__(self, command: str):
+        self.process: Optional[subprocess.Popen] = None
+        self.stdout = -1
+        if command == '-':
+            sys.stdout.flush()
+            self.stdout = os.dup(1)
+            os.dup2(2, 1)
+            self.stream: BinaryIO = os.fdopen(os.dup(self.stdout), 'wb')
+        else:
+            self.process = subprocess.Popen(command,
+                                            shell=True,
+                                            stdin=subprocess.PIPE)
+            if not self.process.stdin:
+                raise Exception("fail to popen")
+            self.stream = self.process.stdin
+
+    def write(self, reader: PixelReader):
+        self.stream.write(memoryview(reader.read()).cast('B'))
+
+    def close(self):
+        self.stream.flush()
+        if self.process:
+            self.stream.close()
+            if self.process.wait() != 0:
+                raise Exception(f'returncode: {self.process.returncode}')
+        elif self.stdout != -1:
+            self.stream.close()
+            sys.stdout.flush()
+            os.dup2(self.stdout, 1)
+            os.close(self.stdout)
+            self.stdout = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def benchmark(blend: str, frames, out_dir: pathlib.Path):
+    import bpy
+    import render
+
+    render.load(blend)
+    scene = bpy.context.scene
+    reader = PixelReader(scene)
+    w, h = resolution(scene)
+    print(f'{blend} {w}x{h} {len(frames)} frames')
+
+    def run(name, output):
+        render_time = 0.0
+        output_time = 0.0
+        for frame in frames:
+            start = time.perf_counter()
+            scene.frame_set(frame)
+            bpy.ops.render.render()
+            render_time += time.perf_counter() - start
+            start = time.perf_counter()
+            output(frame)
+            output_time += time.perf_counter() - start
+        n = len(frames)
+        print(
+            f'{name:<12}{n / output_time:>14.2f}{n / (render_time + output_time):>14.2f}'
+        )
+
+    print(f'{"mode":<12}{"output fps":>14}{"total fps":>14}')
+    run(
+        'save_render', lambda frame: bpy.data.images[RENDER_RESULT].
+        save_render(filepath=str(out_dir / f'{frame:04}.png')))
+    run('npy', lambda frame: write_npy(reader, out_dir / f'{frame:04}.npy'))
+    with RawPipe(f'cat > {os.devnull}') as pipe:
+        run('raw pipe', lambda frame: pipe.write(reader))
+
+
+def main():
+    import render
+    parser = argparse.ArgumentParser('render pixel output benchmark')
+    parser.add_argument('blend')
+    parser.add_argument('--frames', default='1-10')
+    parser.add_argument('--out', default='bench_pixels')
+    parsed = parser.parse_args()
+    out_dir = pathlib.Path(parsed.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    benchmark(str(pathlib.Path(parsed.blend).absolute()),
+              render.parse_frames(parsed.frames), out_dir)
+
+
+if __name__ == '__main__':
+    main()
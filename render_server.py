@@ -0,0 +1,299 @@
+'''
+long lived render service on localhost
+
+recently used .blend scenes stay loaded (appended into one main database).
+the least recently used are removed when their memory exceeds the budget.
+
+    python render_server.py --port 8080 --memory 8G
+
+    # png
+    curl -o out.png "localhost:8080/render?blend=/abs/scene.blend&frame=10&resolution=640x360&camera=Camera.001"
+    curl -o out.png -d '{"blend": "/abs/scene.blend", "frame": 10}' localhost:8080/render
+    # latency and cache metrics
+    curl localhost:8080/metrics
+'''
+import argparse
+import collections
+import http.server
+import json
+import os
+import pathlib
+import shutil
+import statistics
+import tempfile
+import time
+import urllib.parse
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+import bpy_lazy
+from artifact_cache import parse_size
+
+# --help and argument errors return before blender initializes
+bpy_lazy.install()
+import bpy  # noqa: E402
+
+
+def resident_memory() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return 0
+
+
+def purge():
+    if hasattr(bpy.data, 'orphans_purge'):
+        bpy.data.orphans_purge(do_recursive=True)
+    else:
+        bpy.ops.outliner.orphans_purge()
+
+
+class Entry(NamedTuple):
+    # name in the .blend => name after append, which may have a suffix
+    scenes: Dict[str, str]
+    mtime: float
+    # resident memory growth while loading. an estimate, 0 if it shrank
+    size: int
+
+
+class SceneCache:
+    '''
+    LRU of appended .blend scenes bounded by the memory they took to load.
+    the process resident memory does not shrink when scenes are removed,
+    the allocator keeps the freed pages
+    '''
+    def __init__(self, memory_budget: int, max_files: int = 0):
+        self.memory_budget = memory_budget
+        self.max_files = max_files
+        self.entries: 'collections.OrderedDict[str, Entry]' = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def size(self) -> int:
+        return sum(entry.size for entry in self.entries.values())
+
+    def get(self, blend: str) -> Dict[str, str]:
+        '''
+        scene names of blend to the appended names, loaded if not cached or modified
+        '''
+        mtime = os.path.getmtime(blend)
+        entry = self.entries.get(blend)
+        if entry and entry.mtime == mtime:
+            self.hits += 1
+            self.entries.move_to_end(blend)
+            return entry.scenes
+        self.misses += 1
+        if entry:
+            self.remove(blend)
+        before = resident_memory()
+        with bpy.data.libraries.load(blend, link=False) as (src, dst):
+            names = list(src.scenes)
+            dst.scenes = names
+        # in the order of names. appended names may have a suffix
+        scenes = {name: s.name for name, s in zip(names, dst.scenes) if s}
+        self.entries[blend] = Entry(scenes, mtime, max(0, resident_memory() - before))
+        self.evict()
+        return scenes
+
+    def remove(self, blend: str):
+        entry = self.entries.pop(blend)
+        for name in entry.scenes.values():
+            scene = bpy.data.scenes.get(name)
+            if scene:
+                bpy.data.scenes.remove(scene)
+        purge()
+
+    def evict(self):
+        '''
+        keep the most recent file even when it alone exceeds the budget
+        '''
+        while len(self.entries) > 1:
+            over_count = self.max_files and len(self.entries) > self.max_files
+            over_memory = self.memory_budget and self.size > self.memory_budget
+            if not over_count and not over_memory:
+                break
+            blend = next(iter(self.entries))
+            print(f'evict: {blend}')
+            self.remove(blend)
+            self.evictions += 1
+
+
+class RenderRequest(NamedTuple):
+    blend: str
+    scene: str = ''
+    camera: str = ''
+    resolution: Optional[List[int]] = None
+    frame: Optional[int] = None
+    format: str = 'png'
+
+    @staticmethod
+    def from_dict(d: Dict[str, Any]) -> 'RenderRequest':
+        resolution = d.get('resolution')
+        if isinstance(resolution, str):
+            resolution = [int(x) for x in resolution.split('x')]
+        frame = d.get('frame')
+        return RenderRequest(
+            str(pathlib.Path(d['blend']).absolute()), d.get('scene', ''),
+            d.get('camera', ''), resolution,
+            int(frame) if frame is not None else None, d.get('format', 'png'))
+
+
+class RenderService:
+    def __init__(self, cache: SceneCache):
+        self.cache = cache
+        self.latencies: Deque[float] = collections.deque(maxlen=1000)
+        self.requests = 0
+        self.errors = 0
+        self.tmp = pathlib.Path(tempfile.mkdtemp(prefix='render_server'))
+
+    def render(self, request: RenderRequest) -> bytes:
+        scenes = self.cache.get(request.blend)
+        if not scenes:
+            raise Exception(f'no scene in {request.blend}')
+        if not request.scene:
+            name = next(iter(scenes.values()))
+        elif request.scene in scenes:
+            name = scenes[request.scene]
+        else:
+            raise Exception(f'no scene {request.scene} in {request.blend}: {", ".join(scenes)}')
+        scene = bpy.data.scenes[name]
+
+        # per request overrides. restored for the next request
+        r = scene.render
+        saved = (scene.camera, r.resolution_x, r.resolution_y,
+                 r.resolution_percentage, scene.frame_current)
+        try:
+            if request.camera:
+                scene.camera = scene.objects[request.camera]
+            if request.resolution:
+                r.resolution_x, r.resolution_y = request.resolution
+                r.resolution_percentage = 100
+            if request.frame is not None:
+                scene.frame_set(request.frame)
+
+            if request.format == 'raw':
+                import render_pixels
+                reader = render_pixels.PixelReader(scene)
+                try:
+                    bpy.ops.render.render(scene=scene.name)
+                    return reader.read().tobytes()
+                finally:
+                    # the cached scene renders png without the viewer again
+                    reader.restore()
+
+            bpy.ops.render.render(scene=scene.name)
+            dst = self.tmp / f'{os.getpid()}.png'
+            bpy.data.images['Render Result'].save_render(filepath=str(dst),
+                                                         scene=scene)
+            return dst.read_bytes()
+        finally:
+            camera, x, y, percentage, frame = saved
+            scene.camera = camera
+            r.resolution_x, r.resolution_y = x, y
+            r.resolution_percentage = percentage
+            scene.frame_set(frame)
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        lookups = self.cache.hits + self.cache.misses
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+            'cache_hit_rate': self.cache.hits / lookups if lookups else 0,
+            'cache_evictions': self.cache.evictions,
+            'cached_files': list(self.cache.entries.keys()),
+            'resident_memory': resident_memory(),
+            'cache_memory': self.cache.size,
+            'memory_budget': self.cache.memory_budget,
+            'latency_mean': statistics.mean(latencies) if latencies else 0,
+            'latency_p50': percentile(0.5),
+            'latency_p95': percentile(0.95),
+        }
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    service: RenderService
+
+    def send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path == '/metrics':
+            self.send(200,
+                      json.dumps(self.service.metrics()).encode('utf-8'),
+                      'application/json')
+        elif url.path == '/render':
+            query = {
+                k: v[0]
+                for k, v in urllib.parse.parse_qs(url.query).items()
+            }
+            self.handle_render(query)
+        else:
+            self.send(404, b'not found', 'text/plain')
+
+    def do_POST(self):
+        if urllib.parse.urlparse(self.path).path != '/render':
+            self.send(404, b'not found', 'text/plain')
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        self.handle_render(json.loads(self.rfile.read(length)))
+
+    def handle_render(self, params: Dict[str, Any]):
+        service = self.service
+        service.requests += 1
+        start = time.perf_counter()
+        try:
+            request = RenderRequest.from_dict(params)
+            body = service.render(request)
+        except Exception as ex:
+            service.errors += 1
+            self.send(400, str(ex).encode('utf-8'), 'text/plain')
+            return
+        service.latencies.append(time.perf_counter() - start)
+        content_type = 'application/octet-stream' if request.format == 'raw' else 'image/png'
+        self.send(200, body, content_type)
+
+
+def main():
+    parser = argparse.ArgumentParser('render service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--memory',
+                        default='8G',
+                        help='memory budget of the scene cache, the sum of the loaded sizes')
+    parser.add_argument('--max-files', type=int, default=0)
+    parsed = parser.parse_args()
+
+    # initialize before the first request
+    bpy_lazy.preload()
+    Handler.service = RenderService(
+        SceneCache(parse_size(parsed.memory), parsed.max_files))
+    # bpy is single threaded. one request at a time
+    server = http.server.HTTPServer((parsed.host, parsed.port), Handler)
+    print(f'listen: {parsed.host}:{parsed.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        shutil.rmtree(Handler.service.tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+'''
+seed tags/TAG/bpy from the nearest already built tag
+
+the build directory is copied, absolute paths in the cmake and ninja files
+are rewritten, and unchanged sources get the mtime of the seed's sources,
+so ninja rebuilds only what differs between the tags.
+
+    python seed_build.py v2.93.5
+    python seed_build.py v2.93.5 --from v2.93.4 --by files
+    doit bpy_build:v2.93.5 seed=files
+'''
+import argparse
+import json
+import os
+import pathlib
+import platform
+import re
+import shutil
+import struct
+import subprocess
+from typing import Dict, List, Optional
+
+HERE = pathlib.Path(__file__).absolute().parent
+CLONE_DIR = HERE / 'blender'
+TAGS_DIR = HERE / 'tags'
+# build files with absolute paths
+TEXT_SUFFIXES = {'.txt', '.ninja', '.cmake', '.rsp', '.make', '.json'}
+DEPS_SIGNATURE = b'# ninjadeps\n'
+# what may follow a path in the build files
+PATH_END = rb'(?=[/\\\s"\';:,)\]\x00]|$)'
+MASK64 = (1 << 64) - 1
+
+
+def git(args: List[str], cwd: pathlib.Path = CLONE_DIR) -> str:
+    return subprocess.run(['git'] + args,
+                          cwd=cwd,
+                          check=True,
+                          stdout=subprocess.PIPE).stdout.decode('utf-8')
+
+
+def is_built(tag: str) -> bool:
+    build_dir = TAGS_DIR / tag / 'bpy'
+    return (build_dir / 'build.ninja').exists() and (build_dir /
+                                                     '.ninja_log').exists()
+
+
+def distance(a: str, b: str, by: str) -> int:
+    if by == 'files':
+        return len(git(['diff', '--name-only', a, b]).splitlines())
+    return int(git(['rev-list', '--count', f'{a}...{b}']).strip())
+
+
+def nearest(tag: str, candidates: List[str], by: str) -> Optional[str]:
+    best = None
+    best_distance = 0
+    for candidate in candidates:
+        if candidate == tag or not is_built(candidate):
+            continue
+        d = distance(candidate, tag, by)
+        print(f'{candidate}: {d} {by}')
+        if best is None or d < best_distance:
+            best, best_distance = candidate, d
+    return best
+
+
+def murmur_hash64a(data: bytes) -> int:
+    '''
+    ninja's command hash in .ninja_log
+    '''
+    m = 0xc6a4a7935bd1e995
+    r = 47
+    length = len(data)
+    h = (0xDECAFBADDECAFBAD ^ (length * m)) & MASK64
+    end = length - (length % 8)
+    for (k, ) in struct.iter_unpack('<Q', data[:end]):
+        k = (k * m) & MASK64
+        k ^= k >> r
+        k = (k * m) & MASK64
+        h ^= k
+        h = (h * m) & MASK64
+    tail = data[end:]
+    if tail:
+        for i, b in enumerate(tail):
+            h ^= b << (8 * i)
+        h = (h * m) & MASK64
+    h ^= h >> r
+    h = (h * m) & MASK64
+    h ^= h >> r
+    return h
+
+
+def copy_tree(src: pathlib.Path, dst: pathlib.Path):
+    '''
+    keeps mtimes. reflinks where the file system supports them
+    '''
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if platform.system() == 'Linux':
+        subprocess.run(['cp', '-a', '--reflink=auto', str(src), str(dst)],
+                       check=True)
+    else:
+        shutil.copytree(src, dst, symlinks=True)
+
+
+def path_pattern(old: str) -> 're.Pattern[bytes]':
+    '''
+    old as a whole path or a prefix of one. tags/v2.93.4/bpy does not
+    match in tags/v2.93.4/bpy_install or tags/v2.93.45/bpy
+    '''
+    return re.compile(re.escape(old.encode('utf-8')) + PATH_END, re.MULTILINE)
+
+
+def rewrite_text(build_dir: pathlib.Path, old: str, new: str) -> int:
+    count = 0
+    pattern = path_pattern(old)
+    new_bytes = new.encode('utf-8')
+    for path in build_dir.rglob('*'):
+        if path.suffix not in TEXT_SUFFIXES or not path.is_file():
+            continue
+        data = path.read_bytes()
+        replaced, n = pattern.subn(lambda _m: new_bytes, data)
+        if not n:
+            continue
+        st = path.stat()
+        path.write_bytes(replaced)
+        # a newer build.ninja would trigger nothing, a newer CMakeCache would
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        count += 1
+    return count
+
+
+def rewrite_deps(path: pathlib.Path, old: str, new: str):
+    '''
+    .ninja_deps path records. the record ids do not change
+    '''
+    data = path.read_bytes()
+    if not data.startswith(DEPS_SIGNATURE):
+        raise Exception(f'not a ninja deps log: {path}')
+    header = len(DEPS_SIGNATURE) + 4
+    out = [data[:header]]
+    offset = header
+    old_bytes = old.encode('utf-8')
+    new_bytes = new.encode('utf-8')
+    while offset + 4 <= len(data):
+        (size, ) = struct.unpack_from('<I', data, offset)
+        is_deps = size & 0x80000000
+        size &= 0x7fffffff
+        record = data[offset + 4:offset + 4 + size]
+        offset += 4 + size
+        name = record[:-4].rstrip(b'\0')
+        if is_deps or not (name == old_bytes or name.startswith(old_bytes + b'/')):
+            out.append(struct.pack('<I', size | is_deps) + record)
+            continue
+        checksum = record[-4:]
+        name = new_bytes + name[len(old_bytes):]
+        padded = name + b'\0' * ((4 - len(name) % 4) % 4)
+        out.append(struct.pack('<I', len(padded) + 4) + padded + checksum)
+    path.write_bytes(b''.join(out))
+
+
+def ninja_commands(build_dir: pathlib.Path) -> Dict[str, str]:
+    '''
+    output => command of every edge
+    '''
+    p = subprocess.run(['ninja', '-C', str(build_dir), '-t', 'compdb'],
+                       check=True,
+                       stdout=subprocess.PIPE)
+    commands = {}
+    for entry in json.loads(p.stdout):
+        output = entry.get('output')
+        if output:
+            commands[output] = entry['command']
+    return commands
+
+
+def rehash_log(build_dir: pathlib.Path):
+    '''
+    .ninja_log stores a hash of each command. commands containing the old
+    paths are rehashed from the rewritten build.ninja, the rest rebuild
+    '''
+    path = build_dir / '.ninja_log'
+    lines = path.read_text().splitlines()
+    if not lines or lines[0] not in ('# ninja log v5', '# ninja log v6'):
+        print(f'unknown {path} version. every target rebuilds')
+        return
+    commands = ninja_commands(build_dir)
+    out = [lines[0]]
+    rehashed = 0
+    for line in lines[1:]:
+        fields = line.split('\t')
+        if len(fields) == 5 and fields[3] in commands:
+            fields[4] = format(
+                murmur_hash64a(commands[fields[3]].encode('utf-8')), 'x')
+            rehashed += 1
+        out.append('\t'.join(fields))
+    path.write_text('\n'.join(out) + '\n')
+    print(f'rehashed {rehashed} of {len(lines) - 1} log entries')
+
+
+def transplant_mtimes(src: pathlib.Path, dst: pathlib.Path,
+                      changed: List[str]):
+    '''
+    a fresh checkout is newer than every seeded object.
+    unchanged sources get the seed's mtime
+    '''
+    changed_set = set(changed)
+    count = 0
+    for root, dirs, files in os.walk(dst):
+        if '.git' in dirs:
+            dirs.remove('.git')
+        for name in files:
+            path = pathlib.Path(root) / name
+            rel = path.relative_to(dst).as_posix()
+            if rel in changed_set:
+                continue
+            try:
+                st = (src / rel).stat()
+            except OSError:
+                continue
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            count += 1
+    print(f'{count} unchanged sources, {len(changed_set)} changed')
+
+
+def seed(tag: str, source: str):
+    src_base = TAGS_DIR / source
+    dst_base = TAGS_DIR / tag
+    build_dir = dst_base / 'bpy'
+    if build_dir.exists():
+        raise Exception(f'{build_dir} exists')
+    print(f'seed {tag} from {source}')
+    copy_tree(src_base / 'bpy', build_dir)
+
+    # CMakeCache.txt has the directories without a trailing slash.
+    # the source and build directories one at a time, siblings stay as they are
+    deps = build_dir / '.ninja_deps'
+    for name in ('blender', 'bpy'):
+        old = f'{src_base / name}'
+        new = f'{dst_base / name}'
+        print(f'{name}: rewrite {rewrite_text(build_dir, old, new)} files')
+        if deps.exists():
+            rewrite_deps(deps, old, new)
+    rehash_log(build_dir)
+
+    changed = git(['diff', '--name-only', source, tag]).splitlines()
+    transplant_mtimes(src_base / 'blender', dst_base / 'blender', changed)
+
+
+def seed_from_nearest(tag: str, candidates: List[str], by: str = 'commits'):
+    '''
+    doit action. nothing to do without a built tag or with an existing build
+    '''
+    if (TAGS_DIR / tag / 'bpy').exists():
+        return
+    source = nearest(tag, candidates, by)
+    if source:
+        seed(tag, source)
+
+
+def main():
+    parser = argparse.ArgumentParser('seed a tag build from a built tag')
+    parser.add_argument('tag')
+    parser.add_argument('--from', dest='source', default='')
+    parser.add_argument('--by', choices=['commits', 'files'], default='commits')
+    parsed = parser.parse_args()
+
+    source = parsed.source
+    if not source:
+        import gittags
+        source = nearest(parsed.tag, gittags.read_tags(CLONE_DIR), parsed.by)
+        if not source:
+            print('no built tag')
+            return
+    seed(parsed.tag, source)
+
+
+if __name__ == '__main__':
+    main()
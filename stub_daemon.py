@@ -0,0 +1,243 @@
+'''
+regenerate stubs when the generator or the installed bpy changes
+
+rna_info.BuildRNAInfo() runs once. an edit to stub_generator.py or a --watch
+file regenerates every selected module from the RNA data in memory, there is no
+per module dependency tracking. only files with new content are written, the
+saving is in the disk writes and the editor reindex, not in the generation.
+an edit to bpy_numpy.py regenerates its stub alone. a rebuilt bpy restarts the
+daemon, the RNA has to be read again.
+
+    python stub_daemon.py typings --watch overrides.json
+'''
+import argparse
+import ctypes
+import ctypes.util
+import importlib
+import io
+import os
+import pathlib
+import struct
+import sys
+import time
+from typing import Callable, Dict, List, Set
+
+HERE = pathlib.Path(__file__).absolute().parent
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0x00000800
+# the kernel queue overflowed, events were dropped. wd is -1
+IN_Q_OVERFLOW = 0x00004000
+EVENT_HEADER = struct.Struct('iIII')
+# editors save in bursts
+DEBOUNCE = 0.05
+
+
+class InotifyWatcher:
+    '''
+    watches the parent directories, editors often replace files by rename
+    '''
+    def __init__(self, paths: List[pathlib.Path]):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self.paths = {p.absolute() for p in paths}
+        # for the rescan after a queue overflow
+        self.mtimes = {p: PollWatcher._mtime(p) for p in self.paths}
+        self.dirs: Dict[int, pathlib.Path] = {}
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ATTRIB
+        for d in {p.parent for p in self.paths}:
+            wd = self.libc.inotify_add_watch(self.fd, str(d).encode(), mask)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch: {d}')
+            self.dirs[wd] = d
+
+    def _read(self) -> Set[pathlib.Path]:
+        changed: Set[pathlib.Path] = set()
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode()
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                changed |= self._rescan()
+                continue
+            d = self.dirs.get(wd)
+            if d is None:
+                # IN_IGNORED of a removed directory
+                continue
+            path = d / name
+            if path in self.paths:
+                self.mtimes[path] = PollWatcher._mtime(path)
+                changed.add(path)
+        return changed
+
+    def _rescan(self) -> Set[pathlib.Path]:
+        '''
+        events were dropped. the files whose mtime moved
+        '''
+        changed = set()
+        for path, mtime in self.mtimes.items():
+            current = PollWatcher._mtime(path)
+            if current != mtime:
+                self.mtimes[path] = current
+                changed.add(path)
+        return changed
+
+    def wait(self) -> Set[pathlib.Path]:
+        import select
+        while True:
+            select.select([self.fd], [], [])
+            changed = self._read()
+            if changed:
+                time.sleep(DEBOUNCE)
+                return changed | self._read()
+
+
+class PollWatcher:
+    '''
+    fallback without inotify
+    '''
+    def __init__(self, paths: List[pathlib.Path], interval: float = 0.2):
+        self.interval = interval
+        self.mtimes = {p.absolute(): self._mtime(p) for p in paths}
+
+    @staticmethod
+    def _mtime(path: pathlib.Path) -> float:
+        try:
+            return path.stat().st_mtime
+        except OSError:
+            return 0
+
+    def wait(self) -> Set[pathlib.Path]:
+        while True:
+            time.sleep(self.interval)
+            changed = set()
+            for path, mtime in self.mtimes.items():
+                current = self._mtime(path)
+                if current != mtime:
+                    self.mtimes[path] = current
+                    changed.add(path)
+            if changed:
+                return changed
+
+
+class ChangedOnlyWriter(io.StringIO):
+    def __init__(self, opener: 'ChangedOnlyOpener', path: pathlib.Path):
+        super().__init__()
+        self.opener = opener
+        self.path = path
+
+    def close(self):
+        if not self.closed:
+            self.opener.put(self.path, self.getvalue())
+        super().close()
+
+
+class ChangedOnlyOpener:
+    '''
+    stub_generator opener that skips files with the same content
+    '''
+    def __init__(self):
+        self.contents: Dict[pathlib.Path, str] = {}
+        self.changed: List[pathlib.Path] = []
+
+    def __call__(self, path: pathlib.Path) -> ChangedOnlyWriter:
+        return ChangedOnlyWriter(self, path)
+
+    def put(self, path: pathlib.Path, text: str):
+        if path not in self.contents and path.exists():
+            self.contents[path] = path.read_text(encoding='utf-8')
+        if self.contents.get(path) == text:
+            return
+        self.contents[path] = text
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.tmp')
+        tmp.write_text(text, encoding='utf-8')
+        os.replace(tmp, path)
+        self.changed.append(path)
+
+
+def timed(name: str, opener: ChangedOnlyOpener, func: Callable[[], None]):
+    opener.changed.clear()
+    start = time.perf_counter()
+    func()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f'{name}: {len(opener.changed)} files in {elapsed:.0f}ms')
+    for path in opener.changed:
+        print(f'  {path}')
+
+
+def main():
+    parser = argparse.ArgumentParser('stub regeneration daemon')
+    parser.add_argument('dst')
+    parser.add_argument('--only', nargs='+')
+    parser.add_argument('--watch',
+                        nargs='*',
+                        default=[],
+                        help='config inputs. any change re-emits everything')
+    parsed = parser.parse_args()
+    dst = pathlib.Path(parsed.dst).absolute()
+
+    import bpy
+    import stub_generator
+    # None without numpy, its stub is skipped
+    bpy_numpy = stub_generator.import_bpy_numpy()
+
+    start = time.perf_counter()
+    rna = stub_generator.rna_info.BuildRNAInfo()
+    print(f'BuildRNAInfo: {time.perf_counter() - start:.1f}s')
+    opener = ChangedOnlyOpener()
+
+    def generate_all():
+        # always the full selection. the generator code may change any module
+        # reload mutates the module objects in place
+        if bpy_numpy:
+            importlib.reload(bpy_numpy)
+        importlib.reload(stub_generator)
+        stub_generator.StubGenerator(opener).generate(dst, parsed.only, rna)
+
+    timed('generate', opener, generate_all)
+
+    generator_py = HERE / 'stub_generator.py'
+    numpy_py = HERE / 'bpy_numpy.py'
+    bpy_binary = pathlib.Path(bpy.__file__).absolute()
+    config = [pathlib.Path(p).absolute() for p in parsed.watch]
+    paths = [generator_py, numpy_py, bpy_binary] + config
+    try:
+        watcher = InotifyWatcher(paths)
+    except (OSError, AttributeError, TypeError):
+        watcher = PollWatcher(paths)
+    print(f'watching {len(paths)} files with {type(watcher).__name__}')
+
+    while True:
+        changed = watcher.wait()
+        if bpy_binary in changed:
+            print(f'{bpy_binary} changed. restart')
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+        if generator_py in changed or changed & set(config):
+            timed('generate', opener, generate_all)
+        elif bpy_numpy and numpy_py in changed and (
+                parsed.only is None or stub_generator.NUMPY_MODULE in
+                stub_generator.Selection.parse(parsed.only).modules):
+
+            def generate_numpy():
+                importlib.reload(bpy_numpy)
+                stub_generator.StubGenerator(opener).generate_module(
+                    dst, bpy_numpy)
+
+            timed('bpy_numpy', opener, generate_numpy)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,778 +1,958 @@
-from builder import python_define
-from inspect import isclass, ismodule
-import io
-from io import TextIOWrapper
-from re import split
-import types
-import inspect
-import pathlib
-import sys
-import re
-from typing import Collection, DefaultDict, List, Dict, NamedTuple, Optional, Any
-
-import bpy
-import bpy_extras.io_utils # type: ignore
-import bpy_extras.image_utils # type: ignore
-import mathutils # type: ignore
-# these two strange lines below are just to make the debugging easier (to let it run many times from within Blender)
-import imp
-import rna_info # type: ignore
-imp.reload(
-    rna_info
-)  # to avoid repeated arguments in function definitions on second and the next runs - a bug in rna_info.py....
-
-HERE = pathlib.Path(__file__).parent
-PY_DIR = pathlib.Path(sys.executable).parent
-# BL_DIR = PY_DIR / 'Lib/site-packages/blender'
-
-
-class PythonType:
-    def __init__(self, name: str):
-        self.name = name
-        self.base: Optional[PythonType] = None
-
-    def __str__(self) -> str:
-        # quoted
-        return f"'{self.name}'"
-
-
-class BuiltinType(PythonType):
-    def __init__(self, name: str):
-        super().__init__(name)
-
-    def __str__(self) -> str:
-        return f"{self.name}"
-
-
-class PropCollectionType(PythonType):
-    def __init__(self, item_type: PythonType):
-        super().__init__(f"bpy_prop_collection[{item_type}]")
-        self.item_type = item_type
-
-    def __str__(self) -> str:
-        return f"'bpy_prop_collection[{self.item_type.name}]'"
-
-
-class NoType(PythonType):
-    def __init__(self):
-        super().__init__('')
-
-
-class AnyType(PythonType):
-    def __init__(self):
-        super().__init__('Any')
-
-
-class UnionType(PythonType):
-    def __init__(self, *args):
-        super().__init__('Union')
-        self.types = args
-
-    def __str__(self) -> str:
-        types = ', '.join([str(t) for t in self.types])
-        return f"'Union[{types}]'"
-
-
-class TupleType(PythonType):
-    def __init__(self, item_type: PythonType, length: int):
-        super().__init__('Tuple')
-        self.item_type = item_type
-        self.length = length
-
-
-class PythonTypeFactory:
-    def __init__(self):
-        STR = BuiltinType('str')
-        BOOL = BuiltinType('bool')
-        INT = BuiltinType('int')
-        FLOAT = BuiltinType('float')
-        DATETIME = BuiltinType('datetime.timedelta')
-        self.python_type_map: Dict[str, PythonType] = {
-            'str':
-            STR,
-            'string':
-            STR,
-            'boolean':
-            BOOL,
-            'bool':
-            BOOL,
-            'int':
-            INT,
-            'float':
-            FLOAT,
-            'int or float.':
-            UnionType(INT, FLOAT),
-            'int, float or ``datetime.timedelta``.':
-            UnionType(INT, FLOAT, DATETIME),
-            'datetime.timedelta':
-            DATETIME,
-            'number or a ``datetime.timedelta`` object':
-            UnionType(FLOAT, DATETIME)
-        }
-        # #
-        # 'function':
-        # 'Callable[[], None]',
-        # 'sequence':
-        # 'List[Any]',
-        # 'class':
-        # 'type',
-        # 'sequence of string tuples or a function':
-        # 'List[str]',
-        # 'string or set':
-        # 'str',
-        # 'type':
-        # 'type',
-        # #
-        # 'set':
-        # 'set',
-        # 'list':
-        # 'list',
-        # #
-        # 'sequence of numbers':
-        # 'Sequence[float]',
-        # '2d number sequence':
-        # 'Sequence[Tuple[float, float]]',
-        # 'float triplet':
-        # 'Tuple[float, float, float]',
-        # '3d vector':
-        # 'Tuple[float, float, float]',
-        # 'Vector':
-        # 'Vector',
-        # ':class:`Vector`':
-        # 'Vector',
-        # 'Matrix Access':
-        # 'Matrix',
-        # ':class:`Matrix`':
-        # 'Matrix',
-        # ':class:`Quaternion`':
-        # 'Quaternion',
-        # '(:class:`Vector`, :class:`Quaternion`, :class:`Vector`)':
-        # 'Tuple[Vector, Quaternion, Vector]',
-        # ':class:`Euler`':
-        # 'Euler',
-        # '(:class:`Vector`, float) pair':
-        # 'Tuple[Vector, float]',
-        # '(:class:`Quaternion`, float) pair':
-        # 'Tuple[Quaternion, float]',
-        # 'tuple':
-        # 'List[float]',
-        # 'tuple of strings':
-        # 'List[str]',
-        # 'list of strings':
-        # 'List[str]',
-        # 'collection of strings or None.':
-        # 'List[str]',
-        # 'generator':
-        # 'List[Any]',
-        # 'tuple pair of functions':
-        # 'Any',
-        # ':class:`bpy.types.WorkSpaceTool` subclass.':
-        # 'bpy.types.WorkSpaceTool',
-        # }
-        self.enum_map = {}
-        self.any_type = AnyType()
-        self.no_type = NoType()
-        self.str_type = PythonType('str')
-        self.matrix_type = PythonType('Matrix')
-        self.vector_type = PythonType('Vector')
-
-    def from_name(self, src: str, array_length: int = 0) -> PythonType:
-        pt = self.python_type_map.get(src)
-        if pt:
-            if array_length:
-                if pt.name == 'float':
-                    if array_length == 9:
-                        return self.matrix_type
-                    if array_length == 16:
-                        return self.matrix_type
-                    return self.vector_type
-                return TupleType(pt, array_length)
-            else:
-                return pt
-
-        if not src:
-            return self.any_type
-
-        if src == 'any':
-            return self.any_type
-
-        if src.startswith('string in '):
-            # ToDo: ENUM
-            return self.from_name('str')
-
-        # new type
-        pt = PythonType(src)
-        print(src)
-        self.python_type_map[src] = pt
-        return pt
-
-    def from_prop(self, prop) -> PythonType:
-        if prop.type == 'collection':
-            item_type = self.from_name(prop.fixed_type.identifier)
-            pt = PropCollectionType(item_type)
-            if pt.name not in self.python_type_map:
-                self.python_type_map[pt.name] = pt
-
-            if prop.srna:
-                collection_type = self.from_name(prop.srna.identifier)
-                collection_type.base = pt
-                return collection_type
-            else:
-                return pt
-
-        if prop.type == 'enum':
-            key = f'Enum{prop.identifier[0].upper()}{prop.identifier[1:]}'
-            self.enum_map[key] = prop.enum_items
-            return self.from_name('str')  #key
-
-        if prop.type == 'pointer':
-            return self.from_name(prop.fixed_type.identifier)
-
-        return self.from_name(prop.type, prop.array_length)
-
-
-FACTORY = PythonTypeFactory()
-
-
-class StubProperty(NamedTuple):
-    name: str
-    type: PythonType
-    description: str = ''
-    default: Any = None
-
-    @staticmethod
-    def from_rna(prop) -> 'StubProperty':
-        return StubProperty(prop.identifier, FACTORY.from_prop(prop),
-                            f'{prop.description} {prop.enum_items}',
-                            prop.default_str)
-
-    def __str__(self) -> str:
-        if self.default is None:
-            return f'{self.name}: {self.type}'
-        else:
-            return f'{self.name}: {self.type} = {self.default}'
-
-
-def format_function(name: str, is_method: bool, params: List[StubProperty],
-                    ret_types: List[PythonType]) -> str:
-    indent = '    ' if is_method else ''
-    str_ret_types = [str(r) for r in ret_types]
-    str_params = [str(p) for p in params]
-    if is_method:
-        str_params = ['self'] + str_params
-
-    if not ret_types:
-        return f'{indent}def {name}({", ".join(str_params)}) -> None: ... # noqa'
-    elif len(ret_types) == 1:
-        return f'{indent}def {name}({", ".join(str_params)}) -> {str_ret_types[0]}: ... # noqa'
-    else:
-        return f'{indent}def {name}({", ".join(str_params)}) -> Tuple[{", ".join(str_ret_types)}]: ... # noqa'
-
-
-class StubFunction(NamedTuple):
-    name: str
-    ret_types: List[PythonType]
-    params: List[StubProperty]
-    is_method: bool
-
-    def __str__(self) -> str:
-        return format_function(self.name, self.is_method, self.params,
-                               self.ret_types)
-
-    @staticmethod
-    def from_rna(func, is_method: bool) -> 'StubFunction':
-        ret_values = [FACTORY.from_prop(v) for v in func.return_values]
-        args = [StubProperty.from_rna(a) for a in func.args]
-        return StubFunction(func.identifier, ret_values, args, is_method)
-
-
-class StubStruct:
-    def __init__(self, type: PythonType, properties: List[StubProperty],
-                 methods: List[StubFunction], refs: List[str]):
-        self.type = type
-        self.properties: List[StubProperty] = properties
-        self.methods: List[StubFunction] = methods
-        self.refs = refs
-
-    def set_prop_type(self, prop_name: str, prop_type: PythonType):
-        for i, prop in enumerate(self.properties):
-            if prop.type.name == prop_name:
-                self.properties[i] = StubProperty(prop.name, prop_type)
-                print(f'{self.type}.{prop.name} = {prop_type}')
-                return
-
-    def to_str(self, types: List['StubStruct']) -> str:
-        sio = io.StringIO()
-        sio.write(f'class {self.type.name}')
-        if self.type.base:
-            base_name = str(self.type.base).replace("'", '')
-            sio.write(f'({base_name})')
-        sio.write(':\n')
-
-        for prop in self.properties:
-            if self.type.name == 'RenderEngine' and prop.name == 'render':
-                # skip
-                continue
-            sio.write(f'    # {prop.description}\n')
-            sio.write(f'    {prop.name}: {prop.type}\n')
-
-        for func in self.methods:
-            sio.write(f'{func}\n')
-
-        if self.type.name == 'Object':
-            # hard coding
-            sio.write(f"    children: bpy_prop_collection['Object']\n")
-
-        if not self.properties and not self.methods:
-            sio.write('    pass\n')
-
-        return sio.getvalue()
-
-    def enable_base(self, used: List[PythonType]) -> bool:
-        if not self.type.base:
-            return True
-
-        if self.type.base.name == self.type.name:
-            return True
-
-        for u in used:
-            if self.type.base == u:
-                return True
-            if isinstance(
-                    self.type.base,
-                    PropCollectionType) and self.type.base.item_type == u:
-                return True
-
-        return False
-
-    @staticmethod
-    def from_rna(s) -> 'StubStruct':
-        base: Optional[PythonType] = None
-        self_type = FACTORY.from_name(s.identifier)
-        if s.base:
-            base = FACTORY.from_name(s.base.identifier)
-            self_type.base = base
-
-        if s.identifier == 'Object':
-            print(s)
-        stub = StubStruct(
-            self_type, [StubProperty.from_rna(prop) for prop in s.properties],
-            [StubFunction.from_rna(func, True) for func in s.functions],
-            s.references[:]
-            if s.description.startswith('Collection of ') else [])
-        if s.identifier == 'UVLoopLayers':
-            print(s)
-        return stub
-
-
-def escape_enum_name(src: str) -> str:
-    return src.replace(' ', '').replace('-', '')
-
-
-class StubModule:
-    def __init__(self, name: str) -> None:
-        self.name = name
-        self.types: List[StubStruct] = []
-
-    def __str__(self) -> str:
-        return f'{self.name}({len(self.types)}types)'
-
-    def push(self, _s) -> None:
-        if _s.identifier == 'PropertyGroupItem':
-            # skip
-            return
-        self.types.append(StubStruct.from_rna(_s))
-
-    def enumerate(self):
-        types = self.types[:]
-        used = []
-
-        while len(types):
-            remove = []
-            for t in types:
-                if t.enable_base(used):
-                    remove.append(t)
-                    yield t
-            if len(remove) == 0:
-                raise Exception('Error')
-            used += [r.type for r in remove]
-            for r in remove:
-                types.remove(r)
-
-    def generate(self, dir: pathlib.Path, prev: str, additional: List[str]):
-        bpy_types_pyi: pathlib.Path = dir / self.name.replace(
-            '.', '/') / '__init__.py'
-        bpy_types_pyi.parent.mkdir(parents=True, exist_ok=True)
-        print(bpy_types_pyi)
-        with open(bpy_types_pyi, 'w', encoding='utf-8') as w:
-            w.write(
-                'from typing import Any, Tuple, List, Generic, TypeVar, Iterator, overload\n'
-            )
-            w.write('from mathutils import Vector, Matrix\n')
-            w.write('\n')
-            w.write('\n')
-
-            # prefix
-            w.write(prev)
-            w.write('\n')
-
-            # types
-            for t in self.enumerate():
-                w.write(t.to_str(self.types))
-                w.write('\n')
-                w.write('\n')
-
-            # suffix
-            for a in additional:
-                w.write(f'{a}\n')
-
-
-RET = ':return:'
-RT = ':rtype:'
-# ':rtype: :class:`Color`.. note:: use this to get a copy of a wrapped color withno reference to the original data.'
-RT_PATTERN = re.compile(r':rtype:\s*:class:`(\w+)`')
-ARG = ':arg '
-TP = ':type '
-
-
-def split_doc(doc: str):
-    splited = re.split(r'\n+', doc, maxsplit=2)
-    num = len(splited)
-    if num == 3:
-        return (x.strip() for x in splited)
-    elif num == 2:
-        return splited[0].strip(), splited[1].strip(), ''
-    else:
-        return splited[0].strip(), '', ''
-
-
-class ParseFunction:
-    def __init__(self, name: str, doc: str):
-        self.name = name
-        self.params = []
-        self.rtypes = []
-
-        _summary, _description, params_rtype = split_doc(doc)
-
-        if params_rtype:
-            current = ''
-            for l in params_rtype.splitlines():
-                l = l.strip()
-                if l.startswith(RET):
-                    self._append(current)
-                    current = l
-                elif l.startswith(RT):
-                    self._append(current)
-                    current = l
-                elif l.startswith(ARG):
-                    self._append(current)
-                    current = l
-                elif l.startswith(TP):
-                    self._append(current)
-                    current = l
-                else:
-                    current += l
-            self._append(current)
-
-    def _append(self, src: str):
-        if not src:
-            return
-
-        m = RT_PATTERN.match(src)
-        if m:
-            self.rtypes.append(m[1])
-        elif src.startswith(RT):
-            splitted = src[len(RT):].split(':')
-            if len(splitted) == 1:
-                self.rtypes.append(splitted[0])
-            else:
-                name = splitted[0]
-                param_type = splitted[1]
-                self.rtypes.append(FACTORY.from_name(param_type.strip()))
-        elif src.startswith(TP):
-            splitted = src[len(TP):].split(':')
-            name = splitted[0]
-            param_type = splitted[1]
-            self.params.append(
-                f'{name.strip()}: {FACTORY.from_name(param_type.strip())}')
-        # elif src == ':param rgb: (r, g, b) color values':
-        #     self.params.append('rgb: Tuple[float, float, float]')
-        # elif src == ':param seq: size 3 or 4':
-        #     self.params.append('seq: Sequence[float]')
-        else:
-            a = 0
-
-    def write_to(self, w: TextIOWrapper, isMethod: bool):
-        w.write(format_function(self.name, isMethod, self.params, self.rtypes))
-
-
-class ParseClass:
-    def __init__(self, name: str, klass: type):
-        self.name = name
-        self.props = []
-        self.methods: List[ParseFunction] = []
-
-        if klass.__doc__:
-            # constructor
-            if self.name == 'Quaternion':
-                constructor = ParseFunction('__init__', '')
-                constructor.params.append('*args')
-                self.methods.append(constructor)
-            else:
-                self.methods.append(ParseFunction('__init__', klass.__doc__))
-
-        for k, v in klass.__dict__.items():
-            if k.startswith('__'):
-                continue
-            attr_type = type(v)
-            if attr_type == types.GetSetDescriptorType:
-                if v.__doc__:
-                    m = re.search(r':type:\s*(.*)$', v.__doc__)
-                    if m:
-                        t = FACTORY.from_name(m.group(1))
-                        self.props.append(f'    {k}: {t}\n')
-
-            elif attr_type == types.MethodDescriptorType:
-                if v.__doc__:
-                    self.methods.append(ParseFunction(k, v.__doc__))
-            else:
-                # print(name, k, attr_type, v)
-                pass
-
-    def write_to(self, w: TextIOWrapper):
-        w.write(f'class {self.name}:\n')
-        if self.methods or self.props:
-            for p in self.props:
-                w.write(p)
-            for m in self.methods:
-                m.write_to(w, True)
-                w.write('\n')
-        else:
-            w.write(f'    pass\n')
-
-
-class StubGenerator:
-    '''
-    blender/doc/python_api/sphinx_doc_gen.py
-    '''
-    def __init__(self):
-        self.stub_module_map: Dict[str, StubModule] = {}
-
-    def get_or_create_stub_module(self, name: str) -> StubModule:
-        stub_module = self.stub_module_map.get(name)
-        if stub_module:
-            return stub_module
-
-        stub_module = StubModule(name)
-        self.stub_module_map[name] = stub_module
-        return stub_module
-
-    def generate(self, dst_dir: pathlib.Path):
-        '''
-        generate stubs files for bpy module, mathutils... etc
-        '''
-
-        # read all data:
-        structs, funcs, ops, props = rna_info.BuildRNAInfo()
-
-        for s in structs.values():
-            stub_module = self.get_or_create_stub_module(s.module_name)
-            stub_module.push(s)
-
-        # __init__.pyi
-        bpy_pyi: pathlib.Path = dst_dir / 'bpy/__init__.pyi'
-        bpy_pyi.parent.mkdir(parents=True, exist_ok=True)
-        with open(bpy_pyi, 'w') as w:
-            w.write('from . import types, utils, ops\n')
-            ## add
-            w.write('data: types.BlendData\n')
-            # Changes in Blender will force errors here
-            context_type_map = {
-                # context_member: (RNA type, is_collection)
-                "active_annotation_layer": ("GPencilLayer", False),
-                "active_base": ("ObjectBase", False),
-                "active_bone": ("EditBone", False),
-                "active_gpencil_frame": ("GreasePencilLayer", True),
-                "active_gpencil_layer": ("GPencilLayer", True),
-                "active_node": ("Node", False),
-                "active_object": ("Object", False),
-                "active_operator": ("Operator", False),
-                "active_pose_bone": ("PoseBone", False),
-                "active_editable_fcurve": ("FCurve", False),
-                "annotation_data": ("GreasePencil", False),
-                "annotation_data_owner": ("ID", False),
-                "armature": ("Armature", False),
-                "bone": ("Bone", False),
-                "brush": ("Brush", False),
-                "camera": ("Camera", False),
-                "cloth": ("ClothModifier", False),
-                "collection": ("LayerCollection", False),
-                "collision": ("CollisionModifier", False),
-                "curve": ("Curve", False),
-                "dynamic_paint": ("DynamicPaintModifier", False),
-                "edit_bone": ("EditBone", False),
-                "edit_image": ("Image", False),
-                "edit_mask": ("Mask", False),
-                "edit_movieclip": ("MovieClip", False),
-                "edit_object": ("Object", False),
-                "edit_text": ("Text", False),
-                "editable_bones": ("EditBone", True),
-                "editable_gpencil_layers": ("GPencilLayer", True),
-                "editable_gpencil_strokes": ("GPencilStroke", True),
-                "editable_objects": ("Object", True),
-                "editable_fcurves": ("FCurve", True),
-                "fluid": ("FluidSimulationModifier", False),
-                "gpencil": ("GreasePencil", False),
-                "gpencil_data": ("GreasePencil", False),
-                "gpencil_data_owner": ("ID", False),
-                "hair": ("Hair", False),
-                "image_paint_object": ("Object", False),
-                "lattice": ("Lattice", False),
-                "light": ("Light", False),
-                "lightprobe": ("LightProbe", False),
-                "line_style": ("FreestyleLineStyle", False),
-                "material": ("Material", False),
-                "material_slot": ("MaterialSlot", False),
-                "mesh": ("Mesh", False),
-                "meta_ball": ("MetaBall", False),
-                "object": ("Object", False),
-                "objects_in_mode": ("Object", True),
-                "objects_in_mode_unique_data": ("Object", True),
-                "particle_edit_object": ("Object", False),
-                "particle_settings": ("ParticleSettings", False),
-                "particle_system": ("ParticleSystem", False),
-                "particle_system_editable": ("ParticleSystem", False),
-                "pointcloud": ("PointCloud", False),
-                "pose_bone": ("PoseBone", False),
-                "pose_object": ("Object", False),
-                "scene": ("Scene", False),
-                "sculpt_object": ("Object", False),
-                "selectable_objects": ("Object", True),
-                "selected_bones": ("EditBone", True),
-                "selected_editable_bones": ("EditBone", True),
-                "selected_editable_fcurves": ("FCurve", True),
-                "selected_editable_objects": ("Object", True),
-                "selected_editable_sequences": ("Sequence", True),
-                "selected_nla_strips": ("NlaStrip", True),
-                "selected_nodes": ("Node", True),
-                # "selected_objects": ("Object", True),
-                "selected_pose_bones": ("PoseBone", True),
-                "selected_pose_bones_from_active_object": ("PoseBone", True),
-                "selected_sequences": ("Sequence", True),
-                "selected_visible_fcurves": ("FCurve", True),
-                "sequences": ("Sequence", True),
-                "soft_body": ("SoftBodyModifier", False),
-                "speaker": ("Speaker", False),
-                "texture": ("Texture", False),
-                "texture_slot": ("MaterialTextureSlot", False),
-                "texture_user": ("ID", False),
-                "texture_user_property": ("Property", False),
-                "vertex_paint_object": ("Object", False),
-                "view_layer": ("ViewLayer", False),
-                "visible_bones": ("EditBone", True),
-                "visible_gpencil_layers": ("GPencilLayer", True),
-                "visible_objects": ("Object", True),
-                "visible_pose_bones": ("PoseBone", True),
-                "visible_fcurves": ("FCurve", True),
-                "weight_paint_object": ("Object", False),
-                "volume": ("Volume", False),
-                "world": ("World", False),
-            }
-            w.write('''
-class Context(types.Context):
-    selected_objects: types.bpy_prop_collection[types.Object]
-context: Context
-''')
-
-        for k, v in self.stub_module_map.items():
-            if k == 'bpy.types':
-                v.generate(
-                    dst_dir, '''T = TypeVar('T')
-class bpy_prop_collection(Generic[T]):
-    def __len__(self) -> int: ... # noqa
-    @overload
-    def __getitem__(self, i) -> T: ... # noqa
-    @overload
-    def __getitem__(self, s: slice) -> 'bpy_prop_collection[T]': ... # noqa
-    def __iter__(self) -> Iterator[T]: ... # noqa
-    def find(self, key: str) -> int: ... # noqa
-    def get(self, key, default=None): ... # noqa
-    def items(self): ... # noqa
-    def keys(self): ... # noqa
-    def values(self): ... # noqa
-
-''', ['VIEW3D_MT_object: List[Any]'])
-            else:
-                print(k)
-
-        # standalone modules
-        self.generate_module(dst_dir, mathutils)
-        self.generate_module(dst_dir, bpy.utils) # type: ignore
-        self.generate_module(dst_dir, bpy.props) # type: ignore
-        self.generate_module(dst_dir, bpy.ops, 'bpy.ops') # type: ignore
-        self.generate_module(dst_dir, bpy_extras.io_utils)
-        self.generate_module(dst_dir, bpy_extras.image_utils)
-
-    def generate_module(self, dst_dir: pathlib.Path, m: types.ModuleType, module_name=''):
-        '''
-        pymodule2sphinx
-        py_descr2sphinx
-        '''
-
-        module_name = module_name if module_name else m.__name__
-        bpy_pyi: pathlib.Path = dst_dir / f'{module_name.replace(".", "/")}/__init__.pyi'
-        bpy_pyi.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(bpy_pyi, 'w', encoding='utf-8') as w:
-            w.write('''from typing import Tuple, List, Any, Callable, Sequence
-import bpy
-import datetime
-''')
-            if module_name != 'mathutils':
-                w.write('from mathutils import Vector\n')
-            w.write('\n')
-
-            if ismodule(m):
-                for name, klass in inspect.getmembers(m, inspect.isclass):
-                    ParseClass(name, klass).write_to(w)
-                    w.write('\n')
-                    w.write('\n')
-
-                for name, func in inspect.getmembers(m, inspect.isroutine):
-                    if name.endswith('Property'):
-                        w.write(f'def {name}(**kw) -> Any: ... # noqa\n')
-
-                    else:
-                        if func.__doc__:
-                            if name in ['register_class', 'unregister_class']:
-                                w.write(
-                                    format_function(name, False, [
-                                        StubProperty('klass', FACTORY.any_type,
-                                                     '')
-                                    ], []))
-                            else:
-                                func = ParseFunction(name,
-                                                     func.__doc__).write_to(
-                                                         w, False)
-                            w.write('\n')
-                        else:
-                            print(name, func)
-            else:
-                if str(type(m)) == "<class 'bpy.ops.BPyOps'>":
-                    for key in dir(m):
-                        attr = getattr(m, key)
-                        if str(type(attr)) == "<class 'bpy.ops.BPyOpsSubMod'>":
-                            self.generate_module(dst_dir, attr, f'{module_name}.{key}')
-                            w.write(f'from . import {key}\n')
-                else:
-                    for key in dir(m):
-                        attr = getattr(m, key)
-                        w.write(f'def {key}(*args, **kw): ... # noqa\n')
-
-
-if __name__ == "__main__":
-    generator = StubGenerator()
-    dst = PY_DIR / 'Lib/site-packages/blender'
-    if len(sys.argv)>1:
-        dst = pathlib.Path(sys.argv[1])
-    generator.generate(dst)
+from builder import python_define
+import argparse
+from inspect import isclass, ismodule
+import io
+from io import TextIOWrapper
+from re import split
+import types
+import inspect
+import pathlib
+import sys
+import re
+from typing import Callable, Collection, DefaultDict, List, Dict, NamedTuple, Optional, Any, Set, TextIO
+
+import bpy
+import bpy_extras.io_utils # type: ignore
+import bpy_extras.image_utils # type: ignore
+import mathutils # type: ignore
+# these two strange lines below are just to make the debugging easier (to let it run many times from within Blender)
+import imp
+import rna_info # type: ignore
+imp.reload(
+    rna_info
+)  # to avoid repeated arguments in function definitions on second and the next runs - a bug in rna_info.py....
+
+HERE = pathlib.Path(__file__).parent
+PY_DIR = pathlib.Path(sys.executable).parent
+# BL_DIR = PY_DIR / 'Lib/site-packages/blender'
+
+
+class PythonType:
+    def __init__(self, name: str):
+        self.name = name
+        self.base: Optional[PythonType] = None
+
+    def __str__(self) -> str:
+        # quoted
+        return f"'{self.name}'"
+
+
+class BuiltinType(PythonType):
+    def __init__(self, name: str):
+        super().__init__(name)
+
+    def __str__(self) -> str:
+        return f"{self.name}"
+
+
+class PropCollectionType(PythonType):
+    def __init__(self, item_type: PythonType):
+        super().__init__(f"bpy_prop_collection[{item_type}]")
+        self.item_type = item_type
+
+    def __str__(self) -> str:
+        return f"'bpy_prop_collection[{self.item_type.name}]'"
+
+
+class NoType(PythonType):
+    def __init__(self):
+        super().__init__('')
+
+
+class AnyType(PythonType):
+    def __init__(self):
+        super().__init__('Any')
+
+
+class UnionType(PythonType):
+    def __init__(self, *args):
+        super().__init__('Union')
+        self.types = args
+
+    def __str__(self) -> str:
+        types = ', '.join([str(t) for t in self.types])
+        return f"'Union[{types}]'"
+
+
+class TupleType(PythonType):
+    def __init__(self, item_type: PythonType, length: int):
+        super().__init__('Tuple')
+        self.item_type = item_type
+        self.length = length
+
+
+class PythonTypeFactory:
+    def __init__(self):
+        STR = BuiltinType('str')
+        BOOL = BuiltinType('bool')
+        INT = BuiltinType('int')
+        FLOAT = BuiltinType('float')
+        DATETIME = BuiltinType('datetime.timedelta')
+        self.python_type_map: Dict[str, PythonType] = {
+            'str':
+            STR,
+            'string':
+            STR,
+            'boolean':
+            BOOL,
+            'bool':
+            BOOL,
+            'int':
+            INT,
+            'float':
+            FLOAT,
+            'int or float.':
+            UnionType(INT, FLOAT),
+            'int, float or ``datetime.timedelta``.':
+            UnionType(INT, FLOAT, DATETIME),
+            'datetime.timedelta':
+            DATETIME,
+            'number or a ``datetime.timedelta`` object':
+            UnionType(FLOAT, DATETIME)
+        }
+        # #
+        # 'function':
+        # 'Callable[[], None]',
+        # 'sequence':
+        # 'List[Any]',
+        # 'class':
+        # 'type',
+        # 'sequence of string tuples or a function':
+        # 'List[str]',
+        # 'string or set':
+        # 'str',
+        # 'type':
+        # 'type',
+        # #
+        # 'set':
+        # 'set',
+        # 'list':
+        # 'list',
+        # #
+        # 'sequence of numbers':
+        # 'Sequence[float]',
+        # '2d number sequence':
+        # 'Sequence[Tuple[float, float]]',
+        # 'float triplet':
+        # 'Tuple[float, float, float]',
+        # '3d vector':
+        # 'Tuple[float, float, float]',
+        # 'Vector':
+        # 'Vector',
+        # ':class:`Vector`':
+        # 'Vector',
+        # 'Matrix Access':
+        # 'Matrix',
+        # ':class:`Matrix`':
+        # 'Matrix',
+        # ':class:`Quaternion`':
+        # 'Quaternion',
+        # '(:class:`Vector`, :class:`Quaternion`, :class:`Vector`)':
+        # 'Tuple[Vector, Quaternion, Vector]',
+        # ':class:`Euler`':
+        # 'Euler',
+        # '(:class:`Vector`, float) pair':
+        # 'Tuple[Vector, float]',
+        # '(:class:`Quaternion`, float) pair':
+        # 'Tuple[Quaternion, float]',
+        # 'tuple':
+        # 'List[float]',
+        # 'tuple of strings':
+        # 'List[str]',
+        # 'list of strings':
+        # 'List[str]',
+        # 'collection of strings or None.':
+        # 'List[str]',
+        # 'generator':
+        # 'List[Any]',
+        # 'tuple pair of functions':
+        # 'Any',
+        # ':class:`bpy.types.WorkSpaceTool` subclass.':
+        # 'bpy.types.WorkSpaceTool',
+        # }
+        self.enum_map = {}
+        self.any_type = AnyType()
+        self.no_type = NoType()
+        self.str_type = PythonType('str')
+        self.matrix_type = PythonType('Matrix')
+        self.vector_type = PythonType('Vector')
+
+    def from_name(self, src: str, array_length: int = 0) -> PythonType:
+        pt = self.python_type_map.get(src)
+        if pt:
+            if array_length:
+                if pt.name == 'float':
+                    if array_length == 9:
+                        return self.matrix_type
+                    if array_length == 16:
+                        return self.matrix_type
+                    return self.vector_type
+                return TupleType(pt, array_length)
+            else:
+                return pt
+
+        if not src:
+            return self.any_type
+
+        if src == 'any':
+            return self.any_type
+
+        if src.startswith('string in '):
+            # ToDo: ENUM
+            return self.from_name('str')
+
+        # new type
+        pt = PythonType(src)
+        print(src)
+        self.python_type_map[src] = pt
+        return pt
+
+    def from_prop(self, prop) -> PythonType:
+        if prop.type == 'collection':
+            item_type = self.from_name(prop.fixed_type.identifier)
+            pt = PropCollectionType(item_type)
+            if pt.name not in self.python_type_map:
+                self.python_type_map[pt.name] = pt
+
+            if prop.srna:
+                collection_type = self.from_name(prop.srna.identifier)
+                collection_type.base = pt
+                return collection_type
+            else:
+                return pt
+
+        if prop.type == 'enum':
+            key = f'Enum{prop.identifier[0].upper()}{prop.identifier[1:]}'
+            self.enum_map[key] = prop.enum_items
+            return self.from_name('str')  #key
+
+        if prop.type == 'pointer':
+            return self.from_name(prop.fixed_type.identifier)
+
+        return self.from_name(prop.type, prop.array_length)
+
+
+FACTORY = PythonTypeFactory()
+
+
+class StubProperty(NamedTuple):
+    name: str
+    type: PythonType
+    description: str = ''
+    default: Any = None
+
+    @staticmethod
+    def from_rna(prop) -> 'StubProperty':
+        return StubProperty(prop.identifier, FACTORY.from_prop(prop),
+                            f'{prop.description} {prop.enum_items}',
+                            prop.default_str)
+
+    def __str__(self) -> str:
+        if self.default is None:
+            return f'{self.name}: {self.type}'
+        else:
+            return f'{self.name}: {self.type} = {self.default}'
+
+
+def format_function(name: str, is_method: bool, params: List[StubProperty],
+                    ret_types: List[PythonType]) -> str:
+    indent = '    ' if is_method else ''
+    str_ret_types = [str(r) for r in ret_types]
+    str_params = [str(p) for p in params]
+    if is_method:
+        str_params = ['self'] + str_params
+
+    if not ret_types:
+        return f'{indent}def {name}({", ".join(str_params)}) -> None: ... # noqa'
+    elif len(ret_types) == 1:
+        return f'{indent}def {name}({", ".join(str_params)}) -> {str_ret_types[0]}: ... # noqa'
+    else:
+        return f'{indent}def {name}({", ".join(str_params)}) -> Tuple[{", ".join(str_ret_types)}]: ... # noqa'
+
+
+class StubFunction(NamedTuple):
+    name: str
+    ret_types: List[PythonType]
+    params: List[StubProperty]
+    is_method: bool
+
+    def __str__(self) -> str:
+        return format_function(self.name, self.is_method, self.params,
+                               self.ret_types)
+
+    @staticmethod
+    def from_rna(func, is_method: bool) -> 'StubFunction':
+        ret_values = [FACTORY.from_prop(v) for v in func.return_values]
+        args = [StubProperty.from_rna(a) for a in func.args]
+        return StubFunction(func.identifier, ret_values, args, is_method)
+
+
+class StubStruct:
+    def __init__(self, type: PythonType, properties: List[StubProperty],
+                 methods: List[StubFunction], refs: List[str]):
+        self.type = type
+        self.properties: List[StubProperty] = properties
+        self.methods: List[StubFunction] = methods
+        self.refs = refs
+
+    def set_prop_type(self, prop_name: str, prop_type: PythonType):
+        for i, prop in enumerate(self.properties):
+            if prop.type.name == prop_name:
+                self.properties[i] = StubProperty(prop.name, prop_type)
+                print(f'{self.type}.{prop.name} = {prop_type}')
+                return
+
+    def to_str(self, types: List['StubStruct']) -> str:
+        sio = io.StringIO()
+        sio.write(f'class {self.type.name}')
+        if self.type.base:
+            base_name = str(self.type.base).replace("'", '')
+            sio.write(f'({base_name})')
+        sio.write(':\n')
+
+        for prop in self.properties:
+            if self.type.name == 'RenderEngine' and prop.name == 'render':
+                # skip
+                continue
+            sio.write(f'    # {prop.description}\n')
+            sio.write(f'    {prop.name}: {prop.type}\n')
+
+        for func in self.methods:
+            sio.write(f'{func}\n')
+
+        if self.type.name == 'Object':
+            # hard coding
+            sio.write(f"    children: bpy_prop_collection['Object']\n")
+
+        if not self.properties and not self.methods:
+            sio.write('    pass\n')
+
+        return sio.getvalue()
+
+    def enable_base(self, used: List[PythonType]) -> bool:
+        if not self.type.base:
+            return True
+
+        if self.type.base.name == self.type.name:
+            return True
+
+        for u in used:
+            if self.type.base == u:
+                return True
+            if isinstance(
+                    self.type.base,
+                    PropCollectionType) and self.type.base.item_type == u:
+                return True
+
+        return False
+
+    @staticmethod
+    def from_rna(s) -> 'StubStruct':
+        base: Optional[PythonType] = None
+        self_type = FACTORY.from_name(s.identifier)
+        if s.base:
+            base = FACTORY.from_name(s.base.identifier)
+            self_type.base = base
+
+        if s.identifier == 'Object':
+            print(s)
+        stub = StubStruct(
+            self_type, [StubProperty.from_rna(prop) for prop in s.properties],
+            [StubFunction.from_rna(func, True) for func in s.functions],
+            s.references[:]
+            if s.description.startswith('Collection of ') else [])
+        if s.identifier == 'UVLoopLayers':
+            print(s)
+        return stub
+
+
+def open_file(path: pathlib.Path) -> TextIO:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return open(path, 'w', encoding='utf-8')
+
+
+def escape_enum_name(src: str) -> str:
+    return src.replace(' ', '').replace('-', '')
+
+
+class StubModule:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.types: List[StubStruct] = []
+
+    def __str__(self) -> str:
+        return f'{self.name}({len(self.types)}types)'
+
+    def push(self, _s) -> None:
+        if _s.identifier == 'PropertyGroupItem':
+            # skip
+            return
+        self.types.append(StubStruct.from_rna(_s))
+
+    def enumerate(self):
+        types = self.types[:]
+        used = []
+
+        while len(types):
+            remove = []
+            for t in types:
+                if t.enable_base(used):
+                    remove.append(t)
+                    yield t
+            if len(remove) == 0:
+                raise Exception('Error')
+            used += [r.type for r in remove]
+            for r in remove:
+                types.remove(r)
+
+    def generate(self,
+                 dir: pathlib.Path,
+                 prev: str,
+                 additional: List[str],
+                 opener: Callable[[pathlib.Path], TextIO] = open_file):
+        bpy_types_pyi: pathlib.Path = dir / self.name.replace(
+            '.', '/') / '__init__.py'
+        print(bpy_types_pyi)
+        with opener(bpy_types_pyi) as w:
+            w.write(
+                'from typing import Any, Tuple, List, Generic, TypeVar, Iterator, overload\n'
+            )
+            w.write('from mathutils import Vector, Matrix\n')
+            w.write('\n')
+            w.write('\n')
+
+            # prefix
+            w.write(prev)
+            w.write('\n')
+
+            # types
+            for t in self.enumerate():
+                w.write(t.to_str(self.types))
+                w.write('\n')
+                w.write('\n')
+
+            # suffix
+            for a in additional:
+                w.write(f'{a}\n')
+
+
+RET = ':return:'
+RT = ':rtype:'
+# ':rtype: :class:`Color`.. note:: use this to get a copy of a wrapped color withno reference to the original data.'
+RT_PATTERN = re.compile(r':rtype:\s*:class:`(\w+)`')
+ARG = ':arg '
+TP = ':type '
+
+
+def split_doc(doc: str):
+    splited = re.split(r'\n+', doc, maxsplit=2)
+    num = len(splited)
+    if num == 3:
+        return (x.strip() for x in splited)
+    elif num == 2:
+        return splited[0].strip(), splited[1].strip(), ''
+    else:
+        return splited[0].strip(), '', ''
+
+
+class ParseFunction:
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.params = []
+        self.rtypes = []
+
+        _summary, _description, params_rtype = split_doc(doc)
+
+        if params_rtype:
+            current = ''
+            for l in params_rtype.splitlines():
+                l = l.strip()
+                if l.startswith(RET):
+                    self._append(current)
+                    current = l
+                elif l.startswith(RT):
+                    self._append(current)
+                    current = l
+                elif l.startswith(ARG):
+                    self._append(current)
+                    current = l
+                elif l.startswith(TP):
+                    self._append(current)
+                    current = l
+                else:
+                    current += l
+            self._append(current)
+
+    def _append(self, src: str):
+        if not src:
+            return
+
+        m = RT_PATTERN.match(src)
+        if m:
+            self.rtypes.append(m[1])
+        elif src.startswith(RT):
+            splitted = src[len(RT):].split(':')
+            if len(splitted) == 1:
+                self.rtypes.append(splitted[0])
+            else:
+                name = splitted[0]
+                param_type = splitted[1]
+                self.rtypes.append(FACTORY.from_name(param_type.strip()))
+        elif src.startswith(TP):
+            splitted = src[len(TP):].split(':')
+            name = splitted[0]
+            param_type = splitted[1].strip()
+            if param_type.endswith(', optional'):
+                param_type = param_type[:-len(', optional')]
+                self.params.append(
+                    f'{name.strip()}: {FACTORY.from_name(param_type)} = ...')
+            else:
+                self.params.append(
+                    f'{name.strip()}: {FACTORY.from_name(param_type)}')
+        # elif src == ':param rgb: (r, g, b) color values':
+        #     self.params.append('rgb: Tuple[float, float, float]')
+        # elif src == ':param seq: size 3 or 4':
+        #     self.params.append('seq: Sequence[float]')
+        else:
+            a = 0
+
+    def write_to(self, w: TextIOWrapper, isMethod: bool):
+        w.write(format_function(self.name, isMethod, self.params, self.rtypes))
+
+
+class ParseClass:
+    def __init__(self, name: str, klass: type):
+        self.name = name
+        self.props = []
+        self.methods: List[ParseFunction] = []
+
+        if klass.__doc__:
+            # constructor
+            if self.name == 'Quaternion':
+                constructor = ParseFunction('__init__', '')
+                constructor.params.append('*args')
+                self.methods.append(constructor)
+            else:
+                self.methods.append(ParseFunction('__init__', klass.__doc__))
+
+        for k, v in klass.__dict__.items():
+            if k.startswith('__'):
+                continue
+            attr_type = type(v)
+            if attr_type == types.GetSetDescriptorType:
+                if v.__doc__:
+                    m = re.search(r':type:\s*(.*)$', v.__doc__)
+                    if m:
+                        t = FACTORY.from_name(m.group(1))
+                        self.props.append(f'    {k}: {t}\n')
+
+            elif attr_type == types.MethodDescriptorType:
+                if v.__doc__:
+                    self.methods.append(ParseFunction(k, v.__doc__))
+            else:
+                # print(name, k, attr_type, v)
+                pass
+
+    def write_to(self, w: TextIOWrapper):
+        w.write(f'class {self.name}:\n')
+        if self.methods or self.props:
+            for p in self.props:
+                w.write(p)
+            for m in self.methods:
+                m.write_to(w, True)
+                w.write('\n')
+        else:
+            w.write(f'    pass\n')
+
+
+STANDALONE_MODULES = {
+    'mathutils': mathutils,
+    'bpy.utils': bpy.utils,  # type: ignore
+    'bpy.props': bpy.props,  # type: ignore
+    'bpy_extras.io_utils': bpy_extras.io_utils,
+    'bpy_extras.image_utils': bpy_extras.image_utils,
+}
+# needs numpy, which the bpy builds do not install (WITH_PYTHON_INSTALL_NUMPY=OFF)
+NUMPY_MODULE = 'bpy_numpy'
+
+
+def import_bpy_numpy() -> Optional[types.ModuleType]:
+    '''
+    None without numpy
+    '''
+    try:
+        import bpy_numpy
+    except ImportError:
+        return None
+    return bpy_numpy
+
+
+def struct_closure(structs, names: Set[str]) -> Set[str]:
+    '''
+    names and every struct reachable through bases, pointer and collection
+    properties and function parameters.
+    StubStruct.refs point back to the referencing structs and are not followed
+    '''
+    lookup = {s.identifier: s for s in structs}
+    result: Set[str] = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name in result or name not in lookup:
+            continue
+        result.add(name)
+        s = lookup[name]
+        if s.base:
+            stack.append(s.base.identifier)
+        props = list(s.properties)
+        for func in s.functions:
+            props += func.args
+            props += func.return_values
+        for prop in props:
+            if prop.fixed_type:
+                stack.append(prop.fixed_type.identifier)
+            if prop.srna:
+                # collection wrapper, e.g. BlendDataObjects
+                stack.append(prop.srna.identifier)
+    return result
+
+
+class Selection(NamedTuple):
+    '''
+    --only Object Mesh ops.mesh mathutils
+
+    * bpy.types: all types
+    * ops: all operators, ops.NAME: one operator namespace
+    * STANDALONE_MODULES key or bpy_numpy: the module
+    * others: a type and its closure
+    '''
+    types: Set[str]
+    all_types: bool
+    ops: Set[str]
+    modules: Set[str]
+
+    @staticmethod
+    def parse(selectors: List[str]) -> 'Selection':
+        types: Set[str] = set()
+        ops: Set[str] = set()
+        modules: Set[str] = set()
+        all_types = False
+        for selector in selectors:
+            if selector == 'bpy.types':
+                all_types = True
+            elif selector in ('ops', 'bpy.ops'):
+                ops.add('*')
+            elif selector.startswith('ops.') or selector.startswith('bpy.ops.'):
+                ops.add(selector.split('.')[-1])
+            elif selector in STANDALONE_MODULES or selector == NUMPY_MODULE:
+                modules.add(selector)
+            else:
+                types.add(selector)
+        return Selection(types, all_types, ops, modules)
+
+    def has_op(self, name: str) -> bool:
+        return '*' in self.ops or name in self.ops
+
+
+class StubGenerator:
+    '''
+    blender/doc/python_api/sphinx_doc_gen.py
+    '''
+    def __init__(self, opener: Callable[[pathlib.Path], TextIO] = open_file):
+        self.stub_module_map: Dict[str, StubModule] = {}
+        self.opener = opener
+        self.selection: Optional[Selection] = None
+        # rna_info.InfoOperatorRNA of the generated namespaces
+        self.ops: List[Any] = []
+
+    def get_or_create_stub_module(self, name: str) -> StubModule:
+        stub_module = self.stub_module_map.get(name)
+        if stub_module:
+            return stub_module
+
+        stub_module = StubModule(name)
+        self.stub_module_map[name] = stub_module
+        return stub_module
+
+    def generate(self,
+                 dst_dir: pathlib.Path,
+                 only: Optional[List[str]] = None,
+                 rna: Optional[tuple] = None):
+        '''
+        generate stubs files for bpy module, mathutils... etc
+        only: selectors of Selection. everything if None
+        rna: result of rna_info.BuildRNAInfo() to reuse
+        '''
+
+        # read all data:
+        structs, funcs, ops, props = rna if rna else rna_info.BuildRNAInfo()
+
+        selected: Optional[Set[str]] = None
+        if only is not None:
+            self.selection = Selection.parse(only)
+            if not self.selection.all_types:
+                selected = struct_closure(structs.values(),
+                                          self.selection.types)
+                print(f'{len(selected)} of {len(structs)} types')
+
+        self.ops = [
+            op for op in ops.values()
+            if not self.selection or self.selection.has_op(op.module_name)
+        ]
+
+        for s in structs.values():
+            if selected is not None and s.identifier not in selected:
+                continue
+            stub_module = self.get_or_create_stub_module(s.module_name)
+            stub_module.push(s)
+
+        # __init__.pyi
+        bpy_pyi: pathlib.Path = dst_dir / 'bpy/__init__.pyi'
+        with self.opener(bpy_pyi) as w:
+            if self.selection:
+                submodules = ['types'] if selected is None or selected else []
+                if 'bpy.utils' in self.selection.modules:
+                    submodules.append('utils')
+                if self.selection.ops:
+                    submodules.append('ops')
+                w.write('from typing import Any\n')
+                if submodules:
+                    w.write(f'from . import {", ".join(submodules)}\n')
+            else:
+                w.write('from . import types, utils, ops\n')
+            ## add
+            if selected is None or 'BlendData' in selected:
+                w.write('data: types.BlendData\n')
+            else:
+                w.write('data: Any\n')
+            # Changes in Blender will force errors here
+            context_type_map = {
+                # context_member: (RNA type, is_collection)
+                "active_annotation_layer": ("GPencilLayer", False),
+                "active_base": ("ObjectBase", False),
+                "active_bone": ("EditBone", False),
+                "active_gpencil_frame": ("GreasePencilLayer", True),
+                "active_gpencil_layer": ("GPencilLayer", True),
+                "active_node": ("Node", False),
+                "active_object": ("Object", False),
+                "active_operator": ("Operator", False),
+                "active_pose_bone": ("PoseBone", False),
+                "active_editable_fcurve": ("FCurve", False),
+                "annotation_data": ("GreasePencil", False),
+                "annotation_data_owner": ("ID", False),
+                "armature": ("Armature", False),
+                "bone": ("Bone", False),
+                "brush": ("Brush", False),
+                "camera": ("Camera", False),
+                "cloth": ("ClothModifier", False),
+                "collection": ("LayerCollection", False),
+                "collision": ("CollisionModifier", False),
+                "curve": ("Curve", False),
+                "dynamic_paint": ("DynamicPaintModifier", False),
+                "edit_bone": ("EditBone", False),
+                "edit_image": ("Image", False),
+                "edit_mask": ("Mask", False),
+                "edit_movieclip": ("MovieClip", False),
+                "edit_object": ("Object", False),
+                "edit_text": ("Text", False),
+                "editable_bones": ("EditBone", True),
+                "editable_gpencil_layers": ("GPencilLayer", True),
+                "editable_gpencil_strokes": ("GPencilStroke", True),
+                "editable_objects": ("Object", True),
+                "editable_fcurves": ("FCurve", True),
+                "fluid": ("FluidSimulationModifier", False),
+                "gpencil": ("GreasePencil", False),
+                "gpencil_data": ("GreasePencil", False),
+                "gpencil_data_owner": ("ID", False),
+                "hair": ("Hair", False),
+                "image_paint_object": ("Object", False),
+                "lattice": ("Lattice", False),
+                "light": ("Light", False),
+                "lightprobe": ("LightProbe", False),
+                "line_style": ("FreestyleLineStyle", False),
+                "material": ("Material", False),
+                "material_slot": ("MaterialSlot", False),
+                "mesh": ("Mesh", False),
+                "meta_ball": ("MetaBall", False),
+                "object": ("Object", False),
+                "objects_in_mode": ("Object", True),
+                "objects_in_mode_unique_data": ("Object", True),
+                "particle_edit_object": ("Object", False),
+                "particle_settings": ("ParticleSettings", False),
+                "particle_system": ("ParticleSystem", False),
+                "particle_system_editable": ("ParticleSystem", False),
+                "pointcloud": ("PointCloud", False),
+                "pose_bone": ("PoseBone", False),
+                "pose_object": ("Object", False),
+                "scene": ("Scene", False),
+                "sculpt_object": ("Object", False),
+                "selectable_objects": ("Object", True),
+                "selected_bones": ("EditBone", True),
+                "selected_editable_bones": ("EditBone", True),
+                "selected_editable_fcurves": ("FCurve", True),
+                "selected_editable_objects": ("Object", True),
+                "selected_editable_sequences": ("Sequence", True),
+                "selected_nla_strips": ("NlaStrip", True),
+                "selected_nodes": ("Node", True),
+                # "selected_objects": ("Object", True),
+                "selected_pose_bones": ("PoseBone", True),
+                "selected_pose_bones_from_active_object": ("PoseBone", True),
+                "selected_sequences": ("Sequence", True),
+                "selected_visible_fcurves": ("FCurve", True),
+                "sequences": ("Sequence", True),
+                "soft_body": ("SoftBodyModifier", False),
+                "speaker": ("Speaker", False),
+                "texture": ("Texture", False),
+                "texture_slot": ("MaterialTextureSlot", False),
+                "texture_user": ("ID", False),
+                "texture_user_property": ("Property", False),
+                "vertex_paint_object": ("Object", False),
+                "view_layer": ("ViewLayer", False),
+                "visible_bones": ("EditBone", True),
+                "visible_gpencil_layers": ("GPencilLayer", True),
+                "visible_objects": ("Object", True),
+                "visible_pose_bones": ("PoseBone", True),
+                "visible_fcurves": ("FCurve", True),
+                "weight_paint_object": ("Object", False),
+                "volume": ("Volume", False),
+                "world": ("World", False),
+            }
+            if selected is None or {'Context', 'Object'} <= selected:
+                w.write('''
+class Context(types.Context):
+    selected_objects: types.bpy_prop_collection[types.Object]
+context: Context
+''')
+            else:
+                w.write('context: Any\n')
+
+        for k, v in self.stub_module_map.items():
+            if k == 'bpy.types':
+                v.generate(
+                    dst_dir, '''T = TypeVar('T')
+class bpy_prop_collection(Generic[T]):
+    def __len__(self) -> int: ... # noqa
+    @overload
+    def __getitem__(self, i) -> T: ... # noqa
+    @overload
+    def __getitem__(self, s: slice) -> 'bpy_prop_collection[T]': ... # noqa
+    def __iter__(self) -> Iterator[T]: ... # noqa
+    def find(self, key: str) -> int: ... # noqa
+    def get(self, key, default=None): ... # noqa
+    def items(self): ... # noqa
+    def keys(self): ... # noqa
+    def values(self): ... # noqa
+
+''', ['VIEW3D_MT_object: List[Any]'], self.opener)
+            else:
+                print(k)
+
+        # standalone modules
+        for name, m in STANDALONE_MODULES.items():
+            if not self.selection or name in self.selection.modules:
+                self.generate_module(dst_dir, m)
+        if not self.selection or NUMPY_MODULE in self.selection.modules:
+            bpy_numpy = import_bpy_numpy()
+            if bpy_numpy:
+                self.generate_module(dst_dir, bpy_numpy)
+            else:
+                print(f'{NUMPY_MODULE}: no numpy. skipped')
+        if not self.selection or self.selection.ops:
+            self.generate_module(dst_dir, bpy.ops, 'bpy.ops') # type: ignore
+
+    def generate_module(self, dst_dir: pathlib.Path, m: types.ModuleType, module_name=''):
+        '''
+        pymodule2sphinx
+        py_descr2sphinx
+        '''
+
+        module_name = module_name if module_name else m.__name__
+        bpy_pyi: pathlib.Path = dst_dir / f'{module_name.replace(".", "/")}/__init__.pyi'
+
+        with self.opener(bpy_pyi) as w:
+            w.write('''from typing import Tuple, List, Any, Callable, Sequence
+import bpy
+import datetime
+''')
+            if module_name != 'mathutils':
+                w.write('from mathutils import Vector\n')
+            if module_name == 'bpy_numpy':
+                w.write('import numpy\n')
+            w.write('\n')
+
+            if ismodule(m):
+                for name, klass in inspect.getmembers(m, inspect.isclass):
+                    ParseClass(name, klass).write_to(w)
+                    w.write('\n')
+                    w.write('\n')
+
+                for name, func in inspect.getmembers(m, inspect.isroutine):
+                    if name.endswith('Property'):
+                        w.write(f'def {name}(**kw) -> Any: ... # noqa\n')
+
+                    else:
+                        if func.__doc__:
+                            if name in ['register_class', 'unregister_class']:
+                                w.write(
+                                    format_function(name, False, [
+                                        StubProperty('klass', FACTORY.any_type,
+                                                     '')
+                                    ], []))
+                            else:
+                                func = ParseFunction(name,
+                                                     func.__doc__).write_to(
+                                                         w, False)
+                            w.write('\n')
+                        else:
+                            print(name, func)
+            else:
+                if str(type(m)) == "<class 'bpy.ops.BPyOps'>":
+                    for key in dir(m):
+                        attr = getattr(m, key)
+                        if str(type(attr)) == "<class 'bpy.ops.BPyOpsSubMod'>":
+                            if self.selection and not self.selection.has_op(key):
+                                continue
+                            self.generate_module(dst_dir, attr, f'{module_name}.{key}')
+                            w.write(f'from . import {key}\n')
+                else:
+                    for key in dir(m):
+                        attr = getattr(m, key)
+                        w.write(f'def {key}(*args, **kw): ... # noqa\n')
+
+
+def main():
+    parser = argparse.ArgumentParser('bpy stub generator')
+    parser.add_argument('dst',
+                        nargs='?',
+                        default=str(PY_DIR / 'Lib/site-packages/blender'))
+    parser.add_argument('--store', help='generate into a stub_store.py store')
+    parser.add_argument('--tag', default=bpy.app.version_string)
+    parser.add_argument(
+        '--only',
+        nargs='+',
+        help='types, ops.NAME or modules. types include their dependencies')
+    parser.add_argument('--index', help='also write a stub_index.py database')
+    parsed = parser.parse_args()
+
+    if parsed.store:
+        import stub_store
+        store = stub_store.StubStore(pathlib.Path(parsed.store).absolute())
+        dst = pathlib.Path('stubs')
+        generator = StubGenerator(lambda path: store.writer(
+            parsed.tag,
+            path.relative_to(dst).as_posix()))
+        generator.generate(dst, parsed.only)
+        store.commit(parsed.tag)
+    else:
+        generator = StubGenerator()
+        generator.generate(pathlib.Path(parsed.dst), parsed.only)
+
+    if parsed.index:
+        import stub_index
+        stub_index.build(pathlib.Path(parsed.index),
+                         generator.stub_module_map.values(), generator.ops,
+                         FACTORY.from_prop)
+
+
+if __name__ == "__main__":
+    main()
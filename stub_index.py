@@ -0,0 +1,173 @@
+'''
+sqlite index of the RNA api. built by stub_generator.py, queried without blender
+
+    python stub_generator.py --index api.db
+    python stub_index.py api.db refs Mesh
+    python stub_index.py api.db subclasses ID
+    python stub_index.py api.db ops-with-param filepath
+    python stub_index.py api.db struct Object
+    python stub_index.py api.db sql "select count(*) from structs"
+'''
+import argparse
+import os
+import pathlib
+import sqlite3
+import time
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+SCHEMA = '''
+CREATE TABLE structs(name TEXT PRIMARY KEY, module TEXT, base TEXT);
+CREATE TABLE properties(struct TEXT, name TEXT, type TEXT, item_type TEXT, description TEXT);
+CREATE TABLE functions(id INTEGER PRIMARY KEY, struct TEXT, name TEXT);
+CREATE TABLE params(function INTEGER, name TEXT, type TEXT, item_type TEXT, is_return INTEGER);
+CREATE TABLE collection_refs(struct TEXT, ref TEXT);
+CREATE TABLE operators(id INTEGER PRIMARY KEY, namespace TEXT, name TEXT, description TEXT);
+CREATE TABLE operator_params(operator INTEGER, name TEXT, type TEXT, description TEXT);
+CREATE INDEX structs_base ON structs(base);
+CREATE INDEX properties_struct ON properties(struct);
+CREATE INDEX properties_type ON properties(type);
+CREATE INDEX properties_item_type ON properties(item_type);
+CREATE INDEX functions_struct ON functions(struct);
+CREATE INDEX params_function ON params(function);
+CREATE INDEX params_type ON params(type);
+CREATE INDEX params_item_type ON params(item_type);
+CREATE INDEX collection_refs_struct ON collection_refs(struct);
+CREATE INDEX operators_name ON operators(namespace, name);
+CREATE INDEX operator_params_name ON operator_params(name);
+CREATE INDEX operator_params_operator ON operator_params(operator);
+'''
+
+
+def type_names(t) -> Tuple[str, Optional[str]]:
+    '''
+    PythonType => (name, collection item name)
+    '''
+    item = getattr(t, 'item_type', None)
+    if not item and getattr(t, 'base', None):
+        # collection wrapper such as BlendDataMeshes
+        item = getattr(t.base, 'item_type', None)
+    return t.name, item.name if item else None
+
+
+def build(path: pathlib.Path, stub_modules: Iterable[Any], ops: Iterable[Any],
+          type_of_prop: Callable[[Any], Any]):
+    '''
+    stub_modules: StubModule
+    ops: rna_info.InfoOperatorRNA
+    type_of_prop: PythonTypeFactory.from_prop
+    '''
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    if tmp.exists():
+        tmp.unlink()
+    db = sqlite3.connect(str(tmp))
+    db.executescript(SCHEMA)
+    for module in stub_modules:
+        for s in module.types:
+            name = s.type.name
+            base = s.type.base.name if s.type.base else None
+            db.execute('INSERT OR REPLACE INTO structs VALUES(?, ?, ?)',
+                       (name, module.name, base))
+            db.executemany('INSERT INTO properties VALUES(?, ?, ?, ?, ?)',
+                           [(name, p.name, *type_names(p.type), p.description)
+                            for p in s.properties])
+            for func in s.methods:
+                cur = db.execute(
+                    'INSERT INTO functions(struct, name) VALUES(?, ?)',
+                    (name, func.name))
+                rows = [(cur.lastrowid, p.name, *type_names(p.type), 0)
+                        for p in func.params]
+                rows += [(cur.lastrowid, '', *type_names(t), 1)
+                         for t in func.ret_types]
+                db.executemany('INSERT INTO params VALUES(?, ?, ?, ?, ?)', rows)
+            db.executemany('INSERT INTO collection_refs VALUES(?, ?)',
+                           [(name, ref) for ref in s.refs])
+    for op in ops:
+        cur = db.execute(
+            'INSERT INTO operators(namespace, name, description) VALUES(?, ?, ?)',
+            (op.module_name, op.func_name, op.description))
+        db.executemany('INSERT INTO operator_params VALUES(?, ?, ?, ?)',
+                       [(cur.lastrowid, a.identifier, type_of_prop(a).name,
+                         a.description) for a in op.args])
+    db.commit()
+    db.close()
+    os.replace(tmp, path)
+    print(f'index: {path}')
+
+
+#
+# queries
+#
+def refs(db: sqlite3.Connection, name: str) -> List[tuple]:
+    '''
+    structs that have a property, parameter or return value of type name
+    '''
+    return db.execute(
+        '''
+SELECT struct, name, 'property' FROM properties WHERE type = ?1 OR item_type = ?1
+UNION ALL
+SELECT f.struct, f.name, CASE p.is_return WHEN 1 THEN 'return' ELSE 'param ' || p.name END
+FROM params p JOIN functions f ON f.id = p.function
+WHERE p.type = ?1 OR p.item_type = ?1
+ORDER BY 1, 2''', (name, )).fetchall()
+
+
+def subclasses(db: sqlite3.Connection, name: str) -> List[tuple]:
+    return db.execute(
+        '''
+WITH RECURSIVE sub(name, base, depth) AS (
+    SELECT name, base, 1 FROM structs WHERE base = ?1
+    UNION ALL
+    SELECT s.name, s.base, sub.depth + 1 FROM structs s JOIN sub ON s.base = sub.name
+)
+SELECT name, base, depth FROM sub ORDER BY depth, name''', (name, )).fetchall()
+
+
+def ops_with_param(db: sqlite3.Connection, name: str) -> List[tuple]:
+    return db.execute(
+        '''
+SELECT o.namespace || '.' || o.name, p.type, p.description
+FROM operator_params p JOIN operators o ON o.id = p.operator
+WHERE p.name = ? ORDER BY 1''', (name, )).fetchall()
+
+
+def struct(db: sqlite3.Connection, name: str) -> List[tuple]:
+    rows = db.execute('SELECT module, base FROM structs WHERE name = ?',
+                      (name, )).fetchall()
+    rows += db.execute(
+        'SELECT name, type, item_type FROM properties WHERE struct = ? ORDER BY name',
+        (name, )).fetchall()
+    rows += db.execute(
+        "SELECT name || '()' FROM functions WHERE struct = ? ORDER BY name",
+        (name, )).fetchall()
+    return rows
+
+
+QUERIES = {
+    'refs': refs,
+    'subclasses': subclasses,
+    'ops-with-param': ops_with_param,
+    'struct': struct,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser('query the api index')
+    parser.add_argument('db')
+    parser.add_argument('query', choices=list(QUERIES.keys()) + ['sql'])
+    parser.add_argument('arg')
+    parsed = parser.parse_args()
+
+    db = sqlite3.connect(f'file:{parsed.db}?mode=ro', uri=True)
+    start = time.perf_counter()
+    if parsed.query == 'sql':
+        rows = db.execute(parsed.arg).fetchall()
+    else:
+        rows = QUERIES[parsed.query](db, parsed.arg)
+    elapsed = (time.perf_counter() - start) * 1000
+    for row in rows:
+        print('\t'.join('' if v is None else str(v) for v in row))
+    print(f'# {len(rows)} rows in {elapsed:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+'''
+content addressed store of generated stubs for many blender tags
+
+    STORE
+      + chunks/ab/abcdef...    # class level chunks, stored once
+      + files/ab/abcdef...     # assembled files, hardlinked into trees
+      + manifests/TAG.json     # {relative path: [chunk hash]}
+      + trees/TAG/...          # materialized stub tree
+      + current -> trees/TAG   # point the editor here
+
+    # generate into the store
+    python stub_generator.py --store STORE --tag v2.93.5
+    # import an already generated tree
+    python stub_store.py STORE import v2.93.4 path/to/stubs
+    # switch the active version
+    python stub_store.py STORE use v2.93.4
+'''
+import argparse
+import hashlib
+import io
+import json
+import os
+import pathlib
+import re
+import shutil
+from typing import Dict, List
+
+# a chunk starts at each top level class
+CHUNK_PATTERN = re.compile(r'^(?=class )', re.MULTILINE)
+
+
+def split_chunks(text: str) -> List[str]:
+    return [chunk for chunk in CHUNK_PATTERN.split(text) if chunk]
+
+
+def write_atomic(path: pathlib.Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class StubWriter(io.StringIO):
+    '''
+    collects a stub file and stores it on close
+    '''
+    def __init__(self, store: 'StubStore', tag: str, relpath: str):
+        super().__init__()
+        self.store = store
+        self.tag = tag
+        self.relpath = relpath
+
+    def close(self):
+        if not self.closed:
+            self.store.put_file(self.tag, self.relpath, self.getvalue())
+        super().close()
+
+
+class StubStore:
+    def __init__(self, root: pathlib.Path):
+        self.root = root
+        self.pending: Dict[str, Dict[str, List[str]]] = {}
+
+    def _object(self, kind: str, digest: str) -> pathlib.Path:
+        return self.root / kind / digest[:2] / digest
+
+    def _put(self, kind: str, data: bytes) -> str:
+        digest = hashlib.sha1(data).hexdigest()
+        path = self._object(kind, digest)
+        if not path.exists():
+            write_atomic(path, data)
+        return digest
+
+    def manifest_path(self, tag: str) -> pathlib.Path:
+        return self.root / 'manifests' / f'{tag}.json'
+
+    def tags(self) -> List[str]:
+        return sorted(p.stem for p in (self.root / 'manifests').glob('*.json'))
+
+    def writer(self, tag: str, relpath: str) -> StubWriter:
+        return StubWriter(self, tag, relpath)
+
+    def put_file(self, tag: str, relpath: str, text: str):
+        chunks = [
+            self._put('chunks', chunk.encode('utf-8'))
+            for chunk in split_chunks(text)
+        ]
+        self.pending.setdefault(tag, {})[relpath] = chunks
+
+    def commit(self, tag: str):
+        '''
+        write the manifest of the files put since the last commit
+        '''
+        manifest = self.pending.pop(tag, {})
+        write_atomic(self.manifest_path(tag),
+                     json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+        # the previous tree is stale. rebuilt in place of the old one,
+        # current may point at it
+        if (self.root / 'trees' / tag).exists():
+            self.materialize(tag, rebuild=True)
+        print(f'{tag}: {len(manifest)} files, {sum(len(c) for c in manifest.values())} chunks')
+
+    def import_tree(self, tag: str, src: pathlib.Path):
+        for path in sorted(src.rglob('*.py*')):
+            if path.suffix in ('.py', '.pyi'):
+                self.put_file(tag, path.relative_to(src).as_posix(),
+                              path.read_text(encoding='utf-8'))
+        self.commit(tag)
+
+    def materialize(self, tag: str, rebuild: bool = False) -> pathlib.Path:
+        '''
+        hardlink the files of tag into trees/TAG.
+        rebuild: a new tree is built beside the old one and renamed over it
+        '''
+        tree = self.root / 'trees' / tag
+        if tree.exists() and not rebuild:
+            return tree
+        manifest = json.loads(self.manifest_path(tag).read_text())
+        tmp = tree.with_name(f'.{tag}.{os.getpid()}.tmp')
+        shutil.rmtree(tmp, ignore_errors=True)
+        for relpath, chunks in manifest.items():
+            data = b''.join(
+                self._object('chunks', digest).read_bytes() for digest in chunks)
+            src = self._object('files', self._put('files', data))
+            dst = tmp / relpath
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copyfile(src, dst)
+        if tree.exists():
+            # a directory is not replaced by rename. current dangles between the two renames only
+            old = tree.with_name(f'.{tag}.{os.getpid()}.old')
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(tree, old)
+            os.replace(tmp, tree)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp, tree)
+        return tree
+
+    def use(self, tag: str):
+        '''
+        swap the current symlink
+        '''
+        tree = self.materialize(tag)
+        current = self.root / 'current'
+        tmp = self.root / f'.current.{os.getpid()}.tmp'
+        if tmp.is_symlink():
+            tmp.unlink()
+        os.symlink(tree.relative_to(self.root), tmp, target_is_directory=True)
+        os.replace(tmp, current)
+        print(f'{current} -> {tree}')
+
+    def gc(self):
+        '''
+        remove chunks and files no manifest refers to
+        '''
+        used_chunks = set()
+        used_files = set()
+        for tag in self.tags():
+            manifest = json.loads(self.manifest_path(tag).read_text())
+            for chunks in manifest.values():
+                used_chunks.update(chunks)
+            tree = self.root / 'trees' / tag
+            if tree.exists():
+                used_files.update(
+                    (p.stat().st_ino, p.stat().st_dev) for p in tree.rglob('*')
+                    if p.is_file())
+        removed = 0
+        for path in (self.root / 'chunks').glob('*/*'):
+            if path.name not in used_chunks:
+                path.unlink()
+                removed += 1
+        for path in (self.root / 'files').glob('*/*'):
+            st = path.stat()
+            if (st.st_ino, st.st_dev) not in used_files:
+                path.unlink()
+                removed += 1
+        print(f'gc: {removed} objects')
+
+
+def main():
+    parser = argparse.ArgumentParser('stub store')
+    parser.add_argument('store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list')
+    p = sub.add_parser('import')
+    p.add_argument('tag')
+    p.add_argument('src')
+    p = sub.add_parser('use')
+    p.add_argument('tag')
+    sub.add_parser('gc')
+    parsed = parser.parse_args()
+
+    store = StubStore(pathlib.Path(parsed.store).absolute())
+    if parsed.command == 'list':
+        current = store.root / 'current'
+        active = os.readlink(current) if current.is_symlink() else ''
+        for tag in store.tags():
+            mark = '*' if pathlib.Path(active).name == tag else ' '
+            print(f'{mark} {tag}')
+    elif parsed.command == 'import':
+        store.import_tree(parsed.tag, pathlib.Path(parsed.src))
+    elif parsed.command == 'use':
+        store.use(parsed.tag)
+    elif parsed.command == 'gc':
+        store.gc()
+
+
+if __name__ == '__main__':
+    main()
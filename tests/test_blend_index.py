@@ -0,0 +1,117 @@
+import gzip
+import pathlib
+import sqlite3
+import struct
+from typing import List, Tuple
+
+import pytest
+
+import blend_index
+
+# a minimal SDNA: ID, a library, an image and an object
+NAMES = ['*next', '*prev', '*lib', 'name[66]', 'id', 'filepath[1024]']
+TYPES = [('char', 1), ('void', 0), ('ID', 90), ('Library', 1114), ('Image', 1114), ('Object', 90)]
+STRUCTS = [
+    ('ID', [('void', '*next'), ('void', '*prev'), ('Library', '*lib'), ('char', 'name[66]')]),
+    ('Library', [('ID', 'id'), ('char', 'filepath[1024]')]),
+    ('Image', [('ID', 'id'), ('char', 'filepath[1024]')]),
+    ('Object', [('ID', 'id')]),
+]
+LIBRARY = 0x1000
+
+
+def align4(data: bytes) -> bytes:
+    return data + b'\0' * ((4 - len(data) % 4) % 4)
+
+
+def sdna() -> bytes:
+    type_index = {name: i for i, (name, _) in enumerate(TYPES)}
+    out = [b'SDNA', b'NAME', struct.pack('<i', len(NAMES))]
+    out.append(align4(b''.join(n.encode() + b'\0' for n in NAMES)))
+    out += [b'TYPE', struct.pack('<i', len(TYPES))]
+    out.append(align4(b''.join(t.encode() + b'\0' for t, _ in TYPES)))
+    out.append(b'TLEN' + align4(struct.pack(f'<{len(TYPES)}h', *(n for _, n in TYPES))))
+    out += [b'STRC', struct.pack('<i', len(STRUCTS))]
+    for name, fields in STRUCTS:
+        out.append(struct.pack('<hh', type_index[name], len(fields)))
+        for t, field in fields:
+            out.append(struct.pack('<hh', type_index[t], NAMES.index(field)))
+    return b''.join(out)
+
+
+def id_data(name: str, lib: int = 0, filepath: str = '') -> bytes:
+    data = struct.pack('<QQQ', 0, 0, lib) + name.encode().ljust(66, b'\0')
+    if filepath:
+        data += filepath.encode().ljust(1024, b'\0')
+    return data
+
+
+def block(code: bytes, data: bytes, old: int, sdna_index: int) -> bytes:
+    return struct.pack('<4siQii', code.ljust(4, b'\0'), len(data), old, sdna_index, 1) + data
+
+
+def make_blend() -> bytes:
+    blocks: List[Tuple[bytes, bytes, int, int]] = [
+        (b'LI', id_data('LIassets.blend', filepath='//lib/assets.blend'), LIBRARY, 1),
+        (b'IM', id_data('IMwood', filepath='//textures/wood.png'), 0x2000, 2),
+        (b'OB', id_data('OBCube'), 0x3000, 3),
+        # linked, ID_LINK_PLACEHOLDER
+        (b'ID', id_data('OBSuzanne', lib=LIBRARY), 0x4000, 0),
+        (b'ID', id_data('MAMetal', lib=LIBRARY), 0x5000, 0),
+        (b'DATA', b'\0' * 16, 0x6000, 0),
+        (b'DNA1', sdna(), 0, 0),
+    ]
+    body = b''.join(block(*b) for b in blocks)
+    return b'BLENDER-v402' + body + struct.pack('<4siQii', b'ENDB', 0, 0, 0, 0)
+
+
+EXPECTED = [
+    ('Library', 'assets.blend', '', '//lib/assets.blend'),
+    ('Image', 'wood', '', '//textures/wood.png'),
+    ('Object', 'Cube', '', ''),
+    ('Object', 'Suzanne', '//lib/assets.blend', ''),
+    ('Material', 'Metal', '//lib/assets.blend', ''),
+]
+
+
+def test_read_ids(tmp_path: pathlib.Path):
+    path = tmp_path / 'a.blend'
+    path.write_bytes(make_blend())
+    version, records = blend_index.read_ids(path)
+    assert version == '402'
+    assert [tuple(r) for r in records] == EXPECTED
+
+
+def test_gzip(tmp_path: pathlib.Path):
+    path = tmp_path / 'a.blend'
+    path.write_bytes(gzip.compress(make_blend()))
+    assert [tuple(r) for r in blend_index.read_ids(path)[1]] == EXPECTED
+
+
+def test_zstd_frames(tmp_path: pathlib.Path):
+    try:
+        from compression import zstd  # type: ignore
+        compress = zstd.compress
+    except ImportError:
+        zstandard = pytest.importorskip('zstandard')
+        compress = zstandard.ZstdCompressor().compress
+    data = make_blend()
+    # blender writes the file in many frames
+    path = tmp_path / 'a.blend'
+    path.write_bytes(b''.join(compress(data[i:i + 256]) for i in range(0, len(data), 256)))
+    assert [tuple(r) for r in blend_index.read_ids(path)[1]] == EXPECTED
+
+
+def test_scan_cache(tmp_path: pathlib.Path):
+    (tmp_path / 'a.blend').write_bytes(make_blend())
+    (tmp_path / 'broken.blend').write_bytes(b'not a blend')
+    db = sqlite3.connect(':memory:')
+    assert blend_index.scan(db, [tmp_path], 1) == (2, 0)
+    assert blend_index.scan(db, [tmp_path], 1) == (0, 2)
+    linked = db.execute("SELECT type, name FROM ids WHERE library != '' ORDER BY name").fetchall()
+    assert linked == [('Material', 'Metal'), ('Object', 'Suzanne')]
+    (error, ) = db.execute("SELECT error FROM files WHERE path LIKE '%broken.blend'").fetchone()
+    assert error
+    (tmp_path / 'broken.blend').unlink()
+    blend_index.scan(db, [tmp_path], 1)
+    assert db.execute('SELECT count(*) FROM files').fetchone() == (1, )
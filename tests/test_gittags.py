@@ -0,0 +1,47 @@
+import pathlib
+import subprocess
+
+import gittags
+
+
+def git(args, cwd: pathlib.Path) -> str:
+    return subprocess.run(['git', '-c', 'user.name=t', '-c', 'user.email=t@t'] + args,
+                          cwd=cwd,
+                          check=True,
+                          stdout=subprocess.PIPE).stdout.decode().strip()
+
+
+def make_clone(path: pathlib.Path):
+    git(['init', '-q', str(path)], path.parent)
+    commits = []
+    for i in range(2):
+        (path / 'a.txt').write_text(str(i))
+        git(['add', 'a.txt'], path)
+        git(['commit', '-q', '-m', str(i)], path)
+        commits.append(git(['rev-parse', 'HEAD'], path))
+    git(['tag', 'v1.0.0', commits[0]], path)
+    git(['tag', '-a', '-m', 'release', 'v1.1.0', commits[1]], path)
+    return {'v1.0.0': commits[0], 'v1.1.0': commits[1]}
+
+
+def test_commits_loose(tmp_path: pathlib.Path):
+    expected = make_clone(tmp_path / 'clone')
+    assert gittags.read_commits(tmp_path / 'clone') == expected
+
+
+def test_commits_packed(tmp_path: pathlib.Path):
+    clone = tmp_path / 'clone'
+    expected = make_clone(clone)
+    git(['pack-refs', '--all'], clone)
+    assert not any((clone / '.git/refs/tags').iterdir())
+    assert gittags.read_commits(clone) == expected
+
+
+def test_cached_refs(tmp_path: pathlib.Path):
+    clone = tmp_path / 'clone'
+    expected = make_clone(clone)
+    cache = tmp_path / 'tags.json'
+    assert gittags.cached_tags(clone, cache) == ['v1.0.0', 'v1.1.0']
+    assert gittags.cached_commits(clone, cache) == expected
+    git(['tag', '-d', 'v1.0.0'], clone)
+    assert gittags.cached_commits(clone, cache) == {'v1.1.0': expected['v1.1.0']}
@@ -0,0 +1,86 @@
+import pathlib
+import shutil
+import subprocess
+from typing import List
+
+import perf_bisect
+
+BENCH = '''
+import toy
+if toy.BROKEN:
+    raise SystemExit(1)
+print('noise')
+print(toy.SECONDS)
+'''
+
+
+class ToyBisect(perf_bisect.Bisect):
+    '''
+    the build copies the python files of the worktree to the install
+    '''
+    builds: List[str] = []
+
+    def build(self, commit: str) -> bool:
+        self.checkout(commit)
+        shutil.rmtree(self.install, ignore_errors=True)
+        self.install.mkdir(parents=True)
+        for f in self.worktree.glob('*.py'):
+            shutil.copy(f, self.install)
+        self.builds.append(commit)
+        return True
+
+
+def git(args: List[str], cwd: pathlib.Path) -> str:
+    return subprocess.run(['git'] + args, cwd=cwd, check=True,
+                          stdout=subprocess.PIPE).stdout.decode('utf-8').strip()
+
+
+def make_repo(path: pathlib.Path, seconds: List[float], broken=()) -> List[str]:
+    path.mkdir()
+    git(['init', '-q'], path)
+    git(['config', 'user.email', 'toy@example.com'], path)
+    git(['config', 'user.name', 'toy'], path)
+    commits = []
+    for i, s in enumerate(seconds):
+        (path / 'toy.py').write_text(f'COMMIT = {i}\nSECONDS = {s}\nBROKEN = {i in broken}\n')
+        git(['add', '-A'], path)
+        git(['commit', '-q', '-m', f'commit {i}'], path)
+        commits.append(git(['rev-parse', 'HEAD'], path))
+    return commits
+
+
+def make_bisect(tmp_path: pathlib.Path, commits: List[str]) -> ToyBisect:
+    script = tmp_path / 'bench.py'
+    script.write_text(BENCH)
+    ToyBisect.builds = []
+    return ToyBisect(tmp_path / 'repo', tmp_path / 'work', commits[0], commits[-1], script,
+                     [], 3, 0.05)
+
+
+def test_first_slow_commit(tmp_path: pathlib.Path):
+    commits = make_repo(tmp_path / 'repo', [1.0] * 6 + [1.5] * 6)
+    assert make_bisect(tmp_path, commits).run() == commits[6]
+    assert len(ToyBisect.builds) < len(commits)
+
+
+def test_resume(tmp_path: pathlib.Path):
+    commits = make_repo(tmp_path / 'repo', [1.0] * 6 + [1.5] * 6)
+    make_bisect(tmp_path, commits).run()
+    # the good install is kept and every candidate is in results.jsonl
+    bisect = make_bisect(tmp_path, commits)
+    assert bisect.run() == commits[6]
+    assert ToyBisect.builds == []
+
+
+def test_no_regression(tmp_path: pathlib.Path):
+    commits = make_repo(tmp_path / 'repo', [1.0, 1.01, 1.0, 1.02])
+    assert make_bisect(tmp_path, commits).run() is None
+
+
+def test_skipped_commits(tmp_path: pathlib.Path):
+    # the benchmark fails at 4, 5 and 6. the regression is somewhere in 4..7
+    commits = make_repo(tmp_path / 'repo', [1.0] * 7 + [1.5] * 5, broken={4, 5, 6})
+    assert make_bisect(tmp_path, commits).run() is None
+    results = make_bisect(tmp_path, commits).read_results()
+    assert all(results[commits[i]] is None for i in (4, 5, 6))
+    assert results[commits[3]] is not None and results[commits[7]] is not None
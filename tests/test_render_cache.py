@@ -0,0 +1,103 @@
+import pathlib
+import sys
+import types
+from typing import Any, List
+
+import pytest
+
+import render_cache
+
+RNA_TYPES = {bool: 'BOOLEAN', int: 'INT', float: 'FLOAT', str: 'STRING', tuple: 'FLOAT'}
+
+
+class Struct:
+    '''
+    rna properties of the keyword arguments
+    '''
+    def __init__(self, **props):
+        self.__dict__.update(props)
+        self.bl_rna = types.SimpleNamespace(properties=[
+            types.SimpleNamespace(identifier=k, type=RNA_TYPES.get(type(v), 'POINTER'))
+            for k, v in props.items()
+        ])
+
+
+class Object(Struct):
+    def __init__(self, name: str, location, session_uid: int, users: int, tag: bool):
+        matrix = [[1.0, 0.0, 0.0, location[0]], [0.0, 1.0, 0.0, location[1]],
+                  [0.0, 0.0, 1.0, location[2]], [0.0, 0.0, 0.0, 1.0]]
+        super().__init__(hide_render=False, pass_index=0, location=tuple(location),
+                         session_uid=session_uid, users=users, tag=tag, is_evaluated=False,
+                         original=None)
+        self.original = self
+        self.name = self.name_full = name
+        self.type = 'EMPTY'
+        self.data = None
+        self.instance_type = 'NONE'
+        self.instance_collection = None
+        self.is_instancer = False
+        self.animation_data = None
+        self.material_slots: List[Any] = []
+        self.modifiers: List[Any] = []
+        self.particle_systems: List[Any] = []
+        self.matrix_world = matrix
+        self._pointer = session_uid * 64
+
+    def as_pointer(self) -> int:
+        return self._pointer
+
+
+def scene(objects) -> Any:
+    render = Struct(engine='CYCLES', resolution_x=640, resolution_y=360, threads=8)
+    render.image_settings = Struct(file_format='PNG')
+    return types.SimpleNamespace(
+        name_full='Scene', objects=objects, world=None, use_nodes=False, camera=None,
+        render=render, view_settings=Struct(view_transform='Filmic'),
+        display_settings=Struct(display_device='sRGB'), rigidbody_world=None,
+        frame_current=1)
+
+
+def load(monkeypatch, session: int, users: int, tag: bool, x: float = 0.0):
+    '''
+    a fresh bpy.data of the same file, runtime values of this session
+    '''
+    data = types.SimpleNamespace(filepath='/abs/a.blend', images=[], node_groups=[],
+                                 objects=[], as_pointer=lambda: session)
+    depsgraph = types.SimpleNamespace(object_instances=[])
+    bpy = types.SimpleNamespace(
+        data=data,
+        app=types.SimpleNamespace(version_string='4.2.0', build_hash=b'abc'),
+        context=types.SimpleNamespace(evaluated_depsgraph_get=lambda: depsgraph),
+        path=types.SimpleNamespace(abspath=lambda p, library=None: p))
+    monkeypatch.setitem(sys.modules, 'bpy', bpy)
+    objects = [
+        Object('Empty', (x, 0.0, 0.0), session, users, tag),
+        Object('Empty.001', (0.0, 2.0, 0.0), session + 1, users, tag),
+    ]
+    return scene(objects)
+
+
+@pytest.fixture
+def cache(tmp_path: pathlib.Path):
+    return render_cache.FrameCache(tmp_path)
+
+
+def test_key_of_object_list(monkeypatch, cache):
+    s = load(monkeypatch, 1, 1, False)
+    assert isinstance(cache.static(sys.modules['bpy'], s).objects, list)
+    key = cache.key(s, '.png')
+    assert key == cache.key(s, '.png')
+    assert key != cache.key(s, '.npy')
+
+
+def test_two_loads_same_key(monkeypatch, tmp_path: pathlib.Path):
+    first = render_cache.FrameCache(tmp_path).key(load(monkeypatch, 1, 1, False), '.png')
+    # another session, a viewer node added a user
+    second = render_cache.FrameCache(tmp_path).key(load(monkeypatch, 7, 2, True), '.png')
+    assert first == second
+
+
+def test_moved_object(monkeypatch, tmp_path: pathlib.Path):
+    first = render_cache.FrameCache(tmp_path).key(load(monkeypatch, 1, 1, False), '.png')
+    moved = render_cache.FrameCache(tmp_path).key(load(monkeypatch, 1, 1, False, x=1.0), '.png')
+    assert first != moved
@@ -0,0 +1,28 @@
+import pathlib
+
+import stub_store
+
+
+def write_tree(root: pathlib.Path, text: str) -> pathlib.Path:
+    (root / 'bpy').mkdir(parents=True, exist_ok=True)
+    (root / 'bpy/__init__.pyi').write_text(text)
+    return root
+
+
+def test_reimport_keeps_current(tmp_path: pathlib.Path):
+    store = stub_store.StubStore(tmp_path / 'store')
+    store.import_tree('v1', write_tree(tmp_path / 'a', 'class A: ...\n'))
+    store.use('v1')
+    current = tmp_path / 'store/current/bpy/__init__.pyi'
+    assert current.read_text() == 'class A: ...\n'
+
+    store.import_tree('v1', write_tree(tmp_path / 'b', 'class A: ...\nclass B: ...\n'))
+    assert current.read_text() == 'class A: ...\nclass B: ...\n'
+    assert not list((tmp_path / 'store/trees').glob('.*'))
+
+
+def test_commit_without_tree(tmp_path: pathlib.Path):
+    store = stub_store.StubStore(tmp_path / 'store')
+    store.import_tree('v1', write_tree(tmp_path / 'a', 'class A: ...\n'))
+    assert not (tmp_path / 'store/trees/v1').exists()
+    assert store.tags() == ['v1']
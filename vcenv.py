@@ -50,12 +50,24 @@ def vcvars64() -> Dict[str, str]:
     return new
 
 
+VC_KEYS = ['VCINSTALLDIR', 'PATH', 'INCLUDE', 'LIB']
+
+
 def update_environ():
     vc_map = vcvars64()
-    os.environ['VCINSTALLDIR'] = vc_map['VCINSTALLDIR']
-    os.environ['PATH'] = vc_map['PATH']
-    os.environ['INCLUDE'] = vc_map['INCLUDE']
-    os.environ['LIB'] = vc_map['LIB']
+    for k in VC_KEYS:
+        os.environ[k] = vc_map[k]
+
+
+def environ() -> Dict[str, str]:
+    '''
+    a copy of os.environ with the vcvars64 variables. subprocess env=
+    '''
+    vc_map = vcvars64()
+    env = dict(os.environ)
+    for k in VC_KEYS:
+        env[k] = vc_map[k]
+    return env
 
 
 if platform.system() == 'Windows':